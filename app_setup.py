@@ -1,4 +1,5 @@
 import sys
+import threading
 from pathlib import Path
 from typing import Optional
 
@@ -19,6 +20,32 @@ for path in Paths.add_to_path:
     if this_path not in sys.path:
         sys.path.insert(0, this_path)
 
+_background_started = threading.Event()
+
+
+def start_background_services():
+    # once per process; the imports happen on the worker too, so boto3/openai never sit on a page's first render
+    if _background_started.is_set():
+        return
+    _background_started.set()
+    threading.Thread(target=_run_background_services, name="app-background", daemon=True).start()
+
+
+def _run_background_services():
+    from misc_shared.metrics import get_metrics_settings, metrics
+    from misc_shared.model_catalog import start_model_catalog
+    from misc_shared.storage import start_warm_up
+
+    try:
+        metrics.enabled = get_metrics_settings().enabled
+    except Exception:
+        logger.exception("Could not read metrics settings; leaving collection on")
+    start_warm_up()
+    start_model_catalog()
+
+
+start_background_services()
+
 
 def set_page_config(
     requires_auth: bool = False,
@@ -28,9 +55,8 @@ def set_page_config(
     initial_sidebar_state: InitialSideBarState = "auto",
     menu_items: Optional[MenuItems] = None,
     hide_default_streamlit_elements: bool = True,
+    with_authenticator: bool = False,
 ):
-    from misc_shared.auth_helpers import LoginRequired, create_authenticator
-
     st.set_page_config(page_title, page_icon, layout, initial_sidebar_state, menu_items)
 
     hide_streamlit_style = """
@@ -67,6 +93,12 @@ def set_page_config(
     if hide_default_streamlit_elements:
         st.markdown(hide_streamlit_style, unsafe_allow_html=True)
 
+    if not (requires_auth or with_authenticator):
+        # building the authenticator reads the auth db; public pages don't need it
+        return None
+
+    from misc_shared.auth_helpers import LoginRequired, create_authenticator
+
     authenticator = create_authenticator()
 
     if requires_auth:
@@ -0,0 +1,79 @@
+"""Micro-benchmark: cost of validating the same OAuth token on every Streamlit rerun.
+
+Compares the old path (``PyJWKClient.get_signing_key_from_jwt`` with its cached key set, then a full RS256
+verify per call) against ``validate_access_token`` with the verified-token memo. Runs offline against a locally
+generated key; no JWKS endpoint needed.
+
+    python benchmarks/oauth_validation.py
+"""
+
+import json
+import sys
+import time
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1] / "src"))
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from misc_shared.st_oauth import JwksCache, VerifiedTokenCache, validate_access_token
+
+KID = "bench-key"
+
+
+def make_token():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    token = jwt.encode(
+        {"sub": "bench-user", "email": "bench@example.com", "exp": int(time.time()) + 3600},
+        private_key,
+        algorithm="RS256",
+        headers={"kid": KID},
+    )
+    public_jwk = jwt.PyJWK(
+        {**json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key())), "kid": KID}, algorithm="RS256"
+    )
+    return token, public_jwk
+
+
+def legacy_client(public_jwk: jwt.PyJWK) -> jwt.PyJWKClient:
+    # the client st_oauth used to build, with the endpoint fetch answered locally; reruns hit its key set cache
+    client = jwt.PyJWKClient("https://bench.invalid/jwks")
+    jwk = {**json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(public_jwk.key)), "kid": KID}
+    client.fetch_data = lambda: {"keys": [jwk]}
+    return client
+
+
+def run(number: int = 2000) -> dict:
+    token, public_jwk = make_token()
+    jwks = JwksCache("https://bench.invalid/jwks", start=False)
+    jwks.set_keys({KID: public_jwk})
+    client = legacy_client(public_jwk)
+
+    def uncached():
+        key = client.get_signing_key_from_jwt(token)
+        jwt.decode(token, key.key, algorithms=["RS256"])
+
+    verified = VerifiedTokenCache()
+
+    def cached():
+        validate_access_token(token, jwks, verified, identity_field="email")
+
+    cached()  # first call pays for the verify, like the first rerun after login
+    results = {}
+    for name, fn in [("full_verify", uncached), ("memoized", cached)]:
+        best = min(timeit.repeat(fn, number=number, repeat=5))
+        results[name] = best / number * 1e6
+    return results
+
+
+def main():
+    results = run()
+    for name, usec in results.items():
+        print(f"{name:>12}: {usec:9.2f} us/rerun")
+    print(f"     speedup: {results['full_verify'] / results['memoized']:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Cold-start profile: import cost by package and first-render latency, per page.
+
+Each page runs in a fresh interpreter under ``python -X importtime`` and is rendered twice through Streamlit's
+``AppTest``, so the first render is what a new container pays and the second is a warm rerun. Pages that need
+AWS or auth still need the local services (``invoke setup-local-resources``) and a secrets.toml; render errors
+are reported rather than raised.
+
+    python benchmarks/startup_profile.py [--pages streamlit_app.py "pages/Fin Analysis.py"] [--top 12]
+                                         [--output startup_history.jsonl]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).parents[1]
+DEFAULT_PAGES = ["streamlit_app.py", *sorted(str(p.relative_to(REPO_ROOT)) for p in (REPO_ROOT / "pages").glob("*.py"))]
+
+
+def render_page(page: str) -> dict:
+    # runs in the child interpreter; everything the page imports lands in this process's importtime log
+    from streamlit.testing.v1 import AppTest
+
+    # `streamlit run streamlit_app.py` puts the repo root on sys.path, which is how pages find app_setup
+    sys.path.insert(0, str(REPO_ROOT))
+    app = AppTest.from_file(str(REPO_ROOT / page), default_timeout=120)
+    started = time.perf_counter()
+    app.run()
+    first_render = time.perf_counter() - started
+    started = time.perf_counter()
+    app.run()
+    rerun = time.perf_counter() - started
+    return {
+        "first_render_s": round(first_render, 4),
+        "rerun_s": round(rerun, 4),
+        "errors": [x.value for x in app.exception],
+    }
+
+
+def parse_importtime(stderr: str) -> Counter:
+    # "import time: self [us] | cumulative | imported package"; attribute self time to the top-level package
+    by_package = Counter()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        by_package[name.strip().split(".")[0]] += int(self_us) / 1e6
+    return by_package
+
+
+def profile_page(page: str) -> dict:
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", __file__, "--child", page],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    wall = time.perf_counter() - started
+    imports = parse_importtime(result.stderr)
+    try:
+        rendered = json.loads(result.stdout.strip().splitlines()[-1])
+    except (IndexError, json.JSONDecodeError):
+        rendered = {"first_render_s": None, "rerun_s": None, "errors": result.stderr.strip().splitlines()[-1:]}
+    return {
+        "page": page,
+        "process_s": round(wall, 4),
+        "import_s": round(sum(imports.values()), 4),
+        "imports_by_package": {name: round(seconds, 4) for name, seconds in imports.most_common()},
+        **rendered,
+    }
+
+
+def print_report(results: list[dict], top: int):
+    print(f"{'page':<28} {'process':>8} {'imports':>8} {'first':>8} {'rerun':>8}")
+    for r in results:
+        first = f"{r['first_render_s']:.3f}" if r["first_render_s"] is not None else "-"
+        rerun = f"{r['rerun_s']:.3f}" if r["rerun_s"] is not None else "-"
+        print(f"{r['page']:<28} {r['process_s']:>8.3f} {r['import_s']:>8.3f} {first:>8} {rerun:>8}")
+    for r in results:
+        print(f"\n{r['page']}: slowest imports")
+        for name, seconds in list(r["imports_by_package"].items())[:top]:
+            print(f"  {name:<32} {seconds:.3f}s")
+        for error in r["errors"]:
+            print(f"  render error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", nargs="*", default=DEFAULT_PAGES)
+    parser.add_argument("--top", type=int, default=12)
+    parser.add_argument("--output", help="append this run as one JSON line, for tracking over time")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(render_page(args.child)))
+        return
+
+    results = [profile_page(page) for page in args.pages]
+    print_report(results, args.top)
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps({"recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""Benchmark suite for the app's hot paths, run in-process against moto and a stub OpenAI stream.
+
+Covers auth db load/save, authenticator rebuild on rerun, session init/persist, resource create/get, S3 listing,
+token validation and chat streaming. Each case reports the best and median per-operation time over several
+repeats. A passing run is appended to a JSON history, and a case fails when it is more than ``--threshold``
+slower than the median of its recent history. Timings against moto measure our code and the number of calls
+it makes, not AWS latency, so only compare runs from the same machine.
+
+    python benchmarks/suite.py [--only auth,s3] [--repeat 5] [--threshold 0.25] [--no-save] [--force-save]
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable
+
+REPO_ROOT = Path(__file__).parents[1]
+sys.path.insert(0, str(REPO_ROOT / "src"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+for name, value in {
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "AWS_DEFAULT_REGION": "us-west-2",
+}.items():
+    os.environ.setdefault(name, value)
+
+import boto3  # noqa: E402
+import logzero  # noqa: E402
+import streamlit as st  # noqa: E402
+import yaml  # noqa: E402
+from cryptography.fernet import Fernet  # noqa: E402
+from logzero import logger  # noqa: E402
+from moto import mock_aws  # noqa: E402
+from oauth_validation import KID, make_token  # noqa: E402
+from pydantic import Field  # noqa: E402
+from simplesingletable import DynamoDBMemory  # noqa: E402
+from supersullytools.streamlit.sessions import MemorySessionManager, StreamlitSessionBase  # noqa: E402
+
+from misc_shared.auth_helpers import AuthSettings, PreparedCredentials, build_authenticator  # noqa: E402
+from misc_shared.auth_store import BlobCredentialStore  # noqa: E402
+from misc_shared.chat_context import ContextWindow, TokenCounter  # noqa: E402
+from misc_shared.llm_streaming import openai_text_chunks, stream_to_placeholder  # noqa: E402
+from misc_shared.memory_cache import CachedMemory  # noqa: E402
+from misc_shared.models import Example  # noqa: E402
+from misc_shared.session_store import DeltaSessionStore  # noqa: E402
+from misc_shared.st_oauth import JwksCache, VerifiedTokenCache, validate_access_token  # noqa: E402
+from misc_shared.storage import PrefixIndex, batch_create_resources, batch_get_resources  # noqa: E402
+
+logzero.loglevel(logging.WARNING)
+
+DEFAULT_HISTORY = Path(__file__).parent / "history.json"
+BUCKET = "bench-private"
+TABLE_SPEC = REPO_ROOT / "infra" / "dynamodb_tables" / "create-table.yaml"
+
+# name -> (operation, calls per timing)
+Cases = dict[str, tuple[Callable[[], object], int]]
+
+
+class BenchSession(StreamlitSessionBase):
+    messages: list = Field(default_factory=list)
+
+
+def make_memory() -> DynamoDBMemory:
+    spec = yaml.safe_load(TABLE_SPEC.read_text())
+    boto3.client("dynamodb").create_table(**spec)
+    return DynamoDBMemory(logger=logger, table_name=spec["TableName"])
+
+
+def install_query_params():
+    # there is no browser URL in-process; the session managers only need somewhere to read and write the params
+    params: dict = {}
+
+    def set_query_params(**kwargs):
+        params.clear()
+        params.update({k: v if isinstance(v, list) else [str(v)] for k, v in kwargs.items()})
+
+    st.experimental_get_query_params = lambda: {k: list(v) for k, v in params.items()}
+    st.experimental_set_query_params = set_query_params
+    return params
+
+
+def auth_cases() -> Cases:
+    client = boto3.client("s3")
+    client.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={"LocationConstraint": "us-west-2"})
+    data = {
+        "credentials": {
+            "usernames": {
+                f"user{i}": {"email": f"user{i}@example.com", "name": f"User {i}", "password": "$2b$12$" + "x" * 53}
+                for i in range(1000)
+            }
+        },
+        "cookie_name": "bench",
+        "key": "bench-key",
+        "cookie_expiry_days": 30,
+        "preauthorized": {"emails": []},
+    }
+    fernet = Fernet(Fernet.generate_key())
+
+    def new_store(revalidate_seconds=0.0):
+        return BlobCredentialStore(
+            client, BUCKET, fernet, parse=AuthSettings.model_validate, revalidate_seconds=revalidate_seconds
+        )
+
+    writer = new_store()
+    writer.save(data)
+    revalidating = new_store()
+    revalidating.load()
+    cached = new_store(revalidate_seconds=3600)
+    cached.load()
+
+    def save():
+        writer.save(data, base=writer.load())
+
+    # what every rerun of an authed page pays: per-version preparation is cached, so only the build repeats
+    many_users = AuthSettings.model_validate(
+        {
+            **data,
+            "credentials": {
+                "usernames": {
+                    f"user{i}": {"email": f"user{i}@example.com", "name": f"User {i}", "password": "x"}
+                    for i in range(3000)
+                }
+            },
+        }
+    )
+    prepared = PreparedCredentials.from_settings("bench", many_users)
+
+    return {
+        "auth.load_cold_1000_users": (lambda: new_store().load(), 5),
+        "auth.load_revalidate_304": (lambda: revalidating.load(force=True), 20),
+        "auth.load_cached": (lambda: cached.load(), 2000),
+        "auth.save_conditional": (save, 5),
+        "auth.prepare_version_3000_users": (lambda: PreparedCredentials.from_settings("bench", many_users), 5),
+        "auth.rerun_authenticator_3000_users": (lambda: build_authenticator(prepared), 200),
+    }
+
+
+def session_cases(memory: DynamoDBMemory) -> Cases:
+    install_query_params()
+    manager = MemorySessionManager(
+        memory=memory, model_type=BenchSession, logger=logger, enable_versioning=False, ttl_attribute_name="ttl"
+    )
+    session = manager.init_session(expiration=timedelta(hours=1))
+    session.messages = [{"role": "user", "content": "hello " * 40} for _ in range(200)]
+    manager.persist_session(session)
+
+    store = DeltaSessionStore(memory.dynamodb_table, BenchSession, append_only_fields=("messages",))
+    delta_session = BenchSession(messages=list(session.messages))
+    snapshot = store.save(delta_session)
+
+    def persist_turn():
+        nonlocal snapshot
+        delta_session.messages.append({"role": "assistant", "content": "reply " * 40})
+        snapshot = store.save(delta_session, snapshot)
+
+    def init_from_db():
+        # a new browser tab: nothing in session_state yet, only the session id in the URL
+        manager.clear_session_data()
+        manager.init_session(expiration=timedelta(hours=1))
+
+    return {
+        "session.init_rerun": (lambda: manager.init_session(expiration=timedelta(hours=1)), 200),
+        "session.init_from_db": (init_from_db, 10),
+        "session.persist_full_200_messages": (lambda: manager.persist_session(session), 5),
+        "session.persist_delta_turn": (persist_turn, 5),
+        "session.load_delta": (lambda: store.load(delta_session.session_id), 5),
+    }
+
+
+def resource_cases(memory: DynamoDBMemory) -> Cases:
+    cached = CachedMemory(memory)
+    example = memory.create_new(Example, {"name": "bench"})
+    cached.get_existing(example.resource_id, Example)
+    ids = [x.resource_id for x in batch_create_resources(memory, Example, [{"name": f"n{i}"} for i in range(100)])]
+    return {
+        "resources.create": (lambda: memory.create_new(Example, {"name": "bench"}), 20),
+        "resources.get": (lambda: memory.get_existing(example.resource_id, Example), 20),
+        "resources.get_cached": (lambda: cached.get_existing(example.resource_id, Example), 2000),
+        "resources.batch_get_100": (lambda: batch_get_resources(memory, Example, ids), 3),
+    }
+
+
+def s3_cases() -> Cases:
+    client = boto3.client("s3")
+    bucket = "bench-listing"
+    client.create_bucket(Bucket=bucket, CreateBucketConfiguration={"LocationConstraint": "us-west-2"})
+    for i in range(1000):
+        client.put_object(Bucket=bucket, Key=f"data/{i % 10}/object-{i:05d}.json", Body=b"{}")
+    uncached = PrefixIndex(client, ttl_seconds=0)
+    cached = PrefixIndex(client, ttl_seconds=3600)
+    cached.get_page(bucket, "data/0/", 0)
+    return {
+        "s3.list_page_200": (lambda: uncached.get_page(bucket, "data/", 0, delimiter=None), 5),
+        "s3.list_folders": (lambda: uncached.get_page(bucket, "data/", 0), 5),
+        "s3.list_page_cached": (lambda: cached.get_page(bucket, "data/0/", 0), 2000),
+    }
+
+
+def oauth_cases() -> Cases:
+    token, public_jwk = make_token()
+    jwks = JwksCache("https://bench.invalid/jwks", start=False)
+    jwks.set_keys({KID: public_jwk})
+    verified = VerifiedTokenCache()
+    validate_access_token(token, jwks, verified, identity_field="email")
+    return {
+        "oauth.validate_full": (
+            lambda: validate_access_token(token, jwks, VerifiedTokenCache(), identity_field="email"),
+            200,
+        ),
+        "oauth.validate_memoized": (lambda: validate_access_token(token, jwks, verified, identity_field="email"), 2000),
+    }
+
+
+class NullPlaceholder:
+    def markdown(self, text: str):
+        pass
+
+
+def stub_openai_stream(tokens: int = 2000):
+    # shaped like openai's ChatCompletionChunk objects, which is all openai_text_chunks looks at
+    for i in range(tokens):
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=f"tok{i} "))])
+
+
+def chat_cases() -> Cases:
+    counter = TokenCounter("gpt-3.5-turbo")
+    window = ContextWindow(counter, budget_tokens=4000)
+    history = [{"role": "system", "content": "be brief"}] + [
+        {"role": "user" if i % 2 else "assistant", "content": f"message {i} " * 30} for i in range(500)
+    ]
+    window.build(history)
+    return {
+        "chat.stream_render_2000_tokens": (
+            lambda: stream_to_placeholder(openai_text_chunks(stub_openai_stream()), NullPlaceholder()),
+            5,
+        ),
+        "chat.context_window_500_messages": (lambda: window.build(history), 50),
+    }
+
+
+GROUPS = {
+    "auth": lambda env: auth_cases(),
+    "session": lambda env: session_cases(env["memory"]),
+    "resources": lambda env: resource_cases(env["memory"]),
+    "s3": lambda env: s3_cases(),
+    "oauth": lambda env: oauth_cases(),
+    "chat": lambda env: chat_cases(),
+}
+
+
+def measure(fn: Callable[[], object], number: int, repeat: int) -> dict:
+    per_op = [t / number for t in timeit.repeat(fn, number=number, repeat=repeat)]
+    return {"best_s": min(per_op), "median_s": statistics.median(per_op), "number": number, "repeat": repeat}
+
+
+def run(groups: list[str], repeat: int) -> dict[str, dict]:
+    results = {}
+    with mock_aws():
+        env = {"memory": make_memory()} if {"session", "resources"} & set(groups) else {}
+        for group in groups:
+            for name, (fn, number) in GROUPS[group](env).items():
+                results[name] = measure(fn, number, repeat)
+                print(f"  {name:<38} {results[name]['best_s'] * 1e3:10.3f} ms", flush=True)
+    return results
+
+
+def load_history(path: Path) -> list[dict]:
+    return json.loads(path.read_text())["runs"] if path.exists() else []
+
+
+def find_regressions(results: dict, history: list[dict], threshold: float, window: int) -> dict[str, tuple]:
+    """Cases slower than the median of their last ``window`` recorded runs by more than ``threshold``."""
+    regressions = {}
+    for name, result in results.items():
+        previous = [run["results"][name]["best_s"] for run in history if name in run["results"]][-window:]
+        if not previous:
+            continue
+        baseline = statistics.median(previous)
+        if result["best_s"] > baseline * (1 + threshold):
+            regressions[name] = (baseline, result["best_s"])
+    return regressions
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", default="", help="comma separated groups: " + ",".join(GROUPS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown vs. history, 0.25 = 25%%")
+    parser.add_argument("--window", type=int, default=5, help="recent runs the baseline is taken from")
+    parser.add_argument("--history", type=Path, default=DEFAULT_HISTORY)
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--force-save", action="store_true", help="record this run even if it regressed")
+    args = parser.parse_args()
+
+    groups = [x.strip() for x in args.only.split(",") if x.strip()] or list(GROUPS)
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown group(s): {', '.join(sorted(unknown))}")
+
+    print(f"Running {', '.join(groups)}")
+    results = run(groups, args.repeat)
+    history = load_history(args.history)
+    regressions = find_regressions(results, history, args.threshold, args.window)
+    for name, (baseline, current) in regressions.items():
+        print(f"REGRESSION {name}: {current * 1e3:.3f} ms vs. baseline {baseline * 1e3:.3f} ms")
+
+    if not args.no_save and (not regressions or args.force_save):
+        history.append(
+            {
+                "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "git_revision": git_revision(),
+                "python": platform.python_version(),
+                "machine": platform.node(),
+                "results": results,
+            }
+        )
+        args.history.write_text(json.dumps({"runs": history}, indent=1))
+        print(f"Recorded run {len(history)} in {args.history}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,17 @@
 from datetime import timedelta
 
-import openai
 from logzero import logger
 from pydantic import Field
-from supersullytools.openai.chat_session import ChatSession
-from supersullytools.streamlit.sessions import MemorySessionManager, StreamlitSessionBase
-
-from app_setup import set_page_config, st
+from supersullytools.streamlit.sessions import StreamlitSessionBase
+
+from app_setup import get_current_username, set_page_config, st
+from misc_shared.chat_context import ContextWindow, get_summary_cache, get_token_counter, openai_summarizer
+from misc_shared.chat_search import get_chat_search_index
+from misc_shared.completion_cache import completion_cache_key, get_completion_cache, is_deterministic, replay_chunks
+from misc_shared.llm_streaming import openai_text_chunks, stream_to_placeholder
+from misc_shared.metrics import metrics
+from misc_shared.model_catalog import get_model_catalog
+from misc_shared.session_store import DeltaSessionManager
 from misc_shared.storage import get_memory
 
 set_page_config(requires_auth=True, page_title="Hello")
@@ -16,14 +21,45 @@ class ChatSessionData(StreamlitSessionBase):
     messages: list = Field(default_factory=list)
 
 
+def persist_chat(session_manager: DeltaSessionManager, session_data: ChatSessionData):
+    # index exactly what this save writes, off the script thread, so saved chats become searchable
+    unsaved_from = session_manager.unsaved_from(session_data, "messages")
+    session_manager.persist_session(session_data)
+    if search_index := get_chat_search_index():
+        search_index.add_messages_async(
+            get_current_username(),
+            session_data.session_id,
+            list(session_data.messages),
+            unsaved_from,
+            session_data.expires_at,
+        )
+
+
+def render_search(session_manager: DeltaSessionManager):
+    if not (search_index := get_chat_search_index()):
+        return
+    with st.expander("Search saved chats"):
+        query = st.text_input("Search", key="chat_search_query")
+        if not query:
+            return
+        hits = search_index.search(get_current_username(), query)
+        if not hits:
+            st.write("No matches")
+        param = session_manager.get_query_param_name()
+        for hit in hits:
+            st.markdown(f"**{hit.role}** · [open chat](?{param}={hit.session_id}) · score {hit.score:.2f}")
+            st.caption(hit.preview)
+
+
 def main():
     memory = get_memory()
-    session_manager = MemorySessionManager(
+    session_manager = DeltaSessionManager(
         memory=memory,
         model_type=ChatSessionData,
         logger=logger,
         enable_versioning=False,
         ttl_attribute_name="ttl",
+        append_only_fields=("messages",),
     )
 
     session_data: ChatSessionData = session_manager.init_session(expiration=timedelta(hours=1))
@@ -31,51 +67,83 @@ def main():
     prompt = st.chat_input("What is up?")
 
     if st.button("Save Chat Chession to DB"):
-        session_manager.persist_session(session_data)
+        persist_chat(session_manager, session_data)
+    render_search(session_manager)
 
     with st.expander("Chat Settings"):
+        catalog = get_model_catalog()
         input_cols = iter(st.columns(3))
         with next(input_cols):
-            models = get_gpt_models()
-            model = st.selectbox("model", models, models.index("gpt-3.5-turbo-1106"))
+            models = catalog.model_ids()
+            default_model = "gpt-3.5-turbo-1106"
+            model = st.selectbox("model", models, models.index(default_model) if default_model in models else 0)
         with next(input_cols):
             temperature = st.slider("temperature", 0.0, 1.0, 0.5, step=0.1)
         with next(input_cols):
             seed = st.number_input("seed", 0, value=None)
+        input_cols = iter(st.columns(3))
+        with next(input_cols):
+            context_window = catalog.context_window(model) or 4096
+            context_budget = st.number_input(
+                "context budget (tokens)", 500, context_window, value=min(4000, context_window), step=500
+            )
+        with next(input_cols):
+            summarize_history = st.toggle("summarize older turns", value=True)
 
     for message in session_data.messages:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
 
     if prompt:
+        # openai (via ChatSession) is the slowest import on this page; only pay for it once there's a prompt
+        from supersullytools.openai.chat_session import ChatSession
+
         chat_session = ChatSession(history=session_data.messages)
         chat_session.user_says(prompt)
         # session_data.messages.append({"role": "user", "content": prompt})
+        context = ContextWindow(
+            get_token_counter(model),
+            context_budget,
+            summarizer=openai_summarizer() if summarize_history else None,
+            summary_cache=get_summary_cache(),
+        )
+        request_messages = context.build(chat_session.history)
 
         with st.chat_message("user"):
             st.markdown(prompt)
 
         with st.chat_message("assistant"):
             message_placeholder = st.empty()
-            full_response = ""
-            for response in openai.chat.completions.create(
-                messages=chat_session.history,
-                model=model,
-                temperature=temperature,
-                stream=True,
-                seed=seed,
-            ):
-                full_response += response.choices[0].delta.content or ""
-                message_placeholder.markdown(full_response + "▌")
-            message_placeholder.markdown(full_response)
+            cache = get_completion_cache()
+            cache_key = None
+            if cache and is_deterministic(temperature, seed):
+                cache_key = completion_cache_key(model, request_messages, temperature, seed)
+            if cache_key and (cached := cache.get(cache_key)) is not None:
+                chunks = replay_chunks(cached)
+            else:
+                import openai
+
+                stream = openai.chat.completions.create(
+                    messages=request_messages,
+                    model=model,
+                    temperature=temperature,
+                    stream=True,
+                    seed=seed,
+                )
+                chunks = metrics.timed_stream("openai.chat_stream", openai_text_chunks(stream))
+            full_response = stream_to_placeholder(chunks, message_placeholder)
+            if cache_key and cached is None:
+                cache.put(cache_key, full_response, model=model)
+            if context.last_dropped:
+                st.caption(
+                    f"{context.last_request_tokens} prompt tokens; {context.last_dropped} older messages windowed out"
+                )
 
         chat_session.assistant_says(full_response)
         session_data.messages = chat_session.history
-
-
-@st.cache_data()
-def get_gpt_models():
-    return sorted(x.id for x in openai.models.list() if "gpt" in x.id)
+        if session_manager.is_persisted(session_data):
+            # saves only append the new turn, so keeping a saved chat in sync costs the same every turn
+            persist_chat(session_manager, session_data)
 
 
 if __name__ == "__main__":
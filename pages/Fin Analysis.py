@@ -1,70 +1,225 @@
-import pandas as pd
-import streamlit as st
-
-# import matplotlib.pyplot as plt
-
-# You would need to install and import any additional libraries required for API calls and data visualization.
-
-
-# Define a function to retrieve stock data (you'll need to replace this with actual API calls)
-def get_stock_data(symbol):
-    # Placeholder for API call to get stock data
-    # Replace this with actual code to retrieve data
-    data = pd.DataFrame({"Close": ["123", "321"]})  # Replace with actual data retrieval
-    return data
-
-
-# Define a function to calculate financial ratios
-def calculate_financial_ratios(data):
-    # Placeholder for financial ratio calculation
-    # Replace this with actual financial calculations
-    ratios = {}  # Replace with actual calculations
-    return ratios
-
-
-# Define a function to perform valuation
-def perform_valuation(data, assumptions):
-    # Placeholder for valuation model
-    # Replace this with actual valuation calculation
-    valuation = {}  # Replace with actual valuation
-    return valuation
+import io
+import os
+from pathlib import Path
+from typing import Optional
 
+import numpy as np
+import pandas as pd
 
-# Streamlit app layout
-st.title("Stock Analysis and Valuation App")
-
-# Input section
-symbol = st.text_input("Enter Stock Symbol", "AAPL")
-
-# Data retrieval
-if st.button("Retrieve Data"):
-    stock_data = get_stock_data(symbol)
-    st.write("Historical Stock Data", stock_data)
-
-    # Data visualization
-    st.line_chart(stock_data["Close"])
-
-    # Financial analysis
-    financial_ratios = calculate_financial_ratios(stock_data)
-    st.write("Financial Ratios", financial_ratios)
-
-    # Valuation models
-    # You could add input fields for users to enter their own assumptions
-    user_assumptions = {
-        "discount_rate": st.number_input("Discount Rate", value=0.10),
-        "growth_rate": st.number_input("Growth Rate", value=0.04),
+from app_setup import set_page_config, st
+from misc_shared.fin_analytics import (
+    drawdowns,
+    load_prices,
+    prepare_fundamentals,
+    price_chart,
+    read_price_file,
+    summarize,
+    valuation_table,
+)
+from misc_shared.price_store import get_price_store
+
+set_page_config(page_title="Stock Analysis", layout="wide")
+
+PRICE_SUFFIXES = (".csv", ".parquet", ".pq")
+
+
+@st.cache_data(show_spinner="Loading prices...")
+def load_uploaded_prices(files: tuple[tuple[str, bytes], ...]) -> pd.DataFrame:
+    return load_prices(read_price_file(io.BytesIO(data), name) for name, data in files)
+
+
+@st.cache_data(show_spinner="Loading prices...")
+def load_directory_prices(directory: str) -> pd.DataFrame:
+    return load_prices(sorted(p for p in Path(directory).expanduser().iterdir() if p.suffix.lower() in PRICE_SUFFIXES))
+
+
+@st.cache_data(show_spinner="Reading the local store...")
+def load_store_prices(symbols: tuple[str, ...], start, end) -> pd.DataFrame:
+    store = get_price_store()
+    return store.read_many(symbols or store.symbols(), start, end)
+
+
+@st.cache_data
+def get_summary(prices: pd.DataFrame) -> pd.DataFrame:
+    return summarize(prices)
+
+
+def render_file_source() -> Optional[pd.DataFrame]:
+    source_cols = iter(st.columns(2))
+    with next(source_cols):
+        uploads = st.file_uploader("Price files (CSV or Parquet)", type=["csv", "parquet"], accept_multiple_files=True)
+    with next(source_cols):
+        directory = st.text_input("...or a local directory of price files")
+
+    if uploads:
+        return load_uploaded_prices(tuple((x.name, x.getvalue()) for x in uploads))
+    if directory and Path(directory).expanduser().is_dir():
+        return load_directory_prices(directory)
+    st.info("Load long (date, symbol, close) or wide (date plus one column per symbol) price files to begin.")
+
+
+def main():
+    st.title("Stock Analysis and Valuation App")
+
+    store = get_price_store()
+    source = st.radio("Prices from", ["Local store", "Files"], horizontal=True)
+    if source == "Files":
+        prices = render_file_source()
+        if prices is None:
+            return
+        if st.button(f"Add {prices.shape[1]:,} symbols to the local store"):
+            written = store.append_wide(prices)
+            load_store_prices.clear()
+            st.success(f"Wrote {written:,} partition file(s) to {store.root}")
+    else:
+        if not store.symbols():
+            st.info("The local store is empty; load price files and add them to it.")
+            return
+        coverage = store.coverage_frame()
+        input_cols = iter(st.columns([2, 1, 1]))
+        with next(input_cols):
+            symbols = st.multiselect("Symbols (all when empty)", coverage.index)
+        with next(input_cols):
+            start = st.date_input("From", pd.Timestamp(coverage["last"].max()) - pd.DateOffset(years=1))
+        with next(input_cols):
+            end = st.date_input("To", pd.Timestamp(coverage["last"].max()))
+        prices = load_store_prices(tuple(symbols), start, end)
+    if prices.empty:
+        st.warning("No prices found")
+        return
+
+    summary = get_summary(prices)
+    st.subheader(f"Screen: {len(summary):,} symbols, {prices.index.min():%Y-%m-%d} to {prices.index.max():%Y-%m-%d}")
+    st.dataframe(summary.sort_values("sharpe", ascending=False), use_container_width=True)
+
+    symbol = st.selectbox("Symbol", summary.index)
+    chart = price_chart(prices, symbol, (50, 200))
+    st.line_chart(chart)
+    st.area_chart(drawdowns(chart[["close"]]).rename(columns={"close": "drawdown"}))
+
+    st.subheader("Valuation")
+    fundamentals_file = st.file_uploader(
+        "Fundamentals CSV (symbol, free_cash_flow, shares_outstanding, optional net_debt)", type=["csv"]
+    )
+    input_cols = iter(st.columns(4))
+    with next(input_cols):
+        discount_rate = st.number_input("Discount Rate", value=0.10)
+    with next(input_cols):
+        growth_rate = st.number_input("Growth Rate", value=0.04)
+    with next(input_cols):
+        terminal_growth = st.number_input("Terminal Growth", value=0.02)
+    with next(input_cols):
+        years = st.number_input("Years", 1, 30, value=10)
+    if fundamentals_file:
+        fundamentals = prepare_fundamentals(pd.read_csv(fundamentals_file))
+        valuation = valuation_table(
+            fundamentals,
+            discount_rate,
+            growth_rate,
+            terminal_growth,
+            years,
+            last_close=summary["last_close"],
+        )
+        st.dataframe(valuation.sort_values("upside", ascending=False), use_container_width=True)
+        render_scenarios(fundamentals, summary["last_close"], discount_rate, growth_rate, terminal_growth, years)
+
+
+def scenario_job(context, ranges: dict, count: int, method: str, years: int) -> dict:
+    from misc_shared.scenarios import (
+        DEFAULT_PERCENTILES,
+        ScenarioRanges,
+        assumption_importance,
+        dcf_multipliers,
+        draw_scenarios,
+        multiplier_percentiles,
+    )
+
+    context.report(0, message=f"Drawing {count:,} scenarios")
+    draws = draw_scenarios(ScenarioRanges(**ranges), count, method, seed=0)
+    multipliers = dcf_multipliers(
+        draws,
+        years,
+        processes=os.cpu_count() if count >= 5_000_000 else None,
+        progress=lambda done, total: context.report(done, total, f"Valued {done} of {total} chunk(s)"),
+    )
+    quantiles, valid_share = multiplier_percentiles(multipliers, DEFAULT_PERCENTILES)
+    return {
+        "percentiles": list(DEFAULT_PERCENTILES),
+        "quantiles": quantiles.tolist(),
+        "valid_share": valid_share,
+        "importance": assumption_importance(draws, multipliers).to_dict(),
     }
-    valuation = perform_valuation(stock_data, user_assumptions)
-    st.write("Valuation", valuation)
-
-# Output section
-# You would display the results of the valuation here
-
-# Additional features
-# Add a news feed related to the stock symbol
-# Compare the stock with its industry peers
 
-# Deployment
-# Once developed, you can deploy the app using Streamlit sharing, Heroku, or other platforms
 
-# To run the app, use the command `streamlit run your_script.py`
+def render_scenarios(
+    fundamentals: pd.DataFrame,
+    last_close: pd.Series,
+    discount_rate: float,
+    growth_rate: float,
+    terminal_growth: float,
+    years: int,
+):
+    # scipy (and boto3, for the job records) are slow to import and only this section needs them
+    from misc_shared.jobs import get_job_runner, job_key, render_job
+    from misc_shared.scenarios import bands_from_percentiles, clamped_range, sensitivity_table
+
+    st.subheader("Scenarios")
+    input_cols = iter(st.columns(3))
+    with next(input_cols):
+        discount_range = st.slider("Discount rate range", 0.0, 0.30, clamped_range(discount_rate, 0.02, 0.0, 0.30))
+    with next(input_cols):
+        growth_range = st.slider("Growth rate range", -0.10, 0.20, clamped_range(growth_rate, 0.03, -0.10, 0.20))
+    with next(input_cols):
+        terminal_range = st.slider(
+            "Terminal growth range", -0.02, 0.06, clamped_range(terminal_growth, 0.01, -0.02, 0.06)
+        )
+
+    symbol = st.selectbox("Sensitivity for", fundamentals.index)
+    row = fundamentals.loc[symbol]
+    st.dataframe(
+        sensitivity_table(
+            np.linspace(*discount_range, 9),
+            np.linspace(*growth_range, 7),
+            terminal_growth,
+            years,
+            free_cash_flow=row["free_cash_flow"],
+            net_debt=row.get("net_debt", 0.0) if pd.notna(row.get("net_debt", 0.0)) else 0.0,
+            shares_outstanding=row["shares_outstanding"],
+        ).style.format("{:,.2f}"),
+        use_container_width=True,
+    )
+
+    input_cols = iter(st.columns(2))
+    with next(input_cols):
+        count = st.select_slider("Draws", [10_000, 100_000, 1_000_000, 10_000_000], value=1_000_000)
+    with next(input_cols):
+        method = st.selectbox("Sampling", ["latin_hypercube", "sobol", "random"])
+
+    def render_result(result: dict):
+        bands = bands_from_percentiles(fundamentals, result["quantiles"], result["valid_share"], result["percentiles"])
+        bands["last_close"] = last_close.reindex(bands.index)
+        st.dataframe(bands, use_container_width=True)
+        st.write(
+            "Assumption importance (rank correlation with value)", pd.Series(result["importance"], name="spearman")
+        )
+
+    # runs in the background keyed on the inputs; a refresh or another session with the same inputs picks it up, so
+    # a run is only ever stopped from render_job's Cancel button, never because one session's inputs moved on
+    params = dict(
+        ranges=dict(discount_rate=discount_range, growth_rate=growth_range, terminal_growth=terminal_range),
+        count=count,
+        method=method,
+        years=int(years),
+    )
+    runner = get_job_runner()
+    job_id = job_key("fin.scenarios", params)
+    snapshot = runner.poll(job_id)
+    running = snapshot is not None and not snapshot.finished
+    label = "Retry scenarios" if snapshot and snapshot.status in ("failed", "cancelled") else "Run scenarios"
+    if st.button(label, disabled=running):
+        runner.submit("fin.scenarios", scenario_job, params)
+    render_job(runner, job_id, render_result)
+
+
+if __name__ == "__main__":
+    main()
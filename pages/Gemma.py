@@ -1,16 +1,19 @@
 import json
 from datetime import timedelta
 
-import openai
 from logzero import logger
 from streamlit_option_menu import option_menu
 from supersullytools.streamlit.sessions import MemorySessionManager, StreamlitSessionBase
 
 from app_setup import set_page_config, st
+from misc_shared.jobs import fit_result, get_job_runner, job_key, render_job
 from misc_shared.storage import get_memory
+from misc_shared.table_query import DEFAULT_PROJECTION, iter_table_pages
 
 set_page_config(requires_auth=True, page_title="Hello")
 
+PREVIEW_ROWS = 100
+
 
 class GemmaPageSettings(StreamlitSessionBase):
     some_setting: str = "test"
@@ -51,11 +54,6 @@ def main():
             raise ValueError(f"Unknown option selected {selected=}")
 
 
-@st.cache_data()
-def get_gpt_models():
-    return sorted(x.id for x in openai.models.list() if "gpt" in x.id)
-
-
 def render_chat(session: GemmaPageSettings):
     pass
 
@@ -86,13 +84,60 @@ def render_debug(session: GemmaPageSettings, memory, session_manager):
 
     st.subheader("Memory Stats")
     st.code(memory.get_stats().model_dump_json(indent=2))
+    if hasattr(memory, "get_cache_stats"):
+        cache_stats = memory.get_cache_stats()
+        st.write(f"Cache hit rate {cache_stats.hit_rate:.1%}")
+        st.code(cache_stats.model_dump_json(indent=2))
 
     st.subheader("Streamlit session state")
     st.code(json.dumps(st.session_state.to_dict(), indent=2, default=str))
 
+    st.subheader("Table Browser")
+    filter_cols = iter(st.columns(3))
+    with next(filter_cols):
+        type_name = st.text_input("Resource type (gsitype)")
+    with next(filter_cols):
+        index_name = st.selectbox("Index", [None, "gsi1", "gsi2", "gsi3"])
+    with next(filter_cols):
+        key_value = st.text_input("Index partition key", disabled=not index_name)
+    projection = st.multiselect(
+        "Attributes",
+        DEFAULT_PROJECTION + ["resource_id", "created_at", "gsi1pk", "gsi2pk", "gsi3pk", "ttl"],
+        DEFAULT_PROJECTION,
+    )
+    max_items = st.number_input("Max items", 1, value=1000, step=500)
+    params = dict(
+        type_name=type_name or None,
+        index_name=index_name,
+        key_value=key_value or None,
+        projection=projection or None,
+        max_items=int(max_items),
+    )
+    runner = get_job_runner()
     if st.button("Scan Table"):
-        items = memory.dynamodb_table.scan().get("Items")
-        st.write(list(items))
+        runner.submit("gemma.scan_table", scan_table_job, params)
+    render_job(
+        runner,
+        job_key("gemma.scan_table", params),
+        lambda rows: st.dataframe(rows, use_container_width=True),
+    )
+
+
+def scan_table_job(context, max_items: int, **query) -> list[dict]:
+    rows = []
+    pages = iter_table_pages(get_memory().dynamodb_table, **query)
+    for page in pages:
+        rows.extend(page)
+        if len(rows) >= max_items:
+            pages.close()
+            break
+        # a fixed-size copy: the list keeps growing here while pollers render and store the preview
+        preview = fit_result(rows[:PREVIEW_ROWS])
+        context.report(len(rows), max_items, f"Loaded {len(rows)} item(s)...", partial=preview)
+    result = fit_result(rows[:max_items])
+    if len(result) < min(len(rows), max_items):
+        logger.warning(f"Table scan kept {len(result)} of {min(len(rows), max_items)} item(s) to fit the job record")
+    return result
 
 
 if __name__ == "__main__":
@@ -1,36 +1,90 @@
 from app_setup import set_page_config, st
+from misc_shared.jobs import MAX_RESULT_BYTES, fit_result, get_job_runner, job_key, render_job
 from misc_shared.models import Example
-from misc_shared.storage import get_memory, get_s3_client
+from misc_shared.storage import (
+    batch_create_resources,
+    batch_get_resources,
+    get_memory,
+    get_prefix_index,
+    get_s3_client,
+    iter_objects,
+)
 
 set_page_config(requires_auth=True, page_title="Hello")
 
-client = get_s3_client()
-# st.write(client.list_objects_v2(Bucket=st.secrets.app.private_bucket))
-
-st.subheader("Public")
-st.write(
-    "\n".join(
-        [
-            f'* {x["Key"]}'
-            for x in client.list_objects_v2(Bucket=st.secrets.app.public_bucket).get("Contents", [{"Key": "None"}])
-        ],
-    )
-)
+buckets = {"Public": st.secrets.app.public_bucket, "Private": st.secrets.app.private_bucket}
+prefix_index = get_prefix_index()
 
-st.subheader("Private")
-st.write(
-    "\n".join(
-        [
-            f'* {x["Key"]}'
-            for x in client.list_objects_v2(Bucket=st.secrets.app.private_bucket).get("Contents", [{"Key": "None"}])
-        ],
-    )
-)
+
+def set_prefix(prefix: str):
+    st.session_state["hello_prefix"] = prefix
+
+
+def full_listing_job(context, buckets: dict, prefix: str, max_keys: int = 1000) -> dict:
+    # walks every key under the prefix; only the first ``max_keys`` per bucket are kept for display
+    client = get_s3_client()
+    totals = {}
+    objects = []
+    for label, bucket in buckets.items():
+        count = size = 0
+        for obj in iter_objects(client, bucket, prefix):
+            count += 1
+            size += obj.size
+            if count <= max_keys:
+                objects.append({"bucket": label, **obj.model_dump()})
+            if count % 1000 == 0:
+                context.report(sum(x["objects"] for x in totals.values()) + count, message=f"{label}: {count:,} keys")
+        totals[label] = {"objects": count, "bytes": size}
+    # leave room in the job record for the totals
+    return {"totals": totals, "objects": fit_result(objects, MAX_RESULT_BYTES - 10_000)}
+
+
+def render_full_listing(result: dict):
+    st.dataframe(result["totals"], use_container_width=True)
+    st.dataframe(result["objects"], use_container_width=True)
+
+
+prefix = st.text_input("Prefix", key="hello_prefix")
+if st.button("Refresh listing"):
+    prefix_index.invalidate()
+first_pages = prefix_index.get_first_pages(list(buckets.values()), prefix)
+
+for label, bucket in buckets.items():
+    st.subheader(label)
+    page_key = f"hello-page|{bucket}|{prefix}"
+    page_number = st.session_state.get(page_key, 0)
+    page = prefix_index.get_page(bucket, prefix, page_number, clamp=True) if page_number else first_pages[bucket]
+    # the listing may have shrunk since the page number was stored
+    page_number = st.session_state[page_key] = page.page_number
+    for common_prefix in page.common_prefixes:
+        st.button(f"📁 {common_prefix}", key=f"{bucket}-{common_prefix}", on_click=set_prefix, args=(common_prefix,))
+    st.write("\n".join([f"* {x.key}" for x in page.objects] or ["* None"]))
+    nav_cols = iter(st.columns(3))
+    with next(nav_cols):
+        if page_number and st.button("Previous", key=f"{bucket}-prev"):
+            st.session_state[page_key] = page_number - 1
+            st.rerun()
+    with next(nav_cols):
+        st.caption(f"Page {page_number + 1}")
+    with next(nav_cols):
+        if page.has_next and st.button("Next", key=f"{bucket}-next"):
+            st.session_state[page_key] = page_number + 1
+            st.rerun()
 
 memory = get_memory()
 
-resource = memory.get_existing("demo-resource", Example)
-if not resource:
-    resource = memory.create_new(Example, {"name": "Test"}, override_id="demo-resource")
+demo_ids = ["demo-resource"]
+resources = batch_get_resources(memory, Example, demo_ids)
+if missing := [x for x in demo_ids if x not in resources]:
+    created = batch_create_resources(memory, Example, [{"name": "Test"}] * len(missing), override_ids=missing)
+    resources.update({x.resource_id: x for x in created})
+
+for resource in resources.values():
+    st.code(resource.model_dump_json(indent=2))
 
-st.code(resource.model_dump_json(indent=2))
+st.subheader(f"Everything under '{prefix or '/'}'")
+listing_params = dict(buckets=buckets, prefix=prefix)
+runner = get_job_runner()
+if st.button("List all keys"):
+    runner.submit("hello.full_listing", full_listing_job, listing_params)
+render_job(runner, job_key("hello.full_listing", listing_params), render_full_listing)
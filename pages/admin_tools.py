@@ -1,14 +1,32 @@
 from app_setup import set_page_config, st
-from misc_shared.auth_helpers import load_auth_config
-from misc_shared.storage import get_s3_client
+from misc_shared.auth_helpers import get_credential_store, get_sharded_store
+from misc_shared.metrics import get_metrics_settings, metrics, summaries_frame
+from misc_shared.password_verify import get_password_verifier
 
 authenticator = set_page_config(requires_auth=True, page_title="Hello")
 
-client = get_s3_client()
-
 st.write(authenticator)
 
 if st.button("Wipe Auth"):
-    client.delete_object(Bucket=st.secrets.app.private_bucket, Key="app_data/credentials.json.enc")
+    get_credential_store().delete()
     authenticator.credentials = {"usernames": {}}
-    load_auth_config.clear()
+
+if st.button("Migrate Auth DB to per-user records"):
+    migrated = get_sharded_store().migrate_from_blob(get_credential_store())
+    st.info(f"Migrated {migrated} user(s); set app.auth_backend = 'sharded' in secrets to switch over")
+
+st.subheader("Metrics")
+metrics_settings = get_metrics_settings()
+metrics.enabled = st.toggle("Collect metrics", value=metrics.enabled)
+st.caption(f"Collecting since {metrics.started_at:%Y-%m-%d %H:%M:%S} UTC")
+st.dataframe(summaries_frame(), use_container_width=True)
+st.caption("Password verification")
+st.json(get_password_verifier().status().model_dump())
+metric_cols = iter(st.columns(2))
+with next(metric_cols):
+    if st.button(f"Export to {metrics_settings.export_path}"):
+        st.success(f"Appended a snapshot to {metrics.export(metrics_settings.export_path)}")
+with next(metric_cols):
+    if st.button("Reset metrics"):
+        metrics.reset()
+        st.rerun()
@@ -1,6 +1,7 @@
-import json
-from datetime import timedelta
-from typing import Dict, Literal
+import copy
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, Literal, Mapping, Optional
 from uuid import uuid4
 
 import streamlit as st
@@ -9,7 +10,16 @@ from logzero import logger
 from pydantic import BaseModel
 from streamlit_authenticator.authenticate import Authenticate
 
-from misc_shared.storage import get_s3_client
+from misc_shared.auth_store import (
+    AUTH_DB_KEY,
+    BlobCredentialStore,
+    ShardedCredentialStore,
+    SnapshotUserMap,
+    StoreSnapshot,
+    UserMap,
+)
+from misc_shared.metrics import metrics
+from misc_shared.storage import get_memory, get_s3_client
 
 
 class AuthUser(BaseModel):
@@ -26,36 +36,91 @@ class AuthSettings(BaseModel):
     preauthorized: dict
 
 
+class AppAuthenticate(Authenticate):
+    # the auth db version this authenticator's credentials were built from; writes are conditional on it
+    auth_db_base: Optional[StoreSnapshot] = None
+
+    def _check_pw(self) -> bool:
+        # bcrypt runs in the verifier's process pool; the script thread only waits on the result
+        from misc_shared.password_verify import VerificationUnavailable, client_ip, get_password_verifier
+
+        hashed = self.credentials["usernames"][self.username]["password"]
+        try:
+            return get_password_verifier().verify(self.username, self.password, hashed, ip=client_ip())
+        except VerificationUnavailable as e:
+            # the base class swallows exceptions from here and leaves the login form up; say why first
+            st.error(str(e))
+            raise
+
+    def _check_credentials(self, inplace: bool = True) -> bool:
+        if self.username not in self.credentials["usernames"]:
+            # the base class turns unknown usernames away before _check_pw; count them against the client too, or
+            # stuffing with made-up usernames would never be throttled
+            from misc_shared.password_verify import VerificationUnavailable, client_ip, get_password_verifier
+
+            try:
+                get_password_verifier().reject_unknown_user(self.username, ip=client_ip())
+            except VerificationUnavailable as e:
+                st.error(str(e))
+        return super()._check_credentials(inplace)
+
+
+@dataclass(frozen=True)
+class PreparedCredentials:
+    """Auth settings for one auth db version, processed once and shared read-only by every session."""
+
+    version: Optional[str]
+    usernames: Mapping[str, dict]
+    cookie_name: str
+    key: str
+    cookie_expiry_days: int
+    preauthorized: dict
+
+    @classmethod
+    def from_settings(cls, version: Optional[str], settings: AuthSettings) -> "PreparedCredentials":
+        dumped = settings.model_dump()
+        return cls(
+            version=version,
+            usernames=MappingProxyType({k.lower(): v for k, v in dumped["credentials"]["usernames"].items()}),
+            cookie_name=dumped["cookie_name"],
+            key=dumped["key"],
+            cookie_expiry_days=dumped["cookie_expiry_days"],
+            preauthorized=dumped["preauthorized"],
+        )
+
+
+@metrics.timed("auth.save_db")
 def save_auth_db(authenticate: Authenticate):
     logger.info("Saving change to Auth DB")
+    users = authenticate.credentials["usernames"]
+    credentials = authenticate.credentials
+    if isinstance(users, SnapshotUserMap):
+        credentials = {**credentials, "usernames": users.to_dict()}
+    elif isinstance(users, UserMap):
+        store = get_sharded_store()
+        upserts, _ = users.changes()
+        registered = {user.get("email") for username, user in upserts.items() if users.original(username) is None}
+        store.apply(users)
+        if registered:
+            # registration consumes the preauthorized email, which lives on the shared settings record
+            store.remove_preauthorized(registered)
+        return
     credentials_data = {
-        "credentials": authenticate.credentials,
+        "credentials": credentials,
         "cookie_name": authenticate.cookie_name,
         "key": authenticate.key,
         "cookie_expiry_days": authenticate.cookie_expiry_days,
         "preauthorized": authenticate.preauthorized,
     }
-    # dump, encrypt, put to s3
-    dumped = json.dumps(credentials_data)
-    encrypted = fernet().encrypt(dumped.encode())
-
-    get_s3_client().put_object(
-        Bucket=st.secrets.app.private_bucket, Key="app_data/credentials.json.enc", Body=encrypted
-    )
-    load_auth_config.clear()
+    # write through: this process picks up the new version directly instead of clearing the cache for everyone
+    snapshot = get_credential_store().save(credentials_data, base=getattr(authenticate, "auth_db_base", None))
+    if isinstance(authenticate, AppAuthenticate):
+        authenticate.auth_db_base = snapshot
 
 
+@metrics.timed("auth.read_db")
 def read_auth_db() -> dict:
-    client = get_s3_client()
-    try:
-        response = client.get_object(Bucket=st.secrets.app.private_bucket, Key="app_data/credentials.json.enc")
-    except client.exceptions.NoSuchKey:
-        logger.warning("Failed loading auth db from remote storage; may not exist")
-        return {}
-    decrypted = fernet().decrypt(response["Body"].read())
-    loaded = json.loads(decrypted.decode())
-    logger.info("Auth DB loaded from remote storage")
-    return loaded
+    return dict(get_credential_store().load().data)
 
 
 @st.cache_resource()
@@ -63,10 +128,41 @@ def fernet() -> Fernet:
     return Fernet(st.secrets.app.secret_enc_key)
 
 
-@st.cache_resource(ttl=timedelta(minutes=5))
-def load_auth_config() -> AuthSettings:
-    credentials_data = read_auth_db()
+@st.cache_resource()
+def get_credential_store() -> BlobCredentialStore:
+    return BlobCredentialStore(
+        client=get_s3_client(),
+        bucket=st.secrets.app.private_bucket,
+        fernet=fernet(),
+        key=AUTH_DB_KEY,
+        parse=parse_auth_settings,
+        revalidate_seconds=float(st.secrets.app.get("auth_revalidate_seconds", 30)),
+    )
+
+
+@st.cache_resource()
+def get_sharded_store() -> ShardedCredentialStore:
+    return ShardedCredentialStore(memory=get_memory(), fernet=fernet(), fallback=get_credential_store())
+
+
+def use_sharded_auth() -> bool:
+    return st.secrets.app.get("auth_backend", "blob") == "sharded"
+
 
+def load_auth_config() -> AuthSettings:
+    if not use_sharded_auth():
+        return get_credential_store().load().value
+    store = get_sharded_store()
+    settings = store.load_settings()
+    if settings is None:
+        blob_settings = {k: v for k, v in get_credential_store().load().data.items() if k != "credentials"}
+        settings = blob_settings or parse_auth_settings({}).model_dump(exclude={"credentials"})
+        store.save_settings(settings)
+    # users are fetched one at a time through UserMap; the settings object never carries them
+    return parse_auth_settings({"credentials": {"usernames": {}}, **settings})
+
+
+def parse_auth_settings(credentials_data: dict) -> AuthSettings:
     if not credentials_data.get("credentials"):
         logger.warning("No auth database present; loading default authorization data")
         auth_settings = AuthSettings.model_validate(
@@ -79,11 +175,6 @@ def load_auth_config() -> AuthSettings:
             }
         )
         logger.info("pre-authed users:" + ", ".join(auth_settings.preauthorized["emails"]))
-        credentials_data["credentials"] = auth_settings.credentials
-        credentials_data["cookie_name"] = auth_settings.cookie_name
-        credentials_data["key"] = auth_settings.key
-        credentials_data["cookie_expiry_days"] = auth_settings.cookie_expiry_days
-        credentials_data["preauthorized"] = auth_settings.preauthorized
     else:
         logger.debug("Loading auth database")
         auth_settings = AuthSettings.model_validate(
@@ -99,19 +190,47 @@ def load_auth_config() -> AuthSettings:
     return auth_settings
 
 
+@st.cache_resource(max_entries=2)
+def get_prepared_credentials(version: Optional[str], loaded_at: float, _settings: AuthSettings) -> PreparedCredentials:
+    # keyed on the store version (loaded_at tells apart successive "no auth db yet" snapshots); reruns reuse it
+    return PreparedCredentials.from_settings(version, _settings)
+
+
+def build_authenticator(prepared: PreparedCredentials) -> AppAuthenticate:
+    # the constructor re-keys every user; give it an empty map and attach the shared users afterwards, so a rerun
+    # only pays for this session's cookie manager and the few users it actually looks up
+    authenticator = AppAuthenticate(
+        {"usernames": {}},
+        prepared.cookie_name,
+        prepared.key,
+        prepared.cookie_expiry_days,
+        copy.deepcopy(prepared.preauthorized),
+    )
+    authenticator.credentials["usernames"] = SnapshotUserMap(prepared.usernames)
+    return authenticator
+
+
+@metrics.timed("auth.create_authenticator")
 def create_authenticator():
     for key in ["authentication_status", "name", "username", "logout", "init"]:
         if key not in st.session_state:
             st.session_state[key] = None
-    config = load_auth_config()
-    dumped = config.model_dump()
-    return Authenticate(
-        dumped["credentials"],
-        dumped["cookie_name"],
-        dumped["key"],
-        dumped["cookie_expiry_days"],
-        dumped["preauthorized"],
-    )
+    if use_sharded_auth():
+        dumped = load_auth_config().model_dump()
+        authenticator = AppAuthenticate(
+            dumped["credentials"],
+            dumped["cookie_name"],
+            dumped["key"],
+            dumped["cookie_expiry_days"],
+            dumped["preauthorized"],
+        )
+        store = get_sharded_store()
+        authenticator.credentials["usernames"] = UserMap(store.get_user, list_users=store.list_users)
+        return authenticator
+    snapshot = get_credential_store().load()
+    authenticator = build_authenticator(get_prepared_credentials(snapshot.version, snapshot.loaded_at, snapshot.value))
+    authenticator.auth_db_base = snapshot
+    return authenticator
 
 
 class LoginRequired(RuntimeError):
@@ -0,0 +1,522 @@
+import json
+import random
+import threading
+import time
+from collections.abc import MutableMapping
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, Mapping, Optional, Set, Tuple
+
+from botocore.exceptions import ClientError
+from cryptography.fernet import Fernet
+from logzero import logger
+from simplesingletable import DynamoDBMemory, exhaust_pagination
+
+from misc_shared.memory_cache import CachedMemory
+from misc_shared.models import AuthMetaRecord, AuthUserRecord
+from misc_shared.utils import backoff_sleep
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3 import S3Client
+
+AUTH_DB_KEY = "app_data/credentials.json.enc"
+AUTH_META_ID = "settings"
+
+
+@dataclass(frozen=True)
+class StoreSnapshot:
+    # version is the S3 ETag of the object the data was read from; None when the object does not exist
+    version: Optional[str]
+    data: dict
+    value: Any = None
+    loaded_at: float = field(default_factory=time.monotonic)
+
+
+def _error_code(e: ClientError) -> str:
+    return str(e.response.get("Error", {}).get("Code", ""))
+
+
+def _status_code(e: ClientError) -> int:
+    return int(e.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0))
+
+
+def _is_conflict(e: ClientError) -> bool:
+    return _status_code(e) in (409, 412) or _error_code(e) in (
+        "PreconditionFailed",
+        "ConditionalRequestConflict",
+        "ConditionalCheckFailedException",
+    )
+
+
+class WriteConflict(RuntimeError):
+    pass
+
+
+def merge_user(base: Optional[dict], local: dict, remote: Optional[dict]) -> dict:
+    # fields changed locally since base win; everything else comes from the latest remote copy
+    base = base or {}
+    changed = {k: v for k, v in local.items() if base.get(k) != v}
+    return {**(remote or {}), **changed}
+
+
+def merge_auth_data(base: dict, local: dict, remote: dict) -> dict:
+    base_users = base.get("credentials", {}).get("usernames", {})
+    local_users = local.get("credentials", {}).get("usernames", {})
+    merged_users = dict(remote.get("credentials", {}).get("usernames", {}))
+    for username, user in local_users.items():
+        if base_users.get(username) != user:
+            merged_users[username] = merge_user(base_users.get(username), user, merged_users.get(username))
+    for username in set(base_users) - set(local_users):
+        merged_users.pop(username, None)
+
+    merged = dict(remote)
+    for k, v in local.items():
+        if k != "credentials" and base.get(k) != v:
+            merged[k] = v
+    merged["credentials"] = {**remote.get("credentials", {}), "usernames": merged_users}
+    return merged
+
+
+class BlobCredentialStore:
+    """Encrypted JSON blob in S3, revalidated with conditional GETs.
+
+    The decrypted + parsed snapshot is kept in-process alongside the ETag it came from; revalidation sends
+    If-None-Match so an unchanged object costs a 304 and nothing is decrypted or re-parsed.
+    """
+
+    def __init__(
+        self,
+        client: "S3Client",
+        bucket: str,
+        fernet: Fernet,
+        key: str = AUTH_DB_KEY,
+        parse: Optional[Callable[[dict], Any]] = None,
+        revalidate_seconds: float = 30.0,
+        jitter_seconds: float = 5.0,
+    ):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.fernet = fernet
+        self.parse = parse
+        self.revalidate_seconds = revalidate_seconds
+        self.jitter_seconds = jitter_seconds
+        self._lock = threading.Lock()
+        self._snapshot: Optional[StoreSnapshot] = None
+        self._next_check = 0.0
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._snapshot.version if self._snapshot else None
+
+    def load(self, force: bool = False) -> StoreSnapshot:
+        snapshot = self._snapshot
+        if snapshot and not force and time.monotonic() < self._next_check:
+            return snapshot
+        with self._lock:
+            # another thread may have revalidated while we waited on the lock
+            if self._snapshot and not force and time.monotonic() < self._next_check:
+                return self._snapshot
+            self._revalidate()
+            return self._snapshot
+
+    def save(self, data: dict, base: Optional[StoreSnapshot] = None, max_attempts: int = 6) -> StoreSnapshot:
+        """Write ``data``; when ``base`` is given the PUT is conditional on the remote still being at that version.
+
+        On a conflict the latest version is re-read, local changes relative to ``base`` are merged onto it per user,
+        and the write is retried with backoff.
+        """
+        for attempt in range(max_attempts):
+            if base is None:
+                conditions = {}
+            elif base.version:
+                conditions = {"IfMatch": base.version}
+            else:
+                conditions = {"IfNoneMatch": "*"}
+            encrypted = self.fernet.encrypt(json.dumps(data).encode())
+            try:
+                response = self.client.put_object(Bucket=self.bucket, Key=self.key, Body=encrypted, **conditions)
+            except ClientError as e:
+                if not _is_conflict(e):
+                    raise
+                logger.info(f"Auth DB changed since version {base.version}; merging and retrying")
+                backoff_sleep(attempt)
+                remote = self.load(force=True)
+                data = merge_auth_data(base.data, data, remote.data)
+                base = remote
+                continue
+            with self._lock:
+                self._set_snapshot(response.get("ETag"), data)
+                logger.info(f"Auth DB written; now at version {self.version}")
+                return self._snapshot
+        raise WriteConflict(f"Auth DB write still conflicting after {max_attempts} attempts")
+
+    def delete(self):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key)
+        with self._lock:
+            self._set_snapshot(None, {})
+
+    def invalidate(self):
+        with self._lock:
+            self._next_check = 0.0
+
+    def _revalidate(self):
+        kwargs = {}
+        if self._snapshot and self._snapshot.version:
+            kwargs["IfNoneMatch"] = self._snapshot.version
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.key, **kwargs)
+        except ClientError as e:
+            if _status_code(e) == 304 or _error_code(e) in ("304", "NotModified"):
+                logger.debug("Auth DB unchanged")
+                self._schedule_next_check()
+                return
+            if _error_code(e) in ("NoSuchKey", "404"):
+                logger.warning("Failed loading auth db from remote storage; may not exist")
+                if not self._snapshot or self._snapshot.version is not None:
+                    self._set_snapshot(None, {})
+                else:
+                    self._schedule_next_check()
+                return
+            if self._snapshot:
+                logger.exception("Failed revalidating auth db; serving last loaded version")
+                self._schedule_next_check()
+                return
+            raise
+        decrypted = self.fernet.decrypt(response["Body"].read())
+        self._set_snapshot(response.get("ETag"), json.loads(decrypted.decode()))
+        logger.info(f"Auth DB loaded from remote storage; version {self.version}")
+
+    def _set_snapshot(self, version: Optional[str], data: dict):
+        value = self.parse(data) if self.parse else None
+        self._snapshot = StoreSnapshot(version=version, data=data, value=value)
+        self._schedule_next_check()
+
+    def _schedule_next_check(self):
+        # jitter spreads revalidation out so every worker doesn't hit S3 in the same instant
+        self._next_check = time.monotonic() + self.revalidate_seconds + random.uniform(0, self.jitter_seconds)
+
+
+class UserMap(MutableMapping):
+    """Lazily populated stand-in for the ``credentials["usernames"]`` dict used by streamlit_authenticator.
+
+    Users are fetched one at a time on first access; local writes and deletes are tracked so only the
+    changed users get written back. Iterating (a lookup by email, say) loads every user from ``list_users``.
+    """
+
+    def __init__(
+        self, fetch: Callable[[str], Optional[dict]], list_users: Optional[Callable[[], Mapping[str, dict]]] = None
+    ):
+        self._fetch = fetch
+        self._list_users = list_users
+        self._users: Dict[str, dict] = {}
+        self._originals: Dict[str, Optional[dict]] = {}
+        self._deleted: Set[str] = set()
+
+    def __getitem__(self, username: str) -> dict:
+        username = username.lower()
+        if username in self._deleted:
+            raise KeyError(username)
+        if username not in self._users:
+            user = self._fetch(username)
+            if user is None:
+                raise KeyError(username)
+            self._originals[username] = dict(user)
+            self._users[username] = dict(user)
+        return self._users[username]
+
+    def __setitem__(self, username: str, user: dict):
+        username = username.lower()
+        if username not in self._originals:
+            existing = self._fetch(username)
+            self._originals[username] = dict(existing) if existing is not None else None
+        self._deleted.discard(username)
+        self._users[username] = user
+
+    def __delitem__(self, username: str):
+        # the membership check loads the user, recording its original for changes()
+        if username not in self:
+            raise KeyError(username)
+        username = username.lower()
+        del self._users[username]
+        self._deleted.add(username)
+
+    def __iter__(self) -> Iterator[str]:
+        if self._list_users is not None:
+            for username, user in self._list_users().items():
+                if username not in self._users and username not in self._deleted:
+                    self._originals[username] = dict(user)
+                    self._users[username] = dict(user)
+        # without a listing only users touched through this map are known locally
+        return iter(list(self._users))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def changes(self) -> Tuple[Dict[str, dict], Set[str]]:
+        upserts = {k: v for k, v in self._users.items() if self._originals.get(k) != v}
+        return upserts, set(self._deleted)
+
+    def original(self, username: str) -> Optional[dict]:
+        return self._originals.get(username.lower())
+
+    def mark_clean(self):
+        self._originals = {k: dict(v) for k, v in self._users.items()}
+        self._originals.update({k: None for k in self._deleted})
+        self._deleted.clear()
+
+
+class SnapshotUserMap(MutableMapping):
+    """Copy-on-write view over the read-only ``usernames`` of a prepared auth db version.
+
+    Every session's authenticator reads through to the same shared users; a user is copied into the session on
+    first lookup, so nothing the authenticator changes reaches the shared snapshot.
+    """
+
+    def __init__(self, base: Mapping[str, dict]):
+        self._base = base
+        self._users: Dict[str, dict] = {}
+        self._deleted: Set[str] = set()
+
+    def __getitem__(self, username: str) -> dict:
+        username = username.lower()
+        if username in self._deleted:
+            raise KeyError(username)
+        if username not in self._users:
+            self._users[username] = dict(self._base[username])
+        return self._users[username]
+
+    def __setitem__(self, username: str, user: dict):
+        username = username.lower()
+        self._deleted.discard(username)
+        self._users[username] = user
+
+    def __delitem__(self, username: str):
+        if username not in self:
+            raise KeyError(username)
+        username = username.lower()
+        self._users.pop(username, None)
+        self._deleted.add(username)
+
+    def __contains__(self, username) -> bool:
+        # membership checks run on every login; answer them without copying the user
+        if not isinstance(username, str):
+            return False
+        username = username.lower()
+        return username not in self._deleted and (username in self._users or username in self._base)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._users
+        yield from (k for k in self._base if k not in self._users and k not in self._deleted)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def to_dict(self) -> Dict[str, dict]:
+        return {k: dict(self._users[k] if k in self._users else self._base[k]) for k in self}
+
+
+class ShardedCredentialStore:
+    """One encrypted ``AuthUserRecord`` per username on the app table, plus one ``AuthMetaRecord`` for settings.
+
+    ``fallback`` is the legacy blob store; users missing from the table are read from it and migrated on first
+    access, so the blob can be retired gradually or all at once with ``migrate_from_blob``.
+    """
+
+    def __init__(
+        self,
+        memory: "DynamoDBMemory | CachedMemory",
+        fernet: Fernet,
+        fallback: Optional[BlobCredentialStore] = None,
+        cache_seconds: float = 30.0,
+    ):
+        self.memory = memory
+        self.fernet = fernet
+        self.fallback = fallback
+        self.cache_seconds = cache_seconds
+        self._lock = threading.Lock()
+        self._users: Dict[str, Tuple[float, Optional[dict]]] = {}
+        self._settings: Optional[Tuple[float, Optional[dict]]] = None
+
+    def get_user(self, username: str) -> Optional[dict]:
+        username = username.lower()
+        cached = self._users.get(username)
+        if cached and time.monotonic() < cached[0]:
+            return cached[1]
+        record = self.memory.get_existing(username, AuthUserRecord)
+        if record:
+            user = self._decrypt(record.encrypted)
+        else:
+            user = self._migrate_user(username)
+        self._cache_user(username, user)
+        return user
+
+    def put_user(self, username: str, user: dict, base: Optional[dict] = None, force: bool = False, max_attempts=6):
+        """Write one user record, conditional on the revision read just before the write.
+
+        ``base`` is the copy the local change started from; a concurrent change to the same user is merged field
+        by field. With no ``base`` (a new registration) an existing record is a conflict unless ``force`` is set.
+        """
+        username = username.lower()
+        for attempt in range(max_attempts):
+            existing = self.memory.get_existing(username, AuthUserRecord, consistent_read=True)
+            if existing and not force:
+                remote = self._decrypt(existing.encrypted)
+                if base is None:
+                    raise WriteConflict(f"User {username} already exists")
+                if remote != base:
+                    user = merge_user(base, user, remote)
+                    base = remote
+            try:
+                if existing:
+                    self._conditional_update(existing, self._encrypt(user))
+                else:
+                    self._conditional_create(username, self._encrypt(user))
+            except ClientError as e:
+                if not _is_conflict(e):
+                    raise
+                logger.info(f"Concurrent write to user {username}; retrying")
+                backoff_sleep(attempt)
+                continue
+            self._cache_user(username, user)
+            return
+        raise WriteConflict(f"Write to user {username} still conflicting after {max_attempts} attempts")
+
+    def delete_user(self, username: str):
+        username = username.lower()
+        self.memory.dynamodb_table.delete_item(Key=AuthUserRecord.dynamodb_lookup_keys_from_id(username))
+        self._invalidate_record(username)
+        self._cache_user(username, None)
+
+    def apply(self, users: UserMap):
+        upserts, deletes = users.changes()
+        for username, user in upserts.items():
+            self.put_user(username, user, base=users.original(username))
+        for username in deletes:
+            self.delete_user(username)
+        users.mark_clean()
+        logger.info(f"Auth DB: wrote {len(upserts)} user(s), deleted {len(deletes)}")
+
+    def load_settings(self) -> Optional[dict]:
+        cached = self._settings
+        if cached and time.monotonic() < cached[0]:
+            return cached[1]
+        record = self.memory.get_existing(AUTH_META_ID, AuthMetaRecord)
+        settings = self._decrypt(record.encrypted) if record else None
+        self._settings = (time.monotonic() + self.cache_seconds, settings)
+        return settings
+
+    def save_settings(self, settings: dict):
+        self.update_settings(lambda current: settings)
+
+    def update_settings(self, change: Callable[[dict], dict], max_attempts: int = 6) -> dict:
+        """Read-modify-write of the settings record, conditional on the revision that was read; retried on conflict."""
+        for attempt in range(max_attempts):
+            existing = self.memory.get_existing(AUTH_META_ID, AuthMetaRecord, consistent_read=True)
+            settings = change(self._decrypt(existing.encrypted) if existing else {})
+            record = AuthMetaRecord.create_new(
+                {"encrypted": self._encrypt(settings), "revision": existing.revision + 1 if existing else 0},
+                override_id=AUTH_META_ID,
+            )
+            if existing:
+                record = record.model_copy(update={"created_at": existing.created_at})
+                condition = {
+                    "ConditionExpression": "attribute_not_exists(revision) OR revision = :revision",
+                    "ExpressionAttributeValues": {":revision": existing.revision},
+                }
+            else:
+                condition = {"ConditionExpression": "attribute_not_exists(pk)"}
+            try:
+                self.memory.dynamodb_table.put_item(Item=record.to_dynamodb_item(), **condition)
+            except ClientError as e:
+                if not _is_conflict(e):
+                    raise
+                logger.info("Concurrent write to auth settings; retrying")
+                backoff_sleep(attempt)
+                continue
+            if isinstance(self.memory, CachedMemory):
+                self.memory.invalidate(AuthMetaRecord, AUTH_META_ID)
+            self._settings = (time.monotonic() + self.cache_seconds, settings)
+            return settings
+        raise WriteConflict(f"Write to auth settings still conflicting after {max_attempts} attempts")
+
+    def remove_preauthorized(self, emails: Set[str]):
+        # registration consumes the email; drop just those so concurrent edits to the list survive
+        def change(settings: dict) -> dict:
+            preauthorized = settings.get("preauthorized") or {}
+            remaining = [e for e in preauthorized.get("emails", []) if e not in emails]
+            return {**settings, "preauthorized": {**preauthorized, "emails": remaining}}
+
+        self.update_settings(change)
+
+    def list_users(self) -> Dict[str, dict]:
+        """Every user, decrypted: the table's records over any the legacy blob still holds."""
+        users = {}
+        if self.fallback:
+            blob_users = self.fallback.load().data.get("credentials", {}).get("usernames", {})
+            users.update({k.lower(): v for k, v in blob_users.items()})
+        pages = exhaust_pagination(lambda key: self.memory.list_type_by_updated_at(AuthUserRecord, pagination_key=key))
+        for page in pages:
+            for record in page:
+                users[record.resource_id] = self._decrypt(record.encrypted)
+        return users
+
+    def migrate_from_blob(self, blob: BlobCredentialStore) -> int:
+        data = blob.load(force=True).data
+        if not data.get("credentials"):
+            logger.warning("No blob auth database to migrate")
+            return 0
+        self.save_settings({k: v for k, v in data.items() if k != "credentials"})
+        users = data["credentials"].get("usernames", {})
+        for username, user in users.items():
+            self.put_user(username, user, force=True)
+        logger.info(f"Migrated {len(users)} user(s) from {blob.key} to sharded storage")
+        return len(users)
+
+    def _migrate_user(self, username: str) -> Optional[dict]:
+        if not self.fallback:
+            return None
+        users = self.fallback.load().data.get("credentials", {}).get("usernames", {})
+        user = {k.lower(): v for k, v in users.items()}.get(username)
+        if user is not None:
+            logger.info(f"Migrating {username} from blob auth database on first access")
+            self.put_user(username, user, force=True)
+        return user
+
+    def _conditional_create(self, username: str, encrypted: str):
+        # memory.create_new is a plain put for non-versioned resources; guard it so concurrent registrations conflict
+        record = AuthUserRecord.create_new({"encrypted": encrypted}, override_id=username)
+        self.memory.dynamodb_table.put_item(
+            Item=record.to_dynamodb_item(), ConditionExpression="attribute_not_exists(pk)"
+        )
+        self._invalidate_record(username)
+
+    def _conditional_update(self, existing: AuthUserRecord, encrypted: str):
+        self.memory.dynamodb_table.update_item(
+            Key=AuthUserRecord.dynamodb_lookup_keys_from_id(existing.resource_id),
+            # keep updated_at and the gsitype sort key moving the way memory.update_existing would
+            UpdateExpression="SET encrypted = :encrypted, revision = :next, updated_at = :now, gsitypesk = :now",
+            ConditionExpression="attribute_exists(pk) AND (attribute_not_exists(revision) OR revision = :revision)",
+            ExpressionAttributeValues={
+                ":encrypted": encrypted,
+                ":next": existing.revision + 1,
+                ":revision": existing.revision,
+                ":now": datetime.now(timezone.utc).isoformat(),
+            },
+        )
+        self._invalidate_record(existing.resource_id)
+
+    def _invalidate_record(self, username: str):
+        # user records are written straight to the table, past the read-through cache
+        if isinstance(self.memory, CachedMemory):
+            self.memory.invalidate(AuthUserRecord, username)
+
+    def _cache_user(self, username: str, user: Optional[dict]):
+        with self._lock:
+            self._users[username] = (time.monotonic() + self.cache_seconds, user)
+
+    def _encrypt(self, data: dict) -> str:
+        return self.fernet.encrypt(json.dumps(data).encode()).decode()
+
+    def _decrypt(self, token: str) -> dict:
+        return json.loads(self.fernet.decrypt(token.encode()).decode())
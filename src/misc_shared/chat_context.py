@@ -0,0 +1,170 @@
+import hashlib
+import threading
+from typing import Callable, Optional
+
+import streamlit as st
+from logzero import logger
+
+from misc_shared.memory_cache import TtlLruCache
+
+# per-message framing overhead in the chat format, plus the tokens that prime the reply
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def _message_hash(message: dict) -> str:
+    return hashlib.sha1(f"{message['role']}\x00{message.get('content') or ''}".encode()).hexdigest()
+
+
+class TokenCounter:
+    """Counts chat-format tokens per message, remembering every message it has seen so nothing is re-encoded.
+
+    Uses tiktoken when it's installed and falls back to a chars/4 estimate otherwise.
+    """
+
+    def __init__(self, model: str, max_entries: int = 50_000):
+        self.model = model
+        self._encode = _load_encoder(model)
+        self._counts: dict[str, int] = {}
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def count_message(self, message: dict) -> int:
+        key = _message_hash(message)
+        if (count := self._counts.get(key)) is not None:
+            return count
+        count = MESSAGE_OVERHEAD_TOKENS + self._encode(message.get("content") or "")
+        with self._lock:
+            if len(self._counts) >= self._max_entries:
+                self._counts.clear()
+            self._counts[key] = count
+        return count
+
+    def count_messages(self, messages: list[dict]) -> int:
+        return REPLY_PRIMING_TOKENS + sum(self.count_message(m) for m in messages)
+
+
+def _load_encoder(model: str) -> Callable[[str], int]:
+    try:
+        import tiktoken
+    except ImportError:
+        logger.warning("tiktoken not installed; estimating token counts from length")
+        return lambda text: (len(text) + 3) // 4
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+class ContextWindow:
+    """Caps the history sent with each request to ``budget_tokens``.
+
+    System messages are pinned, the newest turns are kept, and older turns fall out of the window in blocks of
+    ``summary_block`` messages. With a ``summarizer`` the dropped turns are folded into a rolling summary: each
+    summary is built from the previous one plus the newly dropped block and cached by content, so summarizing
+    costs one extra call per block rather than one per turn.
+    """
+
+    def __init__(
+        self,
+        counter: TokenCounter,
+        budget_tokens: int,
+        summarizer: Optional[Callable[[list[dict]], str]] = None,
+        summary_cache: Optional[TtlLruCache] = None,
+        summary_block: int = 6,
+    ):
+        self.counter = counter
+        self.budget_tokens = budget_tokens
+        self.summarizer = summarizer
+        self.summary_cache = summary_cache or TtlLruCache(256, 24 * 3600)
+        self.summary_block = summary_block
+        self.last_request_tokens = 0
+        self.last_dropped = 0
+
+    def build(self, history: list[dict]) -> list[dict]:
+        pinned = [m for m in history if m["role"] == "system"]
+        turns = [m for m in history if m["role"] != "system"]
+        budget = self.budget_tokens - self.counter.count_messages(pinned)
+
+        # newest first, stop at the first turn that doesn't fit; always send the latest turn
+        used, keep = 0, 0
+        for message in reversed(turns):
+            cost = self.counter.count_message(message)
+            if keep and used + cost > budget:
+                break
+            used += cost
+            keep += 1
+
+        cut = len(turns) - keep
+        if cut and self.summarizer:
+            # move the cut forward to a block boundary so the summary only changes once per block; if the summary
+            # doesn't fit next to what's left, give up another block of turns to it
+            cut = self._block_boundary(cut, len(turns))
+            while True:
+                summary = self._summary_for(turns[:cut])
+                used = sum(self.counter.count_message(m) for m in [summary] + turns[cut:])
+                if used <= budget or cut >= len(turns) - 1:
+                    break
+                cut = self._block_boundary(cut + 1, len(turns))
+            messages = pinned + [summary] + turns[cut:]
+        else:
+            messages = pinned + turns[cut:]
+
+        self.last_dropped = cut
+        self.last_request_tokens = self.counter.count_messages(messages)
+        return messages
+
+    def _block_boundary(self, cut: int, turn_count: int) -> int:
+        # the latest turn is always sent, so never cut past it
+        return min(-(-cut // self.summary_block) * self.summary_block, turn_count - 1)
+
+    def _summary_for(self, dropped: list[dict]) -> dict:
+        # fold in whole blocks, then whatever is left over, so the summary covers exactly ``dropped``
+        ends = list(range(self.summary_block, len(dropped) + 1, self.summary_block))
+        if not ends or ends[-1] != len(dropped):
+            ends.append(len(dropped))
+        summary, start = None, 0
+        for end in ends:
+            key = _message_hash({"role": "summary", "content": "".join(map(_message_hash, dropped[:end]))})
+            cached = self.summary_cache.get(key, None)
+            if cached is None:
+                previous = [{"role": "system", "content": SUMMARY_PREFIX + summary}] if summary else []
+                cached = self.summarizer(previous + dropped[start:end])
+                self.summary_cache.set(key, cached)
+            summary, start = cached, end
+        return {"role": "system", "content": SUMMARY_PREFIX + summary}
+
+
+def openai_summarizer(model: str = "gpt-3.5-turbo") -> Callable[[list[dict]], str]:
+    import openai
+
+    def summarize(messages: list[dict]) -> str:
+        response = openai.chat.completions.create(
+            model=model,
+            temperature=0,
+            messages=messages
+            + [
+                {
+                    "role": "system",
+                    "content": "Summarize the conversation so far in a few sentences, keeping names, facts, "
+                    "decisions and open questions. Reply with the summary only.",
+                }
+            ],
+        )
+        return response.choices[0].message.content or ""
+
+    return summarize
+
+
+@st.cache_resource
+def get_token_counter(model: str) -> TokenCounter:
+    return TokenCounter(model)
+
+
+@st.cache_resource
+def get_summary_cache() -> TtlLruCache:
+    # summaries are keyed by the content they cover, so one process-wide cache is safe to share between sessions
+    return TtlLruCache(1024, 24 * 3600)
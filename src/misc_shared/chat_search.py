@@ -0,0 +1,438 @@
+import hashlib
+import json
+import math
+import mmap
+import re
+import struct
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+from uuid import uuid4
+
+import numpy as np
+import streamlit as st
+from botocore.exceptions import ClientError
+from logzero import logger
+from pydantic import BaseModel
+
+from misc_shared.memory_cache import CachedMemory, TtlLruCache
+from misc_shared.models import ChatSearchMeta
+from misc_shared.utils import backoff_sleep
+
+if TYPE_CHECKING:
+    from misc_shared.encrypted_objects import EncryptedObjectStore
+
+SEGMENT_MAGIC = b"CSI1"
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i if in is it its me my of on or so that the this to was we "
+    "were what when which who will with you your".split()
+)
+# BM25 parameters; the usual defaults
+K1 = 1.2
+B = 0.75
+
+
+class ChatSearchSettings(BaseModel):
+    # overridable from the [chat_search] section of secrets.toml
+    enabled: bool = True
+    cache_dir: str = "~/.cache/misc/chat_search"
+    max_segments: int = 16
+    preview_chars: int = 300
+    key_prefix: str = "app_data/chat_search"
+    max_open_segments: int = 256
+
+
+class SearchHit(BaseModel):
+    session_id: str
+    message_index: int
+    role: str
+    score: float
+    preview: str
+
+
+def tokenize(text: str) -> list[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def encode_segment(docs: list[dict], postings: dict[str, list[tuple[int, int]]]) -> bytes:
+    """Segment file: magic, header length, JSON header (terms and doc metadata), then three flat arrays.
+
+    ``offsets[i]:offsets[i + 1]`` is term i's slice of ``doc_ids`` (uint32, ascending) and ``tfs`` (uint16).
+    """
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype="<u4")
+    doc_ids, tfs = [], []
+    for i, term in enumerate(terms):
+        entries = sorted(postings[term])
+        doc_ids.extend(d for d, _ in entries)
+        tfs.extend(min(tf, 65535) for _, tf in entries)
+        offsets[i + 1] = len(doc_ids)
+    header = json.dumps({"terms": terms, "docs": docs}, separators=(",", ":")).encode()
+    # pad so the uint32 arrays start 4-byte aligned
+    header += b" " * (-(len(header) + 8) % 4)
+    return b"".join(
+        [
+            SEGMENT_MAGIC,
+            struct.pack("<I", len(header)),
+            header,
+            offsets.tobytes(),
+            np.asarray(doc_ids, dtype="<u4").tobytes(),
+            np.asarray(tfs, dtype="<u2").tobytes(),
+        ]
+    )
+
+
+class Segment:
+    """An immutable segment file, memory mapped; postings are numpy views straight onto the mapping.
+
+    Readers hold the segment between ``acquire`` and ``release``; ``close`` unmaps it once the last one lets go.
+    """
+
+    def __init__(self, segment_id: str, path: Path):
+        self.segment_id = segment_id
+        self._lock = threading.Lock()
+        self._readers = 0
+        self._closing = False
+        with path.open("rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:4] != SEGMENT_MAGIC:
+            raise ValueError(f"{path} is not a chat search segment")
+        (header_length,) = struct.unpack_from("<I", self._mmap, 4)
+        header = json.loads(self._mmap[8 : 8 + header_length])
+        self.terms = {term: i for i, term in enumerate(header["terms"])}
+        # [session_id, message_index, role, length, expires_at, preview]
+        self.docs = header["docs"]
+        self.lengths = np.array([d[3] for d in self.docs], dtype="float64")
+        # latest expiry seen per session; a session's later saves extend it for its earlier messages too
+        self.session_expiry: dict[str, Optional[int]] = {}
+        for session_id, _, _, _, expires_at, _ in self.docs:
+            previous = self.session_expiry.get(session_id, 0)
+            self.session_expiry[session_id] = (
+                None if previous is None or expires_at is None else max(previous, expires_at)
+            )
+        start = 8 + header_length
+        self.offsets = np.frombuffer(self._mmap, dtype="<u4", count=len(self.terms) + 1, offset=start)
+        postings = int(self.offsets[-1])
+        start += self.offsets.nbytes
+        self.doc_ids = np.frombuffer(self._mmap, dtype="<u4", count=postings, offset=start)
+        self.tfs = np.frombuffer(self._mmap, dtype="<u2", count=postings, offset=start + postings * 4)
+
+    def postings(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        if (i := self.terms.get(term)) is None:
+            return self.doc_ids[:0], self.tfs[:0]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.doc_ids[start:end], self.tfs[start:end]
+
+    def postings_by_term(self) -> dict[str, list[tuple[int, int]]]:
+        return {term: list(zip(*(x.tolist() for x in self.postings(term)))) for term in self.terms}
+
+    def acquire(self) -> bool:
+        """Start reading; False once the segment has been closed, and the caller should map it afresh."""
+        with self._lock:
+            if self._closing:
+                return False
+            self._readers += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._readers -= 1
+            if self._closing and not self._readers:
+                self._unmap()
+
+    def close(self):
+        with self._lock:
+            if self._closing:
+                return
+            self._closing = True
+            if not self._readers:
+                self._unmap()
+
+    @property
+    def closed(self) -> bool:
+        return self._mmap.closed
+
+    def _unmap(self):
+        # the arrays are exported views of the mapping, which can't be closed while they're alive
+        self.offsets = self.doc_ids = self.tfs = None
+        self._mmap.close()
+
+
+class ChatSearchIndex:
+    """Per-user inverted index over saved chat messages, for BM25-ranked full text search.
+
+    Each batch of newly saved messages becomes an immutable segment: sorted terms plus flat uint32/uint16 postings
+    arrays, written encrypted to S3. A ``ChatSearchMeta`` record per user lists the live segments and is updated
+    conditionally, so concurrent writers append rather than overwrite. Searches map segments from a local cache
+    directory, fetching only segments not seen before, and score with numpy over the matching postings. Past
+    ``max_segments`` a user's segments are merged into one, dropping superseded and expired messages. Indexing runs
+    on a single background thread so a chat turn never waits on it.
+    """
+
+    def __init__(self, memory, objects: "EncryptedObjectStore", settings: Optional[ChatSearchSettings] = None):
+        self.memory = memory
+        self.objects = objects
+        self.settings = settings or ChatSearchSettings()
+        self.cache_dir = Path(self.settings.cache_dir).expanduser()
+        self._segments = TtlLruCache(
+            max_entries=self.settings.max_open_segments, ttl_seconds=24 * 3600, on_evict=lambda s: s.close()
+        )
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-index")
+
+    def add_messages_async(self, username: str, session_id: str, messages: list[dict], start: int = 0, expires_at=None):
+        # one indexing thread per process keeps a user's segments in save order
+        return self._executor.submit(self.add_messages, username, session_id, messages, start, expires_at)
+
+    def add_messages(
+        self, username: str, session_id: str, messages: list[dict], start: int = 0, expires_at=None
+    ) -> Optional[str]:
+        """Index ``messages[start:]`` as one new segment; returns its id, or None if there was nothing to index."""
+        docs, postings = [], {}
+        for index in range(start, len(messages)):
+            content = messages[index].get("content") or ""
+            tokens = tokenize(content)
+            if not tokens:
+                continue
+            doc_id = len(docs)
+            docs.append(
+                [
+                    session_id,
+                    index,
+                    messages[index].get("role", ""),
+                    len(tokens),
+                    int(expires_at) if expires_at else None,
+                    content[: self.settings.preview_chars],
+                ]
+            )
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((doc_id, tf))
+        if not docs:
+            return None
+        segment = self._write_segment(username, encode_segment(docs, postings))
+        meta = self._update_meta(username, lambda segments: segments + [{"id": segment, "docs": len(docs)}])
+        logger.debug(f"Indexed {len(docs)} message(s) from {session_id} for {username}")
+        if len(meta.segments) > self.settings.max_segments:
+            self.compact(username)
+        return segment
+
+    def search(self, username: str, query: str, limit: int = 20) -> list[SearchHit]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        segments = self._open_live_segments(username)
+        if not segments:
+            return []
+        try:
+            return self._rank(segments, terms, limit)
+        finally:
+            for segment in segments:
+                segment.release()
+
+    def _rank(self, segments: list[Segment], terms: list[str], limit: int) -> list[SearchHit]:
+        total_docs = sum(len(s.docs) for s in segments)
+        average_length = sum(float(s.lengths.sum()) for s in segments) / max(total_docs, 1)
+        document_frequency = {t: sum(len(s.postings(t)[0]) for s in segments) for t in terms}
+        idf = {t: math.log(1 + (total_docs - df + 0.5) / (df + 0.5)) for t, df in document_frequency.items()}
+
+        expired = _expired_sessions(segments)
+        best: dict[tuple[str, int], SearchHit] = {}
+        # newest segment first, so a message re-indexed after an edit shadows its older copy
+        for segment in reversed(segments):
+            scores = np.zeros(len(segment.docs))
+            norm = K1 * (1 - B + B * segment.lengths / average_length)
+            for term in terms:
+                doc_ids, tfs = segment.postings(term)
+                if len(doc_ids):
+                    tf = tfs.astype("float64")
+                    scores[doc_ids] += idf[term] * tf * (K1 + 1) / (tf + norm[doc_ids])
+            matched = np.flatnonzero(scores)
+            for doc_id in matched[np.argsort(-scores[matched])][: limit * 4]:
+                session_id, index, role, _, _, preview = segment.docs[doc_id]
+                if (session_id, index) in best or session_id in expired:
+                    continue
+                best[(session_id, index)] = SearchHit(
+                    session_id=session_id, message_index=index, role=role, score=float(scores[doc_id]), preview=preview
+                )
+        return sorted(best.values(), key=lambda x: x.score, reverse=True)[:limit]
+
+    def _open_live_segments(self, username: str) -> list[Segment]:
+        """Acquired segments listed in the user's current metadata; the caller releases them.
+
+        A compaction can delete segments between the metadata read and the fetch; the metadata is then re-read
+        once, since it already lists the merged segment that replaced them.
+        """
+        for attempt in range(2):
+            meta = self.memory.get_existing(username.lower(), ChatSearchMeta, consistent_read=True)
+            if not meta or not meta.segments:
+                return []
+            segments = []
+            try:
+                for x in meta.segments:
+                    segments.append(self._open_segment(username, x["id"]))
+                return segments
+            except _SegmentMissing:
+                for segment in segments:
+                    segment.release()
+                if attempt:
+                    raise
+                logger.info(f"Chat index for {username} was compacted while opening it; re-reading")
+        return []
+
+    def compact(self, username: str) -> Optional[str]:
+        try:
+            segments = self._open_live_segments(username)
+        except _SegmentMissing:
+            logger.info(f"Chat index for {username} is being compacted elsewhere; skipping")
+            return None
+        try:
+            if len(segments) < 2:
+                return None
+            merged_ids = [x.segment_id for x in segments]
+            docs, postings, seen = [], {}, set()
+            expired = _expired_sessions(segments)
+            for segment in reversed(segments):
+                keep = {}
+                for doc_id, doc in enumerate(segment.docs):
+                    key = (doc[0], doc[1])
+                    if key in seen or doc[0] in expired:
+                        continue
+                    seen.add(key)
+                    keep[doc_id] = len(docs)
+                    docs.append(doc)
+                for term, entries in segment.postings_by_term().items():
+                    kept = [(keep[d], tf) for d, tf in entries if d in keep]
+                    if kept:
+                        postings.setdefault(term, []).extend(kept)
+        finally:
+            for segment in segments:
+                segment.release()
+        merged = self._write_segment(username, encode_segment(docs, postings))
+
+        def replace(current: list[dict]) -> list[dict]:
+            if [x["id"] for x in current[: len(merged_ids)]] != merged_ids:
+                raise _SegmentsChanged()
+            # segments added while merging stay after the merged one
+            return [{"id": merged, "docs": len(docs)}] + current[len(merged_ids) :]
+
+        try:
+            self._update_meta(username, replace)
+        except _SegmentsChanged:
+            logger.info(f"Chat index for {username} changed while compacting; will retry on a later write")
+            self.objects.delete(self._segment_key(username, merged))
+            return None
+        for segment_id in merged_ids:
+            self.objects.delete(self._segment_key(username, segment_id))
+            self._segments.delete(f"{username.lower()}/{segment_id}")
+            self._segment_path(username, segment_id).unlink(missing_ok=True)
+        logger.info(f"Compacted {len(merged_ids)} chat index segment(s) for {username} into {len(docs)} message(s)")
+        return merged
+
+    def _write_segment(self, username: str, data: bytes) -> str:
+        segment_id = f"{int(time.time() * 1000):013d}-{uuid4().hex[:8]}"
+        self.objects.put(self._segment_key(username, segment_id), data, content_type="application/octet-stream")
+        self._store_local(username, segment_id, data)
+        return segment_id
+
+    def _open_segment(self, username: str, segment_id: str) -> Segment:
+        # returned acquired; an entry closed by an eviction racing this lookup is simply mapped again
+        cache_key = f"{username.lower()}/{segment_id}"
+        if (segment := self._segments.get(cache_key, None)) is not None and segment.acquire():
+            return segment
+        path = self._segment_path(username, segment_id)
+        try:
+            if not path.exists():
+                self._store_local(username, segment_id, self.objects.get(self._segment_key(username, segment_id)))
+            segment = Segment(segment_id, path)
+        except FileNotFoundError as e:
+            raise _SegmentMissing(segment_id) from e
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+                raise
+            raise _SegmentMissing(segment_id) from e
+        segment.acquire()
+        self._segments.set(cache_key, segment)
+        return segment
+
+    def _store_local(self, username: str, segment_id: str, data: bytes):
+        path = self._segment_path(username, segment_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp = path.with_suffix(f".{uuid4().hex}.tmp")
+        temp.write_bytes(data)
+        temp.replace(path)
+
+    def _update_meta(self, username: str, change, max_attempts: int = 6) -> ChatSearchMeta:
+        username = username.lower()
+        for attempt in range(max_attempts):
+            existing = self.memory.get_existing(username, ChatSearchMeta, consistent_read=True)
+            revision = existing.revision if existing else None
+            segments = change(list(existing.segments) if existing else [])
+            meta = ChatSearchMeta.create_new(
+                {"segments": segments, "revision": (revision or 0) + 1}, override_id=username
+            )
+            if existing:
+                meta = meta.model_copy(update={"created_at": existing.created_at})
+            condition = (
+                {"ConditionExpression": "attribute_not_exists(pk)"}
+                if revision is None
+                else {
+                    "ConditionExpression": "revision = :revision",
+                    "ExpressionAttributeValues": {":revision": revision},
+                }
+            )
+            try:
+                self.memory.dynamodb_table.put_item(Item=meta.to_dynamodb_item(), **condition)
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                    raise
+                backoff_sleep(attempt)
+                continue
+            if isinstance(self.memory, CachedMemory):
+                self.memory.invalidate(ChatSearchMeta, username)
+            return meta
+        raise RuntimeError(f"Chat index metadata for {username} still conflicting after {max_attempts} attempts")
+
+    def _user_hash(self, username: str) -> str:
+        return hashlib.sha256(username.lower().encode()).hexdigest()[:24]
+
+    def _segment_key(self, username: str, segment_id: str) -> str:
+        return f"{self.settings.key_prefix}/{self._user_hash(username)}/{segment_id}.seg"
+
+    def _segment_path(self, username: str, segment_id: str) -> Path:
+        return self.cache_dir / self._user_hash(username) / f"{segment_id}.seg"
+
+
+class _SegmentsChanged(Exception):
+    pass
+
+
+class _SegmentMissing(Exception):
+    pass
+
+
+def _expired_sessions(segments: list[Segment]) -> set[str]:
+    expiry: dict[str, Optional[int]] = {}
+    for segment in segments:
+        for session_id, expires_at in segment.session_expiry.items():
+            previous = expiry.get(session_id, 0)
+            expiry[session_id] = None if previous is None or expires_at is None else max(previous, expires_at)
+    now = time.time()
+    return {session_id for session_id, expires_at in expiry.items() if expires_at is not None and expires_at < now}
+
+
+def get_chat_search_settings() -> ChatSearchSettings:
+    return ChatSearchSettings.model_validate(dict(st.secrets.get("chat_search", {})))
+
+
+@st.cache_resource
+def get_chat_search_index() -> Optional[ChatSearchIndex]:
+    from misc_shared.encrypted_objects import get_encrypted_object_store
+    from misc_shared.storage import get_memory
+
+    settings = get_chat_search_settings()
+    if not settings.enabled:
+        return None
+    return ChatSearchIndex(get_memory(), get_encrypted_object_store(), settings)
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import time
+from typing import Iterator, Literal, Optional
+
+import streamlit as st
+from logzero import logger
+from pydantic import BaseModel
+
+from misc_shared.memory_cache import TtlLruCache
+from misc_shared.models import CachedCompletion
+from misc_shared.storage import get_memory
+
+
+class CompletionCacheSettings(BaseModel):
+    # overridable from the [completion_cache] section of secrets.toml
+    enabled: bool = True
+    max_entries: int = 512
+    ttl_seconds: float = 7 * 24 * 3600
+    tier: Literal["memory", "disk", "dynamodb"] = "memory"
+    disk_cache_dir: str = ".cache/completions"
+
+
+def is_deterministic(temperature: Optional[float], seed: Optional[int]) -> bool:
+    return temperature == 0 or seed is not None
+
+
+def completion_cache_key(model: str, messages: list[dict], temperature: Optional[float], seed: Optional[int]) -> str:
+    # only role/content matter to the API; key order and float noise from the slider shouldn't split the cache
+    normalized = {
+        "model": model,
+        "messages": [{"role": m["role"], "content": m.get("content") or ""} for m in messages],
+        "temperature": None if temperature is None else round(float(temperature), 4),
+        "seed": seed,
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def replay_chunks(text: str, chunk_chars: int = 40) -> Iterator[str]:
+    for i in range(0, len(text), chunk_chars):
+        yield text[i : i + chunk_chars]
+
+
+class CompletionCache:
+    """Content-addressed cache of finished completions: an in-process LRU, optionally backed by disk or DynamoDB."""
+
+    def __init__(self, settings: Optional[CompletionCacheSettings] = None, memory=None):
+        self.settings = settings or CompletionCacheSettings()
+        self._lru = TtlLruCache(self.settings.max_entries, self.settings.ttl_seconds)
+        self._disk = None
+        self._memory = memory
+        if self.settings.tier == "disk":
+            import diskcache
+
+            self._disk = diskcache.Cache(self.settings.disk_cache_dir)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        content = self._lru.get(key, None)
+        if content is None:
+            content = self._get_backing(key)
+            if content is not None:
+                self._lru.set(key, content)
+        if content is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return content
+
+    def put(self, key: str, content: str, model: str = ""):
+        self._lru.set(key, content)
+        try:
+            if self._disk is not None:
+                self._disk.set(key, content, expire=self.settings.ttl_seconds)
+            elif self._memory is not None:
+                ttl = int(time.time() + self.settings.ttl_seconds)
+                self._memory.create_new(CachedCompletion, {"model": model, "content": content, "ttl": ttl}, key)
+        except Exception:
+            logger.exception("Failed writing completion to the backing cache")
+
+    def _get_backing(self, key: str) -> Optional[str]:
+        if self._disk is not None:
+            return self._disk.get(key)
+        if self._memory is not None:
+            record = self._memory.get_existing(key, CachedCompletion)
+            if record and (not record.ttl or record.ttl > time.time()):
+                return record.content
+        return None
+
+
+@st.cache_resource
+def get_completion_cache() -> Optional[CompletionCache]:
+    settings = CompletionCacheSettings.model_validate(dict(st.secrets.get("completion_cache", {})))
+    if not settings.enabled:
+        return None
+    return CompletionCache(settings, memory=get_memory() if settings.tier == "dynamodb" else None)
@@ -0,0 +1,246 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import IO, TYPE_CHECKING, BinaryIO, Iterable, Iterator, Optional, Union
+
+import streamlit as st
+from cryptography.fernet import Fernet
+from logzero import logger
+from pydantic import BaseModel
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3 import S3Client
+
+CHUNKED_FORMAT = "fernet-chunked-v1"
+LEGACY_FORMAT = "fernet-blob"
+FORMAT_METADATA_KEY = "enc-format"
+CHUNK_SIZE_METADATA_KEY = "enc-chunk-size"
+
+# S3 multipart parts must be at least 5 MiB, except the last
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+Source = Union[bytes, BinaryIO, IO[bytes], Iterable[bytes]]
+
+
+def token_length(plaintext_length: int) -> int:
+    """Size of the Fernet token for ``plaintext_length`` bytes.
+
+    version (1) + timestamp (8) + IV (16) + PKCS7-padded AES-CBC ciphertext + HMAC (32), urlsafe base64 encoded.
+    Every full chunk therefore encrypts to the same length, which is what makes the chunks seekable.
+    """
+    raw = 57 + (plaintext_length // 16 + 1) * 16
+    return 4 * -(-raw // 3)
+
+
+class EncryptedObjectInfo(BaseModel):
+    key: str
+    format: str
+    encrypted_size: int
+    chunk_size: Optional[int] = None
+
+    @property
+    def chunk_token_size(self) -> int:
+        return token_length(self.chunk_size)
+
+    @property
+    def chunk_count(self) -> int:
+        return -(-self.encrypted_size // self.chunk_token_size) if self.chunk_size else 1
+
+
+class EncryptedObjectStore:
+    """Objects in S3 encrypted as a sequence of independent Fernet tokens, one per ``chunk_size`` of plaintext.
+
+    Uploads read, encrypt and send one multipart part at a time, with at most ``max_workers`` parts in flight, and
+    reads decrypt token by token off the response stream, so memory stays at a few parts whatever the object size.
+    A full chunk's token length is fixed, so a plaintext byte range maps straight to a ranged GET of just the
+    tokens that cover it. Objects written as a single Fernet token (the auth db format) are read as well; they
+    have no chunk metadata and are decrypted whole.
+    """
+
+    def __init__(
+        self,
+        client: "S3Client",
+        bucket: str,
+        fernet: Fernet,
+        chunk_size: int = 1024 * 1024,
+        part_size: int = 8 * 1024 * 1024,
+        max_workers: int = 4,
+    ):
+        self.client = client
+        self.bucket = bucket
+        self.fernet = fernet
+        self.chunk_size = chunk_size
+        # whole tokens per part, and enough of them to clear the multipart minimum
+        self.chunks_per_part = max(1, -(-max(part_size, MIN_PART_SIZE) // token_length(chunk_size)))
+        self.max_workers = max_workers
+
+    def put(self, key: str, source: Source, content_type: Optional[str] = None) -> EncryptedObjectInfo:
+        extra = {"Metadata": {FORMAT_METADATA_KEY: CHUNKED_FORMAT, CHUNK_SIZE_METADATA_KEY: str(self.chunk_size)}}
+        if content_type:
+            extra["ContentType"] = content_type
+        parts = self._encrypted_parts(source)
+        first = next(parts, b"")
+        second = next(parts, None)
+        if second is None:
+            # fits in one part; a plain PUT is one request instead of three
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=first, **extra)
+            return EncryptedObjectInfo(
+                key=key, format=CHUNKED_FORMAT, encrypted_size=len(first), chunk_size=self.chunk_size
+            )
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key, **extra)["UploadId"]
+        try:
+            size = self._upload_parts(key, upload_id, _chain([first, second], parts))
+        except BaseException:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+        return EncryptedObjectInfo(key=key, format=CHUNKED_FORMAT, encrypted_size=size, chunk_size=self.chunk_size)
+
+    def head(self, key: str) -> EncryptedObjectInfo:
+        response = self.client.head_object(Bucket=self.bucket, Key=key)
+        return _object_info(key, response)
+
+    def iter_chunks(self, key: str) -> Iterator[bytes]:
+        """Decrypted plaintext, one chunk at a time, straight off the GET stream."""
+        response = self.client.get_object(Bucket=self.bucket, Key=key)
+        info = _object_info(key, response)
+        body = response["Body"]
+        try:
+            if info.format == LEGACY_FORMAT:
+                yield self.fernet.decrypt(body.read())
+                return
+            while token := _read_exactly(body, info.chunk_token_size):
+                yield self.fernet.decrypt(token)
+        finally:
+            body.close()
+
+    def get(self, key: str) -> bytes:
+        return b"".join(self.iter_chunks(key))
+
+    def download(self, key: str, fileobj: BinaryIO) -> int:
+        written = 0
+        for chunk in self.iter_chunks(key):
+            fileobj.write(chunk)
+            written += len(chunk)
+        return written
+
+    def read_range(self, key: str, start: int, end: Optional[int] = None) -> bytes:
+        """Plaintext bytes ``start`` up to (not including) ``end``, fetching only the tokens that cover them."""
+        info = self.head(key)
+        if info.format == LEGACY_FORMAT:
+            return self.get(key)[start:end]
+        if end is not None and end <= start:
+            return b""
+        first_chunk = start // info.chunk_size
+        last_chunk = info.chunk_count - 1 if end is None else min((end - 1) // info.chunk_size, info.chunk_count - 1)
+        if first_chunk > last_chunk:
+            return b""
+        token_size = info.chunk_token_size
+        byte_range = f"bytes={first_chunk * token_size}-{min((last_chunk + 1) * token_size, info.encrypted_size) - 1}"
+        body = self.client.get_object(Bucket=self.bucket, Key=key, Range=byte_range)["Body"]
+        pieces = []
+        try:
+            while token := _read_exactly(body, token_size):
+                pieces.append(self.fernet.decrypt(token))
+        finally:
+            body.close()
+        offset = first_chunk * info.chunk_size
+        return b"".join(pieces)[start - offset : None if end is None else end - offset]
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def _encrypted_parts(self, source: Source) -> Iterator[bytes]:
+        tokens = []
+        for chunk in _iter_fixed_chunks(source, self.chunk_size):
+            tokens.append(self.fernet.encrypt(chunk))
+            if len(tokens) == self.chunks_per_part:
+                yield b"".join(tokens)
+                tokens = []
+        if tokens:
+            yield b"".join(tokens)
+
+    def _upload_parts(self, key: str, upload_id: str, parts: Iterator[bytes]) -> int:
+        completed = []
+        size = 0
+
+        def upload(part_number: int, body: bytes) -> dict:
+            response = self.client.upload_part(
+                Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=body
+            )
+            return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+        # encryption stays on this thread and at most max_workers parts are held in memory while they upload
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="encrypted-upload") as executor:
+            in_flight = set()
+            for part_number, body in enumerate(parts, start=1):
+                size += len(body)
+                in_flight.add(executor.submit(upload, part_number, body))
+                if len(in_flight) >= self.max_workers:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    completed.extend(f.result() for f in done)
+            completed.extend(f.result() for f in in_flight)
+
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": sorted(completed, key=lambda x: x["PartNumber"])},
+        )
+        logger.debug(f"Uploaded s3://{self.bucket}/{key} in {len(completed)} encrypted part(s)")
+        return size
+
+
+def _object_info(key: str, response: dict) -> EncryptedObjectInfo:
+    metadata = response.get("Metadata") or {}
+    if metadata.get(FORMAT_METADATA_KEY) == CHUNKED_FORMAT:
+        return EncryptedObjectInfo(
+            key=key,
+            format=CHUNKED_FORMAT,
+            encrypted_size=response["ContentLength"],
+            chunk_size=int(metadata[CHUNK_SIZE_METADATA_KEY]),
+        )
+    return EncryptedObjectInfo(key=key, format=LEGACY_FORMAT, encrypted_size=response["ContentLength"])
+
+
+def _iter_fixed_chunks(source: Source, size: int) -> Iterator[bytes]:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        for offset in range(0, len(source), size):
+            yield bytes(source[offset : offset + size])
+        return
+    if hasattr(source, "read"):
+        while chunk := _read_exactly(source, size):
+            yield chunk
+        return
+    # any iterable of byte strings, re-cut into fixed-size chunks
+    buffer = bytearray()
+    for piece in source:
+        buffer += piece
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+    if buffer:
+        yield bytes(buffer)
+
+
+def _read_exactly(stream, size: int) -> bytes:
+    # stream reads may come back short; keep reading until the chunk is full or the stream ends
+    data = stream.read(size)
+    if not data or len(data) == size:
+        return data
+    pieces = [data]
+    remaining = size - len(data)
+    while remaining and (more := stream.read(remaining)):
+        pieces.append(more)
+        remaining -= len(more)
+    return b"".join(pieces)
+
+
+def _chain(head: list, tail: Iterator) -> Iterator:
+    yield from head
+    yield from tail
+
+
+@st.cache_resource
+def get_encrypted_object_store() -> EncryptedObjectStore:
+    from misc_shared.auth_helpers import fernet
+    from misc_shared.storage import get_s3_client
+
+    return EncryptedObjectStore(get_s3_client(), st.secrets.app.private_bucket, fernet())
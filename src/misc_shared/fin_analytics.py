@@ -0,0 +1,190 @@
+from pathlib import Path
+from typing import IO, Iterable, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS = 252
+
+PriceSource = Union[str, Path, IO]
+
+
+def read_price_file(source: PriceSource, name: Optional[str] = None) -> pd.DataFrame:
+    """Read one CSV or Parquet price file into a wide frame: a DatetimeIndex and one float column per symbol.
+
+    Accepts long files (``date``, ``symbol``, ``close`` columns, any case; ``adj_close`` wins over ``close``) or
+    wide files (a ``date`` column plus one column per symbol). ``name`` gives the format for file-like sources.
+    """
+    name = str(name or getattr(source, "name", source))
+    frame = pd.read_parquet(source) if name.lower().endswith((".parquet", ".pq")) else pd.read_csv(source)
+    frame.columns = [str(c).strip().lower().replace(" ", "_") for c in frame.columns]
+    if "symbol" in frame.columns:
+        value = next((c for c in ("adj_close", "close", "price") if c in frame.columns), None)
+        if value is None:
+            raise ValueError(f"{name}: long price files need a close, adj_close or price column")
+        frame["symbol"] = frame["symbol"].astype(str).str.upper()
+        frame = frame.pivot_table(index="date", columns="symbol", values=value, aggfunc="last")
+    else:
+        frame = frame.set_index("date")
+        frame.columns = [c.upper() for c in frame.columns]
+    frame.index = pd.to_datetime(frame.index)
+    frame.columns.name = "symbol"
+    return frame.apply(pd.to_numeric, errors="coerce").astype("float64").sort_index()
+
+
+def load_prices(sources: Iterable[PriceSource]) -> pd.DataFrame:
+    frames = [read_price_file(source) for source in sources]
+    if not frames:
+        return pd.DataFrame(dtype="float64")
+    prices = pd.concat(frames, axis=1)
+    if prices.columns.duplicated().any():
+        # the same symbol in two files: keep the later file's value wherever it has one
+        prices = prices.T.groupby(level=0, sort=False).last().T
+    return prices.sort_index()
+
+
+def returns(prices: pd.DataFrame, log: bool = False) -> pd.DataFrame:
+    if log:
+        return np.log(prices).diff()
+    return prices.pct_change(fill_method=None)
+
+
+def rolling_volatility(daily_returns: pd.DataFrame, window: int = 21, annualize: bool = True) -> pd.DataFrame:
+    volatility = daily_returns.rolling(window, min_periods=window).std()
+    return volatility * np.sqrt(TRADING_DAYS) if annualize else volatility
+
+
+def drawdowns(prices: pd.DataFrame) -> pd.DataFrame:
+    return prices / prices.cummax() - 1.0
+
+
+def moving_averages(prices: pd.DataFrame, windows: Iterable[int] = (20, 50, 200)) -> pd.DataFrame:
+    # columns are (window, symbol), so ``result[50]`` is the 50 day average for every symbol
+    return pd.concat({window: prices.rolling(window, min_periods=window).mean() for window in windows}, axis=1)
+
+
+def price_chart(prices: pd.DataFrame, symbol: str, windows: Iterable[int] = (50, 200)) -> pd.DataFrame:
+    """One symbol's close next to its moving averages, as ``close`` and ``sma_<window>`` columns."""
+    history = prices[[symbol]].dropna()
+    averages = moving_averages(history, windows).xs(symbol, axis=1, level=1)
+    averages.columns = [f"sma_{window}" for window in averages.columns]
+    return pd.concat([history.rename(columns={symbol: "close"}), averages], axis=1)
+
+
+def summarize(prices: pd.DataFrame, risk_free_rate: float = 0.0, volatility_window: int = 21) -> pd.DataFrame:
+    """One row of screening metrics per symbol, computed column-wise over the whole price frame."""
+    daily = returns(prices)
+    values = prices.to_numpy()
+    observed = ~np.isnan(values)
+    first = _first_valid(values, observed)
+    last = _first_valid(values[::-1], observed[::-1])
+    periods = observed.sum(axis=0)
+    years = np.where(periods > 1, (periods - 1) / TRADING_DAYS, np.nan)
+
+    total_return = last / first - 1.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        annual_return = np.power(last / first, 1.0 / years) - 1.0
+    annual_volatility = daily.std().to_numpy() * np.sqrt(TRADING_DAYS)
+    excess = daily - risk_free_rate / TRADING_DAYS
+    downside = excess.where(excess < 0, 0.0).pow(2).mean().pow(0.5).to_numpy() * np.sqrt(TRADING_DAYS)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = excess.mean().to_numpy() * TRADING_DAYS / annual_volatility
+        sortino = excess.mean().to_numpy() * TRADING_DAYS / downside
+
+    # the screen only needs each window's latest value, so average the tail instead of rolling the whole history
+    filled = prices.ffill()
+    sma_50, sma_200 = (_tail_mean(filled, window) for window in (50, 200))
+    summary = pd.DataFrame(
+        {
+            "last_close": last,
+            "observations": periods,
+            "total_return": total_return,
+            "annual_return": annual_return,
+            "annual_volatility": annual_volatility,
+            "current_volatility": daily.iloc[-volatility_window:].std().to_numpy() * np.sqrt(TRADING_DAYS),
+            "sharpe": sharpe,
+            "sortino": sortino,
+            "max_drawdown": drawdowns(prices).min().to_numpy(),
+            "skew": daily.skew().to_numpy(),
+            "kurtosis": daily.kurt().to_numpy(),
+            "above_sma_200": last > sma_200,
+            "sma_50_over_200": sma_50 > sma_200,
+        },
+        index=prices.columns,
+    )
+    return summary.astype({"observations": "int64"})
+
+
+def _tail_mean(filled: pd.DataFrame, window: int) -> np.ndarray:
+    if len(filled) < window:
+        return np.full(filled.shape[1], np.nan)
+    return filled.iloc[-window:].mean(skipna=False).to_numpy()
+
+
+def _first_valid(values: np.ndarray, observed: np.ndarray) -> np.ndarray:
+    # first non-NaN value in each column, NaN for empty columns
+    if not values.size:
+        return np.full(values.shape[1], np.nan)
+    index = observed.argmax(axis=0)
+    found = values[index, np.arange(values.shape[1])]
+    return np.where(observed.any(axis=0), found, np.nan)
+
+
+def dcf_value(
+    free_cash_flow,
+    discount_rate,
+    growth_rate,
+    terminal_growth=0.02,
+    years: int = 10,
+):
+    """Present value of ``years`` of growing cash flows plus a Gordon-growth terminal value.
+
+    Every argument except ``years`` broadcasts, so one call values any mix of symbols and assumption grids. The
+    growth annuity uses its closed form rather than summing year by year.
+    """
+    fcf, r, g, tg = np.broadcast_arrays(*map(np.asarray, (free_cash_flow, discount_rate, growth_rate, terminal_growth)))
+    ratio = (1.0 + g) / (1.0 + r)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        annuity = np.where(np.isclose(ratio, 1.0), years, ratio * (1.0 - ratio**years) / (1.0 - ratio))
+        terminal = ratio**years * (1.0 + tg) / (r - tg)
+    value = fcf * (annuity + terminal)
+    # a terminal growth at or above the discount rate has no finite value
+    return np.where(r > tg, value, np.nan)
+
+
+def prepare_fundamentals(fundamentals: pd.DataFrame) -> pd.DataFrame:
+    fundamentals = fundamentals.copy()
+    fundamentals.columns = [str(c).strip().lower().replace(" ", "_") for c in fundamentals.columns]
+    if "symbol" in fundamentals.columns:
+        fundamentals = fundamentals.set_index("symbol")
+    fundamentals.index = fundamentals.index.astype(str).str.upper()
+    return fundamentals
+
+
+def valuation_table(
+    fundamentals: pd.DataFrame,
+    discount_rate: float = 0.10,
+    growth_rate: float = 0.04,
+    terminal_growth: float = 0.02,
+    years: int = 10,
+    last_close: Optional[pd.Series] = None,
+) -> pd.DataFrame:
+    """DCF per symbol from a frame with ``free_cash_flow`` and ``shares_outstanding`` (``net_debt`` optional)."""
+    fundamentals = prepare_fundamentals(fundamentals)
+    enterprise_value = dcf_value(
+        fundamentals["free_cash_flow"].to_numpy(dtype="float64"), discount_rate, growth_rate, terminal_growth, years
+    )
+    net_debt = fundamentals.get("net_debt", pd.Series(0.0, index=fundamentals.index)).to_numpy(dtype="float64")
+    equity_value = enterprise_value - np.nan_to_num(net_debt)
+    table = pd.DataFrame(
+        {
+            "enterprise_value": enterprise_value,
+            "equity_value": equity_value,
+            "value_per_share": equity_value / fundamentals["shares_outstanding"].to_numpy(dtype="float64"),
+        },
+        index=fundamentals.index,
+    )
+    if last_close is not None:
+        table["last_close"] = last_close.reindex(table.index)
+        table["upside"] = table["value_per_share"] / table["last_close"] - 1.0
+    return table
@@ -0,0 +1,331 @@
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Optional
+
+import streamlit as st
+from botocore.exceptions import ClientError
+from logzero import logger
+from pydantic import BaseModel
+
+from misc_shared.memory_cache import CachedMemory
+from misc_shared.models import JobRecord
+from misc_shared.storage import get_memory
+
+ACTIVE_STATUSES = ("queued", "running")
+# DynamoDB items top out at 400KB; leave room for the rest of the record
+MAX_RESULT_BYTES = 350_000
+
+
+class JobSettings(BaseModel):
+    # overridable from the [jobs] section of secrets.toml
+    max_workers: int = 4
+    ttl_seconds: int = 24 * 3600
+    flush_seconds: float = 1.0
+    stale_seconds: float = 300.0
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobSnapshot(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    done: int = 0
+    total: Optional[int] = None
+    message: str = ""
+    result: Any = None
+    error: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status not in ACTIVE_STATUSES
+
+    @property
+    def progress(self) -> Optional[float]:
+        return min(1.0, self.done / self.total) if self.total else None
+
+    @classmethod
+    def from_record(cls, record: JobRecord) -> "JobSnapshot":
+        return cls(
+            job_id=record.resource_id,
+            kind=record.kind,
+            status=record.status,
+            done=record.done,
+            total=record.total,
+            message=record.message,
+            result=json.loads(record.result) if record.result else None,
+            error=record.error,
+            updated_at=record.updated_at,
+        )
+
+
+def job_key(kind: str, params: dict) -> str:
+    return hashlib.sha256(
+        json.dumps({"kind": kind, "params": params}, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def fit_result(items: list, max_bytes: int = MAX_RESULT_BYTES) -> list:
+    """The longest leading slice of ``items`` whose JSON fits in ``max_bytes``, as a new list."""
+    size = 2
+    for i, item in enumerate(items):
+        size += len(json.dumps(item, default=str)) + 2
+        if size > max_bytes:
+            return items[:i]
+    return list(items)
+
+
+class JobContext:
+    """Handed to the job function: report progress (and a partial result), and stop when asked to."""
+
+    def __init__(self, runner: "JobRunner", job_id: str, kind: str):
+        self.job_id = job_id
+        self.kind = kind
+        self.cancel_event = threading.Event()
+        self._runner = runner
+        self._lock = threading.Lock()
+        self._snapshot = JobSnapshot(job_id=job_id, kind=kind, status="queued")
+        self._flushed_at = 0.0
+
+    @property
+    def snapshot(self) -> JobSnapshot:
+        return self._snapshot
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled(self.job_id)
+
+    def report(self, done: int, total: Optional[int] = None, message: str = "", partial: Any = None):
+        """Record progress; the in-process snapshot updates every call, the stored record at most every flush.
+
+        ``partial`` is read by pollers on other threads while the job carries on, so pass a copy the job won't
+        mutate, and keep it small: one that doesn't fit in the record is only visible in this process.
+        """
+        self._update(status="running", done=done, total=total, message=message, result=partial)
+        if time.monotonic() - self._flushed_at >= self._runner.settings.flush_seconds:
+            self.flush()
+        self.check_cancelled()
+
+    def flush(self):
+        self._flushed_at = time.monotonic()
+        if self._runner.save(self._snapshot).cancel_requested:
+            # cancelled from another process; only the stored record can tell us
+            self.cancel_event.set()
+
+    def _update(self, **changes):
+        with self._lock:
+            self._snapshot = self._snapshot.model_copy(update={**changes, "updated_at": datetime.now(timezone.utc)})
+
+
+class JobRunner:
+    """Background jobs on a thread pool, with state and results kept as ``JobRecord`` resources that expire by TTL.
+
+    A job is keyed on its kind and parameters, so submitting work that is already in flight (in this process, or in
+    another one whose record is still fresh) returns the existing job instead of starting a second copy; the record
+    is claimed with a conditional write, so two workers submitting at once can't both start it. A finished job,
+    failed or not, can be submitted again. Pollers in this process read the live snapshot; anything else (a
+    reconnect served by another worker) reads the record, which the job rewrites at most every ``flush_seconds``.
+    """
+
+    def __init__(self, memory, settings: Optional[JobSettings] = None):
+        self.memory = memory
+        self.settings = settings or JobSettings()
+        self._executor = ThreadPoolExecutor(max_workers=self.settings.max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._running: dict[str, tuple[JobContext, Future]] = {}
+
+    def submit(self, kind: str, fn: Callable[..., Any], params: Optional[dict] = None) -> str:
+        """Run ``fn(context, **params)`` in the background and return the job id."""
+        params = params or {}
+        job_id = job_key(kind, params)
+        with self._lock:
+            if job_id in self._running:
+                return job_id
+            context = JobContext(self, job_id, kind)
+            if not self._claim(context.snapshot, params):
+                logger.debug(f"Job {kind} {job_id[:12]} already running elsewhere")
+                return job_id
+            future = self._executor.submit(self._run, context, fn, params)
+            self._running[job_id] = (context, future)
+        logger.info(f"Submitted job {kind} {job_id[:12]}")
+        return job_id
+
+    def poll(self, job_id: str) -> Optional[JobSnapshot]:
+        if local := self._running.get(job_id):
+            return local[0].snapshot
+        record = self.memory.get_existing(job_id, JobRecord, consistent_read=True)
+        return JobSnapshot.from_record(record) if record else None
+
+    def cancel(self, job_id: str):
+        if local := self._running.get(job_id):
+            # a queued job sees the flag when it starts, so the record still ends up "cancelled"
+            local[0].cancel_event.set()
+            return
+        # only the flag is written, so a progress save landing at the same time can't be lost either
+        try:
+            self.memory.dynamodb_table.update_item(
+                Key=JobRecord.dynamodb_lookup_keys_from_id(job_id),
+                UpdateExpression="SET cancel_requested = :true",
+                ConditionExpression="#status IN (:queued, :running)",
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={":true": True, ":queued": "queued", ":running": "running"},
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                raise
+        finally:
+            self._invalidate(job_id)
+
+    def save(self, snapshot: JobSnapshot) -> JobRecord:
+        """Write the job's progress and return the stored record.
+
+        ``cancel_requested`` is never part of the write, so a ``cancel`` from another process can't be reverted by
+        it, and the returned record carries whatever flag is stored.
+        """
+        data = self._record_data(snapshot)
+        item = JobRecord.create_new({**data, "params": "{}"}, override_id=snapshot.job_id).to_dynamodb_item()
+        key = {"pk": item.pop("pk"), "sk": item.pop("sk")}
+        # only written if the record expired or was removed under a long job, which puts it back without the params
+        initial = {
+            name: item.pop(name) for name in ("resource_id", "created_at", "params", "gsitype", "cancel_requested")
+        }
+        names, values, assignments = {}, {}, []
+        for i, (name, value) in enumerate(item.items()):
+            names[f"#a{i}"], values[f":a{i}"] = name, value
+            assignments.append(f"#a{i} = :a{i}")
+        for i, (name, value) in enumerate(initial.items()):
+            names[f"#i{i}"], values[f":i{i}"] = name, value
+            assignments.append(f"#i{i} = if_not_exists(#i{i}, :i{i})")
+        expression = "SET " + ", ".join(assignments)
+        if removed := [name for name, value in data.items() if value is None]:
+            names.update({f"#r{i}": name for i, name in enumerate(removed)})
+            expression += " REMOVE " + ", ".join(f"#r{i}" for i in range(len(removed)))
+        try:
+            response = self.memory.dynamodb_table.update_item(
+                Key=key,
+                UpdateExpression=expression,
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+                ReturnValues="ALL_NEW",
+            )
+        finally:
+            self._invalidate(snapshot.job_id)
+        return JobRecord.from_dynamodb_item(response["Attributes"])
+
+    def _claim(self, snapshot: JobSnapshot, params: dict) -> bool:
+        """Write a fresh record unless an active, non-stale one exists; False when someone else holds the job."""
+        params_json = json.dumps(params, sort_keys=True, default=str)
+        record = JobRecord.create_new(
+            {**self._record_data(snapshot), "params": params_json}, override_id=snapshot.job_id
+        )
+        # a record nobody has touched in a while belongs to a worker that went away
+        stale_before = datetime.now(timezone.utc) - timedelta(seconds=self.settings.stale_seconds)
+        try:
+            self.memory.dynamodb_table.put_item(
+                Item=record.to_dynamodb_item(),
+                ConditionExpression="attribute_not_exists(pk) OR NOT #status IN (:queued, :running) "
+                "OR updated_at < :stale_before",
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={
+                    ":queued": "queued",
+                    ":running": "running",
+                    ":stale_before": stale_before.isoformat(),
+                },
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                raise
+            return False
+        finally:
+            self._invalidate(snapshot.job_id)
+        return True
+
+    def _invalidate(self, job_id: str):
+        if isinstance(self.memory, CachedMemory):
+            self.memory.invalidate(JobRecord, job_id)
+
+    def _record_data(self, snapshot: JobSnapshot) -> dict:
+        result = json.dumps(snapshot.result, default=str) if snapshot.result is not None else None
+        if result and len(result) > MAX_RESULT_BYTES:
+            if not snapshot.finished:
+                logger.warning(f"Partial result of job {snapshot.job_id[:12]} is {len(result)} bytes; not stored")
+                result = None
+            else:
+                raise ValueError(f"Job result is {len(result)} bytes; the limit is {MAX_RESULT_BYTES}")
+        return {
+            "kind": snapshot.kind,
+            "status": snapshot.status,
+            "done": snapshot.done,
+            "total": snapshot.total,
+            "message": snapshot.message,
+            "result": result,
+            "error": snapshot.error,
+            "ttl": int(time.time() + self.settings.ttl_seconds),
+        }
+
+    def _run(self, context: JobContext, fn: Callable[..., Any], params: dict):
+        try:
+            if context.cancelled:
+                raise JobCancelled(context.job_id)
+            context._update(status="running")
+            context.flush()
+            result = fn(context, **params)
+            context._update(status="succeeded", result=result)
+        except JobCancelled:
+            context._update(status="cancelled", message="Cancelled")
+        except Exception as e:
+            logger.exception(f"Job {context.kind} {context.job_id[:12]} failed")
+            context._update(status="failed", error=f"{type(e).__name__}: {e}")
+        try:
+            context.flush()
+        except Exception as e:
+            # most likely a result too big to store; record the failure without it
+            logger.exception(f"Failed saving final state of job {context.job_id[:12]}")
+            context._update(status="failed", result=None, error=f"{type(e).__name__}: {e}")
+            context.flush()
+        finally:
+            with self._lock:
+                self._running.pop(context.job_id, None)
+
+
+@st.cache_resource
+def get_job_runner() -> JobRunner:
+    settings = JobSettings.model_validate(dict(st.secrets.get("jobs", {})))
+    return JobRunner(get_memory(), settings)
+
+
+def render_job(
+    runner: JobRunner, job_id: str, render_result: Callable[[Any], None], poll_seconds: float = 1.0
+) -> Optional[JobSnapshot]:
+    """Progress, a cancel button and the (partial) result of a job, if there is one.
+
+    While the job is active this sleeps and reruns the script, so call it last on the page.
+    """
+    snapshot = runner.poll(job_id)
+    if snapshot is None:
+        return None
+    if not snapshot.finished:
+        st.progress(snapshot.progress or 0.0, text=snapshot.message or snapshot.status.title())
+        if st.button("Cancel", key=f"cancel-{job_id}"):
+            runner.cancel(job_id)
+    elif snapshot.status == "failed":
+        st.error(snapshot.error)
+    elif snapshot.status == "cancelled":
+        st.warning("Cancelled; showing what finished before that")
+    if snapshot.result is not None:
+        render_result(snapshot.result)
+    if not snapshot.finished:
+        time.sleep(poll_seconds)
+        st.rerun()
+    return snapshot
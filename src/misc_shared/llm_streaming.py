@@ -0,0 +1,96 @@
+import queue
+import threading
+import time
+from typing import Any, Iterable, Iterator, Optional
+
+_DONE = object()
+
+
+def openai_text_chunks(stream: Iterable[Any]) -> Iterator[str]:
+    for response in stream:
+        if response.choices and (content := response.choices[0].delta.content):
+            yield content
+
+
+class BufferedStreamRenderer:
+    """Consumes a text stream on a worker thread and renders it to a Streamlit placeholder on a fixed cadence.
+
+    Tokens are buffered in a list and joined only when a flush is due (every ``flush_interval`` seconds, or sooner
+    once ``flush_chars`` characters are waiting), so a long answer costs a few dozen markdown renders and websocket
+    deltas rather than one per token, and building the text stays linear.
+    """
+
+    def __init__(self, placeholder, flush_interval: float = 0.05, flush_chars: int = 2000, cursor: str = "▌"):
+        self.placeholder = placeholder
+        self.flush_interval = flush_interval
+        self.flush_chars = flush_chars
+        self.cursor = cursor
+        self.flushes = 0
+        self._worker: Optional[threading.Thread] = None
+
+    def render(self, chunks: Iterable[str]) -> str:
+        pending: "queue.SimpleQueue" = queue.SimpleQueue()
+        stop = threading.Event()
+
+        def consume():
+            try:
+                for text in chunks:
+                    if stop.is_set():
+                        break
+                    pending.put(text)
+            except Exception as e:
+                pending.put(e)
+            finally:
+                if stop.is_set() and hasattr(chunks, "close"):
+                    chunks.close()
+                pending.put(_DONE)
+
+        self._worker = threading.Thread(target=consume, name="llm-stream", daemon=True)
+        self._worker.start()
+
+        rendered = ""
+        buffered: list[str] = []
+        buffered_chars = 0
+        next_flush = time.monotonic() + self.flush_interval
+        try:
+            while True:
+                # with nothing buffered there is nothing to flush, so just wait for the next token
+                timeout = max(0.0, next_flush - time.monotonic()) if buffered else None
+                try:
+                    item = pending.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                if item:
+                    buffered.append(item)
+                    buffered_chars += len(item)
+                if buffered and (time.monotonic() >= next_flush or buffered_chars >= self.flush_chars):
+                    rendered += "".join(buffered)
+                    buffered.clear()
+                    buffered_chars = 0
+                    self._flush(rendered + self.cursor)
+                    next_flush = time.monotonic() + self.flush_interval
+        finally:
+            # a rerun or stop raises out of here; let the worker drop the rest of the stream
+            stop.set()
+        # the worker queued _DONE as its last act, so this only waits for it to return
+        self._worker.join()
+        rendered += "".join(buffered)
+        self._flush(rendered)
+        return rendered
+
+    def _flush(self, text: str):
+        self.placeholder.markdown(text)
+        self.flushes += 1
+
+
+def stream_to_placeholder(
+    chunks: Iterable[str],
+    placeholder,
+    flush_interval: float = 0.05,
+    flush_chars: int = 2000,
+) -> str:
+    return BufferedStreamRenderer(placeholder, flush_interval, flush_chars).render(chunks)
@@ -0,0 +1,296 @@
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+
+from logzero import logger
+from pydantic import BaseModel
+from simplesingletable import DynamoDBMemory, DynamodbResource
+
+_MISSING = object()
+
+
+class MemoryCacheSettings(BaseModel):
+    # overridable from the [memory_cache] section of secrets.toml
+    enabled: bool = True
+    max_entries: int = 2048
+    ttl_seconds: float = 60.0
+    disk_cache_dir: Optional[str] = None
+    disk_ttl_seconds: float = 600.0
+    write_behind: bool = False
+    flush_interval_seconds: float = 1.0
+
+
+class CacheStats(BaseModel):
+    hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    deferred_writes: int = 0
+    flushed_writes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.disk_hits + self.misses
+        return (self.hits + self.disk_hits) / lookups if lookups else 0.0
+
+
+class TtlLruCache:
+    """LRU cache whose entries also expire after ``ttl_seconds``; ``on_evict`` sees every value that leaves it."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float, on_evict: Optional[Callable[[Any], None]] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = _MISSING) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                expired = entry[1]
+            else:
+                self._entries.move_to_end(key)
+                return entry[1]
+        self._evicted([expired])
+        return default
+
+    def set(self, key: str, value: Any) -> int:
+        """Store ``value``; returns how many other entries were evicted to make room."""
+        dropped = []
+        with self._lock:
+            previous = self._entries.get(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                dropped.append(self._entries.popitem(last=False)[1][1])
+        evicted = len(dropped)
+        if previous is not None and previous[1] is not value:
+            dropped.append(previous[1])
+        self._evicted(dropped)
+        return evicted
+
+    def delete(self, key: str):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._evicted([entry[1]])
+
+    def clear(self):
+        with self._lock:
+            dropped = [value for _, value in self._entries.values()]
+            self._entries.clear()
+        self._evicted(dropped)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evicted(self, values: list):
+        # called outside the lock, so a slow callback never holds up other lookups
+        if self.on_evict:
+            for value in values:
+                self.on_evict(value)
+
+
+class CachedMemory:
+    """Read-through cache in front of a ``DynamoDBMemory``; anything not overridden here passes straight through.
+
+    Raw DynamoDB items are cached by their pk/sk rather than model instances, so every caller deserializes its own
+    copy (sessions get mutated in place) and resource classes built at runtime, like the session managers'
+    ``DbSession``, are keyed safely. Writes made through this object update the cache; writes from other
+    processes become visible after ``ttl_seconds``, and code that writes to ``dynamodb_table`` directly must call
+    ``invalidate``. Versioned resources and consistent reads bypass the cache.
+    """
+
+    def __init__(self, memory: DynamoDBMemory, settings: Optional[MemoryCacheSettings] = None):
+        self.memory = memory
+        self.settings = settings or MemoryCacheSettings()
+        self._lru = TtlLruCache(self.settings.max_entries, self.settings.ttl_seconds)
+        self._disk = None
+        if self.settings.disk_cache_dir:
+            import diskcache
+
+            self._disk = diskcache.Cache(self.settings.disk_cache_dir)
+        self._stats = CacheStats()
+        self._pending: Dict[str, dict] = {}
+        self._pending_lock = threading.Lock()
+        self._flush_wake = threading.Event()
+        if self.settings.write_behind:
+            threading.Thread(target=self._flush_loop, name="memory-write-behind", daemon=True).start()
+            atexit.register(self.flush)
+
+    def __getattr__(self, name):
+        # reads and table access; every public write method of DynamoDBMemory is overridden below
+        return getattr(self.memory, name)
+
+    def get_existing(
+        self,
+        existing_id: str,
+        data_class: Type[DynamodbResource],
+        version: int = 0,
+        consistent_read=False,
+    ) -> Optional[DynamodbResource]:
+        if not issubclass(data_class, DynamodbResource):
+            return self.memory.get_existing(existing_id, data_class, version, consistent_read=consistent_read)
+        key = data_class.dynamodb_lookup_keys_from_id(existing_id)
+        cache_key = _cache_key(key)
+        if consistent_read:
+            # read-before-conditional-write; callers writing straight to the table invalidate instead, so caching
+            # this would only put back the version they are about to replace
+            item = self.memory.dynamodb_table.get_item(Key=key, ConsistentRead=True).get("Item")
+        elif (item := self._lookup(cache_key)) is _MISSING:
+            self._stats.misses += 1
+            item = self.memory.dynamodb_table.get_item(Key=key).get("Item")
+            if item:
+                self._store(cache_key, item)
+        if item:
+            return data_class.from_dynamodb_item(item)
+
+    def read_existing(
+        self,
+        existing_id: str,
+        data_class: Type[DynamodbResource],
+        version: int = 0,
+        consistent_read=False,
+    ) -> DynamodbResource:
+        if not (item := self.get_existing(existing_id, data_class, version, consistent_read=consistent_read)):
+            raise ValueError("No item found with the provided key.")
+        return item
+
+    def create_new(self, data_class, data, override_id: Optional[str] = None):
+        resource = self.memory.create_new(data_class, data, override_id=override_id)
+        self._cache_resource(resource)
+        return resource
+
+    def update_existing(self, existing_resource, update_obj):
+        resource = self.memory.update_existing(existing_resource, update_obj)
+        self._cache_resource(resource)
+        return resource
+
+    def delete_existing(self, existing_resource: DynamodbResource):
+        key = existing_resource.dynamodb_lookup_keys_from_id(existing_resource.resource_id)
+        with self._pending_lock:
+            self._pending.pop(_cache_key(key), None)
+        self.memory.dynamodb_table.delete_item(Key=key)
+        self.invalidate(existing_resource.__class__, existing_resource.resource_id)
+
+    def increment_counter(self, existing_resource: DynamodbResource, field_name: str, incr_by: int = 1) -> int:
+        return self._update_in_place(existing_resource, self.memory.increment_counter, field_name, incr_by)
+
+    def add_to_set(self, existing_resource: DynamodbResource, field_name: str, val: str):
+        return self._update_in_place(existing_resource, self.memory.add_to_set, field_name, val)
+
+    def remove_from_set(self, existing_resource: DynamodbResource, field_name: str, val: str):
+        return self._update_in_place(existing_resource, self.memory.remove_from_set, field_name, val)
+
+    def _update_in_place(self, existing_resource: DynamodbResource, update, *args):
+        # these are UpdateItem calls against the stored item: land any deferred put of it first, so the flush
+        # can't overwrite the update later, and drop the cached copy the update makes stale
+        key = existing_resource.dynamodb_lookup_keys_from_id(existing_resource.resource_id)
+        with self._pending_lock:
+            pending = self._pending.pop(_cache_key(key), None)
+        if pending is not None:
+            self.memory.dynamodb_table.put_item(Item=pending)
+        try:
+            return update(existing_resource, *args)
+        finally:
+            self.invalidate(existing_resource.__class__, existing_resource.resource_id)
+
+    def put_deferred(self, resource: DynamodbResource):
+        """Cache ``resource`` now and write it in the next batch; repeated puts of one item coalesce."""
+        if not self.settings.write_behind:
+            self.memory.dynamodb_table.put_item(Item=resource.to_dynamodb_item())
+            self._cache_resource(resource)
+            return
+        item = resource.to_dynamodb_item()
+        cache_key = _cache_key(item)
+        self._store(cache_key, item)
+        with self._pending_lock:
+            self._pending[cache_key] = item
+        self._stats.deferred_writes += 1
+        if len(self._pending) >= 25:
+            self._flush_wake.set()
+
+    def flush(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            with self.memory.dynamodb_table.batch_writer(overwrite_by_pkeys=["pk", "sk"]) as batch:
+                for item in pending.values():
+                    batch.put_item(Item=item)
+        except Exception:
+            # put the batch back, without clobbering anything deferred again while we were writing
+            with self._pending_lock:
+                self._pending = {**pending, **self._pending}
+            raise
+        self._stats.flushed_writes += len(pending)
+        logger.debug(f"Flushed {len(pending)} deferred write(s)")
+
+    def get_cached_item(self, key: dict) -> Optional[dict]:
+        item = self._lookup(_cache_key(key))
+        if item is _MISSING:
+            self._stats.misses += 1
+            return None
+        return item
+
+    def cache_item(self, item: dict):
+        self._store(_cache_key(item), item)
+
+    def invalidate(self, data_class: Type[DynamodbResource], existing_id: str):
+        cache_key = _cache_key(data_class.dynamodb_lookup_keys_from_id(existing_id))
+        self._lru.delete(cache_key)
+        if self._disk is not None:
+            self._disk.delete(cache_key)
+        self._stats.invalidations += 1
+
+    def clear_cache(self):
+        self._lru.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def get_cache_stats(self) -> CacheStats:
+        return self._stats.model_copy()
+
+    def _lookup(self, cache_key: str) -> Any:
+        item = self._lru.get(cache_key)
+        if item is not _MISSING:
+            self._stats.hits += 1
+            return item
+        if self._disk is not None:
+            item = self._disk.get(cache_key, default=_MISSING)
+            if item is not _MISSING:
+                self._stats.disk_hits += 1
+                self._stats.evictions += self._lru.set(cache_key, item)
+                return item
+        return _MISSING
+
+    def _store(self, cache_key: str, item: dict):
+        self._stats.evictions += self._lru.set(cache_key, item)
+        if self._disk is not None:
+            self._disk.set(cache_key, item, expire=self.settings.disk_ttl_seconds)
+
+    def _cache_resource(self, resource):
+        if isinstance(resource, DynamodbResource):
+            item = resource.to_dynamodb_item()
+            self._store(_cache_key(item), item)
+
+    def _flush_loop(self):
+        while True:
+            self._flush_wake.wait(timeout=self.settings.flush_interval_seconds)
+            self._flush_wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Write-behind flush failed")
+
+
+def _cache_key(key: dict) -> str:
+    return f"{key['pk']}|{key['sk']}"
@@ -0,0 +1,239 @@
+import functools
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from pydantic import BaseModel
+
+# log-spaced latency buckets, 8 per doubling starting at 1µs, so reported percentiles are within ~5% of exact
+MIN_SECONDS = 1e-6
+BUCKETS_PER_DOUBLING = 8
+BUCKET_COUNT = 30 * BUCKETS_PER_DOUBLING + 2
+
+
+class MetricsSettings(BaseModel):
+    # overridable from the [metrics] section of secrets.toml
+    enabled: bool = True
+    export_path: str = "~/.cache/misc/metrics.jsonl"
+
+
+class MetricSummary(BaseModel):
+    name: str
+    count: int
+    errors: int
+    total_seconds: float
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    bytes_total: int
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; recording is a log, an index and a few increments under a lock."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.buckets = [0] * BUCKET_COUNT
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes_total = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, nbytes: int = 0, error: bool = False):
+        if seconds <= MIN_SECONDS:
+            index = 0
+        else:
+            index = min(BUCKET_COUNT - 1, int(math.log2(seconds / MIN_SECONDS) * BUCKETS_PER_DOUBLING) + 1)
+        with self._lock:
+            self.buckets[index] += 1
+            self.count += 1
+            self.total_seconds += seconds
+            self.bytes_total += nbytes
+            if seconds > self.max_seconds:
+                self.max_seconds = seconds
+            if error:
+                self.errors += 1
+
+    def quantile(self, q: float) -> float:
+        with self._lock:
+            buckets, count, max_seconds = list(self.buckets), self.count, self.max_seconds
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(buckets):
+            seen += bucket_count
+            if seen >= rank:
+                # upper edge of the bucket, never above the largest value actually seen
+                return min(MIN_SECONDS * 2 ** (index / BUCKETS_PER_DOUBLING), max_seconds)
+        return max_seconds
+
+    def summary(self) -> MetricSummary:
+        count = self.count
+        return MetricSummary(
+            name=self.name,
+            count=count,
+            errors=self.errors,
+            total_seconds=self.total_seconds,
+            mean_ms=self.total_seconds / count * 1000 if count else 0.0,
+            p50_ms=self.quantile(0.50) * 1000,
+            p95_ms=self.quantile(0.95) * 1000,
+            p99_ms=self.quantile(0.99) * 1000,
+            max_ms=self.max_seconds * 1000,
+            bytes_total=self.bytes_total,
+        )
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.started_at = datetime.now(timezone.utc)
+        self._histograms: dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str) -> Histogram:
+        if (histogram := self._histograms.get(name)) is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram(name))
+        return histogram
+
+    def record(self, name: str, seconds: float, nbytes: int = 0, error: bool = False):
+        if self.enabled:
+            self.histogram(name).record(seconds, nbytes, error)
+
+    @contextmanager
+    def timer(self, name: str):
+        """Time the block; the yielded dict takes ``bytes`` for payload size. Exceptions count as errors."""
+        extra = {"bytes": 0}
+        started = time.perf_counter()
+        error = False
+        try:
+            yield extra
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.record(name, time.perf_counter() - started, extra["bytes"], error)
+
+    def timed(self, name: str):
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def timed_stream(self, name: str, chunks: Iterable[str]) -> Iterator[str]:
+        """Pass ``chunks`` through, recording time to the first chunk and to the end, with the text size."""
+        started = time.perf_counter()
+        nbytes = 0
+        first = True
+        error = False
+        try:
+            for chunk in chunks:
+                if first:
+                    self.record(f"{name}.first_chunk", time.perf_counter() - started)
+                    first = False
+                nbytes += len(chunk.encode())
+                yield chunk
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.record(name, time.perf_counter() - started, nbytes, error)
+
+    def summaries(self) -> list[MetricSummary]:
+        return [h.summary() for _, h in sorted(self._histograms.items())]
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self.started_at = datetime.now(timezone.utc)
+
+    def export(self, path: str | Path) -> Path:
+        """Append the current summaries to ``path`` as one JSON line."""
+        path = Path(path).expanduser()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        record = {
+            "exported_at": datetime.now(timezone.utc).isoformat(),
+            "since": self.started_at.isoformat(),
+            "metrics": [x.model_dump() for x in self.summaries()],
+        }
+        with path.open("a") as f:
+            f.write(json.dumps(record) + "\n")
+        return path
+
+
+# one registry per process, shared by every session and background thread
+metrics = MetricsRegistry()
+
+
+def instrument_boto_client(client, registry: MetricsRegistry = metrics):
+    """Time every API call made through ``client`` as ``<service>.<Operation>``, with request and response bytes.
+
+    Hooks botocore's before-call / after-call events, so retries are inside the measured time and nothing at the
+    call sites changes. Safe to call more than once per client.
+    """
+    if getattr(client.meta, "_misc_instrumented", False):
+        return client
+    client.meta._misc_instrumented = True
+    events = client.meta.events
+    service = client.meta.service_model.service_name
+
+    def before_call(model, params, context, **kwargs):
+        # ``params`` is the serialized request here: the body is bytes, or a BytesIO for S3 uploads
+        body = params.get("body")
+        if isinstance(body, (bytes, bytearray, str)):
+            size = len(body)
+        elif hasattr(body, "getbuffer"):
+            size = body.getbuffer().nbytes
+        else:
+            size = int(params.get("headers", {}).get("Content-Length") or 0)
+        context["metrics_started"] = time.perf_counter()
+        context["metrics_request_bytes"] = size
+
+    def after_call(model, http_response, context, **kwargs):
+        started = context.get("metrics_started")
+        if started is None:
+            return
+        response_bytes = int(http_response.headers.get("content-length") or 0) if http_response is not None else 0
+        registry.record(
+            f"{service}.{model.name}",
+            time.perf_counter() - started,
+            context.get("metrics_request_bytes", 0) + response_bytes,
+            error=http_response is None or http_response.status_code >= 400,
+        )
+
+    def after_call_error(model, context, **kwargs):
+        if (started := context.get("metrics_started")) is not None:
+            registry.record(f"{service}.{model.name}", time.perf_counter() - started, error=True)
+
+    events.register("before-call", before_call)
+    events.register("after-call", after_call)
+    events.register("after-call-error", after_call_error)
+    return client
+
+
+def get_metrics_settings() -> MetricsSettings:
+    import streamlit as st
+
+    return MetricsSettings.model_validate(dict(st.secrets.get("metrics", {})))
+
+
+def summaries_frame(summaries: Optional[list[MetricSummary]] = None):
+    import pandas as pd
+
+    summaries = metrics.summaries() if summaries is None else summaries
+    return pd.DataFrame([x.model_dump() for x in summaries]).set_index("name") if summaries else pd.DataFrame()
@@ -0,0 +1,144 @@
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Optional
+
+import streamlit as st
+from logzero import logger
+from pydantic import BaseModel
+
+# longest matching prefix wins; the models endpoint doesn't report context sizes
+CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 4096,
+    "gpt-3.5-turbo-16k": 16385,
+    "gpt-3.5-turbo-1106": 16385,
+    "gpt-3.5-turbo-0125": 16385,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-1106": 128000,
+    "gpt-4-0125": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4-vision": 128000,
+    "gpt-4o": 128000,
+}
+
+# served until the first refresh succeeds, so a page never waits on (or breaks because of) the models endpoint
+FALLBACK_MODELS = ["gpt-3.5-turbo", "gpt-3.5-turbo-1106", "gpt-4", "gpt-4-1106-preview"]
+
+
+class ModelInfo(BaseModel):
+    id: str
+    owned_by: Optional[str] = None
+    created: Optional[datetime] = None
+    context_window: Optional[int] = None
+
+
+class CatalogStatus(BaseModel):
+    refreshed_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+    using_fallback: bool = True
+
+
+class ModelCatalogSettings(BaseModel):
+    # overridable from the [model_catalog] section of secrets.toml
+    refresh_seconds: float = 3600.0
+    retry_seconds: float = 60.0
+    id_filter: str = "gpt"
+
+
+def context_window_for(model_id: str) -> Optional[int]:
+    matches = [prefix for prefix in CONTEXT_WINDOWS if model_id.startswith(prefix)]
+    return CONTEXT_WINDOWS[max(matches, key=len)] if matches else None
+
+
+class ModelCatalog:
+    """Model list kept fresh by a background thread.
+
+    Readers only ever see the current snapshot: the built-in fallback list until the first refresh lands, then the
+    last list fetched successfully. A failed refresh keeps the previous list and retries after ``retry_seconds``.
+    """
+
+    def __init__(
+        self,
+        list_models: Callable[[], Iterable],
+        settings: Optional[ModelCatalogSettings] = None,
+        start: bool = True,
+    ):
+        self.list_models = list_models
+        self.settings = settings or ModelCatalogSettings()
+        self._models = {x: ModelInfo(id=x, context_window=context_window_for(x)) for x in FALLBACK_MODELS}
+        self._status = CatalogStatus()
+        self._wake = threading.Event()
+        self._refreshed = threading.Event()
+        if start:
+            threading.Thread(target=self._run, name="model-catalog", daemon=True).start()
+
+    def model_ids(self) -> list[str]:
+        return sorted(self._models)
+
+    def get(self, model_id: str) -> Optional[ModelInfo]:
+        return self._models.get(model_id)
+
+    def context_window(self, model_id: str) -> Optional[int]:
+        if info := self._models.get(model_id):
+            return info.context_window
+        return context_window_for(model_id)
+
+    def status(self) -> CatalogStatus:
+        return self._status.model_copy()
+
+    def request_refresh(self):
+        self._wake.set()
+
+    def wait_until_refreshed(self, timeout: Optional[float] = None) -> bool:
+        return self._refreshed.wait(timeout)
+
+    def refresh(self):
+        models = {}
+        for model in self.list_models():
+            if self.settings.id_filter not in model.id:
+                continue
+            created = getattr(model, "created", None)
+            models[model.id] = ModelInfo(
+                id=model.id,
+                owned_by=getattr(model, "owned_by", None),
+                created=datetime.fromtimestamp(created, timezone.utc) if created else None,
+                context_window=context_window_for(model.id),
+            )
+        if not models:
+            raise ValueError("Model list came back empty")
+        # swap in the whole dict at once; readers never see a half-built catalog
+        self._models = models
+        self._status = CatalogStatus(refreshed_at=datetime.now(timezone.utc), using_fallback=False)
+        self._refreshed.set()
+        logger.info(f"Model catalog refreshed with {len(models)} model(s)")
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+                delay = self.settings.refresh_seconds
+            except Exception as e:
+                logger.exception("Model catalog refresh failed; keeping the last known list")
+                self._status = self._status.model_copy(update={"last_error": str(e)})
+                delay = self.settings.retry_seconds
+            self._wake.wait(timeout=delay)
+            self._wake.clear()
+
+
+def _list_openai_models():
+    import openai
+
+    return openai.models.list()
+
+
+@st.cache_resource
+def get_model_catalog() -> ModelCatalog:
+    settings = ModelCatalogSettings.model_validate(dict(st.secrets.get("model_catalog", {})))
+    return ModelCatalog(_list_openai_models, settings)
+
+
+def start_model_catalog():
+    try:
+        get_model_catalog()
+    except Exception:
+        logger.exception("Model catalog failed to start")
@@ -1,5 +1,52 @@
+from typing import Optional
+
 from simplesingletable import DynamodbResource
 
 
 class Example(DynamodbResource):
     name: str
+
+
+class AuthUserRecord(DynamodbResource):
+    # resource_id is the lowercased username; payload is the Fernet-encrypted user JSON
+    encrypted: str
+    # bumped on every write; updates are conditional on the revision that was read
+    revision: int = 0
+
+
+class AuthMetaRecord(DynamodbResource):
+    # cookie name / signing key / preauthorized list shared by every user record
+    encrypted: str
+    # bumped on every write; updates are conditional on the revision that was read
+    revision: int = 0
+
+
+class CachedCompletion(DynamodbResource):
+    # resource_id is the completion cache key (sha256 of model, normalized history and sampling params)
+    model: str
+    content: str
+    # epoch seconds; stored as the table's ttl attribute
+    ttl: Optional[int] = None
+
+
+class JobRecord(DynamodbResource):
+    # resource_id is the job key: a hash of the kind and its parameters, so identical submissions share a record
+    kind: str
+    params: str
+    status: str = "queued"
+    done: int = 0
+    total: Optional[int] = None
+    message: str = ""
+    # JSON; partial while the job runs, final once it succeeds
+    result: Optional[str] = None
+    error: Optional[str] = None
+    cancel_requested: bool = False
+    # epoch seconds; stored as the table's ttl attribute
+    ttl: Optional[int] = None
+
+
+class ChatSearchMeta(DynamodbResource):
+    # resource_id is the lowercased username; segments are [{"id": ..., "docs": ...}], oldest first
+    segments: list[dict] = []
+    # bumped on every write; writes are conditional on the revision that was read
+    revision: int = 0
@@ -0,0 +1,214 @@
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Optional
+
+import bcrypt
+import streamlit as st
+from logzero import logger
+from pydantic import BaseModel
+
+from misc_shared.metrics import metrics
+
+
+class VerifierSettings(BaseModel):
+    # overridable from the [password_verifier] section of secrets.toml; workers defaults to the core count
+    workers: Optional[int] = None
+    max_pending: Optional[int] = None
+    timeout_seconds: float = 15.0
+    user_failures: int = 5
+    ip_failures: int = 20
+    window_seconds: float = 300.0
+    verified_ttl_seconds: float = 600.0
+
+
+class VerifierStatus(BaseModel):
+    workers: int
+    in_flight: int
+    max_pending: int
+    verified_cached: int
+    throttled_keys: int
+
+
+class VerificationUnavailable(RuntimeError):
+    pass
+
+
+class LoginThrottled(VerificationUnavailable):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Too many failed logins; try again in {int(retry_after) + 1}s")
+        self.retry_after = retry_after
+
+
+class VerifierBusy(VerificationUnavailable):
+    def __init__(self):
+        super().__init__("Login is busy right now; try again in a moment")
+
+
+def _checkpw(password: bytes, hashed: bytes) -> tuple[bool, float]:
+    # runs in a pool worker; the start time lets the caller split queue wait from hashing time
+    started = time.time()
+    return bcrypt.checkpw(password, hashed), started
+
+
+class FailureWindow:
+    """Failed attempts per key over a sliding window; a key with ``limit`` failures in the window is blocked."""
+
+    def __init__(self, limit: int, window_seconds: float):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self._failures: dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def retry_after(self, key: str) -> float:
+        with self._lock:
+            failures = self._prune(key)
+            if len(failures) < self.limit:
+                return 0.0
+            return failures[0] + self.window_seconds - time.monotonic()
+
+    def fail(self, key: str):
+        with self._lock:
+            self._failures.setdefault(key, deque()).append(time.monotonic())
+            self._prune(key)
+
+    def clear(self, key: str):
+        with self._lock:
+            self._failures.pop(key, None)
+
+    def __len__(self):
+        return len(self._failures)
+
+    def _prune(self, key: str) -> deque:
+        failures = self._failures.get(key, deque())
+        cutoff = time.monotonic() - self.window_seconds
+        while failures and failures[0] < cutoff:
+            failures.popleft()
+        if not failures:
+            self._failures.pop(key, None)
+        return failures
+
+
+class PasswordVerifier:
+    """bcrypt checks in a bounded process pool, so a login burst uses every core and never the script thread's GIL.
+
+    Failed attempts are throttled per username and per client IP. A successful check is remembered for
+    ``verified_ttl_seconds`` as an HMAC of the username, password and stored hash under a per-process key, so a
+    repeat login with the same credentials skips bcrypt and a password change invalidates it. Submissions beyond
+    ``max_pending`` in flight are refused with ``VerifierBusy`` rather than queued without bound.
+    """
+
+    def __init__(self, settings: VerifierSettings):
+        self.settings = settings
+        self.workers = settings.workers or os.cpu_count() or 1
+        self.max_pending = settings.max_pending or self.workers * 4
+        self.user_failures = FailureWindow(settings.user_failures, settings.window_seconds)
+        self.ip_failures = FailureWindow(settings.ip_failures, settings.window_seconds)
+        self._verified: dict[bytes, float] = {}
+        self._digest_key = secrets.token_bytes(32)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def verify(self, username: str, password: str, hashed: str, ip: Optional[str] = None) -> bool:
+        username = username.lower()
+        self._check_throttle(username, ip)
+        digest = hmac.new(self._digest_key, "\0".join((username, password, hashed)).encode(), hashlib.sha256).digest()
+        if self._verified.get(digest, 0.0) > time.monotonic():
+            metrics.record("auth.verify_fast_path", 0.0)
+            return True
+
+        ok = self._run_check(password.encode(), hashed.encode())
+        if ok:
+            self.user_failures.clear(username)
+            with self._lock:
+                now = time.monotonic()
+                self._verified = {k: v for k, v in self._verified.items() if v > now}
+                self._verified[digest] = now + self.settings.verified_ttl_seconds
+        else:
+            self.user_failures.fail(username)
+            if ip:
+                self.ip_failures.fail(ip)
+        return ok
+
+    def reject_unknown_user(self, username: str, ip: Optional[str] = None):
+        """Record a login attempt for a username that doesn't exist, throttled like a wrong password."""
+        username = username.lower()
+        self._check_throttle(username, ip)
+        self.user_failures.fail(username)
+        if ip:
+            self.ip_failures.fail(ip)
+
+    def status(self) -> VerifierStatus:
+        return VerifierStatus(
+            workers=self.workers,
+            in_flight=self._in_flight,
+            max_pending=self.max_pending,
+            verified_cached=len(self._verified),
+            throttled_keys=len(self.user_failures) + len(self.ip_failures),
+        )
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _check_throttle(self, username: str, ip: Optional[str]):
+        retry_after = max(self.user_failures.retry_after(username), self.ip_failures.retry_after(ip) if ip else 0.0)
+        if retry_after > 0:
+            logger.warning(f"Login throttled for {username} from {ip or 'unknown ip'}")
+            raise LoginThrottled(retry_after)
+
+    def _run_check(self, password: bytes, hashed: bytes) -> bool:
+        with self._lock:
+            if self._in_flight >= self.max_pending:
+                metrics.record("auth.verify_rejected", 0.0, error=True)
+                raise VerifierBusy()
+            self._in_flight += 1
+            if self._executor is None:
+                # forking a process full of Streamlit threads is not safe; spawned workers start clean
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            executor = self._executor
+        submitted = time.time()
+        try:
+            with metrics.timer("auth.verify_password"):
+                ok, started = executor.submit(_checkpw, password, hashed).result(timeout=self.settings.timeout_seconds)
+        except FutureTimeout:
+            raise VerifierBusy()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        metrics.record("auth.verify_queue_wait", max(0.0, started - submitted))
+        return ok
+
+
+def client_ip() -> Optional[str]:
+    """Best-effort address of the browser behind the current script run; the first X-Forwarded-For hop if proxied."""
+    try:
+        from streamlit.runtime import get_instance
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        request = get_instance().get_client(get_script_run_ctx().session_id).request
+    except Exception:
+        return None
+    forwarded = request.headers.get("X-Forwarded-For")
+    return forwarded.split(",")[0].strip() if forwarded else request.remote_ip
+
+
+def get_verifier_settings() -> VerifierSettings:
+    return VerifierSettings.model_validate(dict(st.secrets.get("password_verifier", {})))
+
+
+@st.cache_resource
+def get_password_verifier() -> PasswordVerifier:
+    return PasswordVerifier(get_verifier_settings())
@@ -0,0 +1,179 @@
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Iterable, Optional
+from urllib.parse import quote
+
+import pandas as pd
+import streamlit as st
+from pydantic import BaseModel
+
+INDEX_FILE = "_index.json"
+
+
+class PriceStoreSettings(BaseModel):
+    # overridable from the [price_store] section of secrets.toml
+    root: str = "~/.cache/misc/prices"
+
+
+class SymbolCoverage(BaseModel):
+    first: str
+    last: str
+    # year -> rows in that year's file
+    years: dict[int, int]
+
+    @property
+    def rows(self) -> int:
+        return sum(self.years.values())
+
+
+class PriceStore:
+    """Daily bars on local disk, one small Parquet file per symbol per year plus a JSON symbol index.
+
+    ``<root>/<symbol>/<year>.parquet`` holds that year's bars sorted by date, so reading a date range touches only
+    the years it overlaps, and appending new bars rewrites only the (at most 252 row) files they land in. The index
+    records each symbol's coverage, so listing symbols or finding where to resume a download reads no bar data.
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root).expanduser()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._index = self._load_index()
+
+    def symbols(self) -> list[str]:
+        return sorted(self._index)
+
+    def coverage(self, symbol: str) -> Optional[SymbolCoverage]:
+        return self._index.get(symbol.upper())
+
+    def coverage_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            [
+                {"symbol": symbol, "first": c.first, "last": c.last, "rows": c.rows}
+                for symbol, c in sorted(self._index.items())
+            ],
+            columns=["symbol", "first", "last", "rows"],
+        ).set_index("symbol")
+
+    def append(self, bars: pd.DataFrame) -> int:
+        """Merge long-format bars (``date``, ``symbol`` and any value columns) into the store.
+
+        Bars for dates already stored replace the stored ones. Returns the number of files written.
+        """
+        bars = bars.copy()
+        bars["date"] = pd.to_datetime(bars["date"]).dt.normalize()
+        bars["symbol"] = bars["symbol"].astype(str).str.upper()
+        written = 0
+        with self._lock:
+            for (symbol, year), group in bars.groupby(["symbol", bars["date"].dt.year], sort=False):
+                path = self._path(symbol, year)
+                group = group.drop(columns="symbol")
+                if path.exists():
+                    group = pd.concat([pd.read_parquet(path), group])
+                group = group.drop_duplicates("date", keep="last").sort_values("date").reset_index(drop=True)
+                _write_atomic(path, group)
+                self._update_index(symbol, year, group)
+                written += 1
+            self._save_index()
+        return written
+
+    def append_wide(self, prices: pd.DataFrame, value_name: str = "close") -> int:
+        stacked = prices.rename_axis(index="date", columns="symbol").stack().rename(value_name).reset_index()
+        return self.append(stacked)
+
+    def read(
+        self,
+        symbol: str,
+        start: Optional[str | pd.Timestamp] = None,
+        end: Optional[str | pd.Timestamp] = None,
+        columns: Optional[list[str]] = None,
+    ) -> pd.DataFrame:
+        symbol = symbol.upper()
+        coverage = self._index.get(symbol)
+        if coverage is None:
+            raise KeyError(f"No stored prices for {symbol}")
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+        years = [
+            y for y in sorted(coverage.years) if (start is None or y >= start.year) and (end is None or y <= end.year)
+        ]
+        filters = []
+        if start is not None:
+            filters.append(("date", ">=", start))
+        if end is not None:
+            filters.append(("date", "<=", end))
+        frames = [
+            pd.read_parquet(
+                self._path(symbol, year),
+                columns=["date", *columns] if columns else None,
+                filters=filters or None,
+            )
+            for year in years
+        ]
+        if not frames:
+            return pd.DataFrame(columns=columns or []).rename_axis("date")
+        return pd.concat(frames, ignore_index=True).set_index("date")
+
+    def read_many(
+        self,
+        symbols: Iterable[str],
+        start: Optional[str | pd.Timestamp] = None,
+        end: Optional[str | pd.Timestamp] = None,
+        field: str = "close",
+    ) -> pd.DataFrame:
+        """One ``field`` for many symbols as a wide frame, the shape ``fin_analytics`` works on."""
+        series = {symbol.upper(): self.read(symbol, start, end, columns=[field])[field] for symbol in symbols}
+        if not series:
+            return pd.DataFrame(dtype="float64")
+        return pd.DataFrame(series).rename_axis(columns="symbol").sort_index()
+
+    def _path(self, symbol: str, year: int) -> Path:
+        return self.root / quote(symbol, safe="") / f"{year}.parquet"
+
+    def _update_index(self, symbol: str, year: int, year_bars: pd.DataFrame):
+        first, last = f"{year_bars['date'].iloc[0]:%Y-%m-%d}", f"{year_bars['date'].iloc[-1]:%Y-%m-%d}"
+        if (coverage := self._index.get(symbol)) is None:
+            coverage = self._index[symbol] = SymbolCoverage(first=first, last=last, years={})
+        # appends only add or replace dates, so coverage can only widen
+        coverage.first = min(coverage.first, first)
+        coverage.last = max(coverage.last, last)
+        coverage.years[year] = len(year_bars)
+
+    def _load_index(self) -> dict[str, SymbolCoverage]:
+        path = self.root / INDEX_FILE
+        if not path.exists():
+            return {}
+        return {symbol: SymbolCoverage.model_validate(c) for symbol, c in json.loads(path.read_text()).items()}
+
+    def _save_index(self):
+        data = json.dumps({symbol: c.model_dump() for symbol, c in self._index.items()})
+        fd, temp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(data)
+            os.replace(temp_path, self.root / INDEX_FILE)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+def _write_atomic(path: Path, frame: pd.DataFrame):
+    # readers never see a half-written file; os.replace is atomic on the same filesystem
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    os.close(fd)
+    try:
+        frame.to_parquet(temp_path, index=False)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+@st.cache_resource
+def get_price_store() -> PriceStore:
+    settings = PriceStoreSettings.model_validate(dict(st.secrets.get("price_store", {})))
+    return PriceStore(settings.root)
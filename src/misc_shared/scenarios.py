@@ -0,0 +1,176 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Literal, Optional
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+from scipy import stats
+from scipy.stats import qmc
+
+from misc_shared.fin_analytics import dcf_value, prepare_fundamentals
+
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+SamplingMethod = Literal["latin_hypercube", "sobol", "random"]
+
+
+class ScenarioRanges(BaseModel):
+    # each assumption is drawn uniformly from its (low, high) range
+    discount_rate: tuple[float, float] = (0.07, 0.12)
+    growth_rate: tuple[float, float] = (0.0, 0.08)
+    terminal_growth: tuple[float, float] = (0.01, 0.03)
+
+
+class ScenarioDraws(BaseModel, arbitrary_types_allowed=True):
+    discount_rate: np.ndarray
+    growth_rate: np.ndarray
+    terminal_growth: np.ndarray
+
+    def __len__(self):
+        return len(self.discount_rate)
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.model_dump())
+
+
+def draw_scenarios(
+    ranges: ScenarioRanges, count: int, method: SamplingMethod = "latin_hypercube", seed: Optional[int] = None
+) -> ScenarioDraws:
+    names = list(ScenarioRanges.model_fields)
+    if method == "random":
+        unit = np.random.default_rng(seed).random((count, len(names)))
+    elif method == "sobol":
+        # Sobol points come in powers of two; draw the next one up and keep the first ``count``
+        unit = qmc.Sobol(len(names), seed=seed).random_base2(max(0, int(np.ceil(np.log2(max(count, 1))))))[:count]
+    else:
+        unit = qmc.LatinHypercube(len(names), seed=seed).random(count)
+    bounds = np.array([getattr(ranges, name) for name in names])
+    # plain arithmetic rather than qmc.scale, which rejects a fixed assumption (low == high)
+    scaled = bounds[:, 0] + unit * (bounds[:, 1] - bounds[:, 0])
+    return ScenarioDraws(**{name: scaled[:, i] for i, name in enumerate(names)})
+
+
+def _multiplier_chunk(args) -> np.ndarray:
+    discount_rate, growth_rate, terminal_growth, years = args
+    return dcf_value(1.0, discount_rate, growth_rate, terminal_growth, years)
+
+
+def dcf_multipliers(
+    draws: ScenarioDraws,
+    years: int = 10,
+    processes: Optional[int] = None,
+    chunk_size: int = 1_000_000,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> np.ndarray:
+    """Value of one unit of free cash flow under every scenario.
+
+    A DCF is linear in the cash flow, so this array is all a Monte-Carlo run needs: each symbol's values are an
+    affine map of it. Large draws can be split across a process pool in ``chunk_size`` slices; ``progress`` is
+    called with (chunks done, chunk count) as they finish.
+    """
+    chunks = [
+        (
+            draws.discount_rate[i : i + chunk_size],
+            draws.growth_rate[i : i + chunk_size],
+            draws.terminal_growth[i : i + chunk_size],
+            years,
+        )
+        for i in range(0, len(draws), chunk_size)
+    ]
+    if not chunks:
+        return np.empty(0)
+    results = []
+    if processes and processes > 1 and len(chunks) > 1:
+        # this runs on a job thread inside the server; forking a process full of threads is not safe
+        with ProcessPoolExecutor(
+            max_workers=min(processes, len(chunks)), mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            for result in executor.map(_multiplier_chunk, chunks):
+                results.append(result)
+                if progress:
+                    progress(len(results), len(chunks))
+        return np.concatenate(results)
+    for chunk in chunks:
+        results.append(_multiplier_chunk(chunk))
+        if progress:
+            progress(len(results), len(chunks))
+    return np.concatenate(results)
+
+
+def percentile_bands(
+    fundamentals: pd.DataFrame, multipliers: np.ndarray, percentiles=DEFAULT_PERCENTILES
+) -> pd.DataFrame:
+    """Per-share value percentiles for every symbol in ``fundamentals``.
+
+    Per-share value is ``(fcf * m - net_debt) / shares``, monotonic in ``m``, so each symbol's percentiles are its
+    affine map of the multiplier percentiles (value percentile p comes from multiplier percentile 100 - p when the
+    slope is negative). That keeps the cost at one percentile pass over the draws, however many symbols there are.
+    """
+    quantiles, valid_share = multiplier_percentiles(multipliers, percentiles)
+    return bands_from_percentiles(fundamentals, quantiles, valid_share, percentiles)
+
+
+def multiplier_percentiles(multipliers: np.ndarray, percentiles=DEFAULT_PERCENTILES) -> tuple[np.ndarray, float]:
+    """Percentiles of the finite multipliers, and the share of draws that were finite.
+
+    The quantiles are taken at every p and then at every 100 - p; ``bands_from_percentiles`` needs both.
+    """
+    valid = multipliers[np.isfinite(multipliers)]
+    if not valid.size:
+        raise ValueError("No scenario has a finite value; terminal growth must stay below the discount rate")
+    percentiles = np.asarray(percentiles, dtype="float64")
+    return np.percentile(valid, np.concatenate([percentiles, 100 - percentiles])), valid.size / multipliers.size
+
+
+def bands_from_percentiles(
+    fundamentals: pd.DataFrame, quantiles, valid_share: float, percentiles=DEFAULT_PERCENTILES
+) -> pd.DataFrame:
+    fundamentals = prepare_fundamentals(fundamentals)
+    # rows: multiplier percentiles at p, then at 100 - p
+    quantiles = np.asarray(quantiles, dtype="float64").reshape(2, -1)
+    fcf = fundamentals["free_cash_flow"].to_numpy(dtype="float64")[:, None]
+    shares = fundamentals["shares_outstanding"].to_numpy(dtype="float64")[:, None]
+    net_debt = np.nan_to_num(fundamentals.get("net_debt", pd.Series(0.0, index=fundamentals.index)).to_numpy("float64"))
+    slope = fcf / shares
+    # a negative slope turns the low multiplier percentiles into the high value percentiles
+    values = slope * np.where(slope < 0, quantiles[1], quantiles[0]) - net_debt[:, None] / shares
+    bands = pd.DataFrame(values, index=fundamentals.index, columns=[f"p{p}" for p in percentiles])
+    bands["valid_share"] = valid_share
+    return bands
+
+
+def clamped_range(center: float, spread: float, low: float, high: float) -> tuple[float, float]:
+    """``center`` plus or minus ``spread``, kept inside [low, high]; a default a range slider will accept."""
+    return (min(max(center - spread, low), high), min(max(center + spread, low), high))
+
+
+def sensitivity_table(
+    discount_rates,
+    growth_rates,
+    terminal_growth: float = 0.02,
+    years: int = 10,
+    free_cash_flow: float = 1.0,
+    net_debt: float = 0.0,
+    shares_outstanding: float = 1.0,
+) -> pd.DataFrame:
+    """Per-share value over a discount rate x growth rate grid, computed in one broadcast."""
+    discount_rates = np.asarray(discount_rates, dtype="float64")
+    growth_rates = np.asarray(growth_rates, dtype="float64")
+    values = dcf_value(free_cash_flow, discount_rates[:, None], growth_rates[None, :], terminal_growth, years)
+    return pd.DataFrame(
+        (values - net_debt) / shares_outstanding,
+        index=pd.Index(discount_rates, name="discount_rate"),
+        columns=pd.Index(growth_rates, name="growth_rate"),
+    )
+
+
+def assumption_importance(draws: ScenarioDraws, multipliers: np.ndarray, max_samples: int = 200_000) -> pd.Series:
+    """Spearman rank correlation of each assumption with the resulting value, strongest first."""
+    frame = draws.to_frame().assign(value=multipliers)
+    frame = frame[np.isfinite(frame["value"])]
+    if len(frame) > max_samples:
+        frame = frame.sample(max_samples, random_state=0)
+    correlations, _ = stats.spearmanr(frame.to_numpy())
+    importance = pd.Series(correlations[-1, :-1], index=frame.columns[:-1], name="spearman")
+    return importance.reindex(importance.abs().sort_values(ascending=False).index)
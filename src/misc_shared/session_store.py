@@ -0,0 +1,249 @@
+import hashlib
+import json
+from decimal import Decimal
+from typing import TYPE_CHECKING, Any, Generic, Optional, Type
+
+import streamlit as st
+from boto3.dynamodb.conditions import Key
+from pydantic import BaseModel, Field
+from supersullytools.streamlit.sessions import MemorySessionManager, SessionType
+
+if TYPE_CHECKING:
+    from mypy_boto3_dynamodb.service_resource import Table
+
+FIELDS_SK = "fields"
+
+
+class AppendedField(BaseModel):
+    count: int = 0
+    last_hash: Optional[str] = None
+
+
+class PersistedSnapshot(BaseModel):
+    # what the database holds for a session, as of the last load or save by this browser session
+    field_hashes: dict[str, str] = Field(default_factory=dict)
+    appended: dict[str, AppendedField] = Field(default_factory=dict)
+    expires_at: Optional[Decimal] = None
+
+
+class DeltaSessionStore(Generic[SessionType]):
+    """Persists a session as one item of scalar fields plus append-only chunk items, all under one partition key.
+
+    Saves compare against a ``PersistedSnapshot`` and only send what changed: one UpdateItem for modified fields,
+    and for append-only list fields (chat messages) just the new entries, appended to the current chunk. A save
+    costs the same at turn 500 as at turn 5, and no single item grows towards DynamoDB's 400 KB limit.
+    """
+
+    def __init__(
+        self,
+        table: "Table",
+        model_type: Type[SessionType],
+        append_only_fields: tuple[str, ...] = (),
+        chunk_size: int = 50,
+        ttl_attribute_name: Optional[str] = "ttl",
+    ):
+        self.table = table
+        self.model_type = model_type
+        self.append_only_fields = append_only_fields
+        self.chunk_size = chunk_size
+        self.ttl_attribute_name = ttl_attribute_name
+
+    def partition_key(self, session_id: str) -> str:
+        return f"DSS#{self.model_type.__name__}#{session_id}"
+
+    def load(self, session_id: str) -> Optional[tuple[SessionType, PersistedSnapshot]]:
+        items = []
+        params = {"KeyConditionExpression": Key("pk").eq(self.partition_key(session_id))}
+        while True:
+            response = self.table.query(**params)
+            items.extend(response["Items"])
+            if not (last_key := response.get("LastEvaluatedKey")):
+                break
+            params["ExclusiveStartKey"] = last_key
+        fields_item = next((x for x in items if x["sk"] == FIELDS_SK), None)
+        if fields_item is None:
+            return None
+
+        data = {k[2:]: _from_dynamodb(v) for k, v in fields_item.items() if k.startswith("f_")}
+        for name in self.append_only_fields:
+            # chunk sort keys are zero padded, so query order is append order
+            chunks = [x for x in items if x["sk"].startswith(f"{name}#")]
+            data[name] = [entry for chunk in chunks for entry in _from_dynamodb(chunk["entries"])]
+        session = self.model_type.model_validate(data)
+        return session, self.snapshot(session)
+
+    def snapshot(self, session: SessionType) -> PersistedSnapshot:
+        dumped = _dump_fields(session)
+        snapshot = PersistedSnapshot(expires_at=session.expires_at)
+        for name, value in dumped.items():
+            if name in self.append_only_fields:
+                snapshot.appended[name] = AppendedField(count=len(value), last_hash=_hash(value[-1]) if value else None)
+            else:
+                snapshot.field_hashes[name] = _hash(value)
+        return snapshot
+
+    def save(self, session: SessionType, snapshot: Optional[PersistedSnapshot] = None) -> PersistedSnapshot:
+        snapshot = snapshot or PersistedSnapshot()
+        pk = self.partition_key(session.session_id)
+        dumped = _dump_fields(session)
+
+        # attribute name -> value for the fields item; scalar fields are stored as f_<name>, list lengths as n_<name>
+        updates = {
+            f"f_{name}": value
+            for name, value in dumped.items()
+            if name not in self.append_only_fields and snapshot.field_hashes.get(name) != _hash(value)
+        }
+        expiration_changed = session.expires_at != snapshot.expires_at
+        for name in self.append_only_fields:
+            entries = dumped.get(name) or []
+            persisted = snapshot.appended.get(name)
+            self._save_appended(pk, name, entries, persisted, session.expires_at)
+            if expiration_changed:
+                self._update_chunk_ttls(pk, name, len(entries), session.expires_at)
+            if not persisted or persisted.count != len(entries):
+                updates[f"n_{name}"] = len(entries)
+        if self.ttl_attribute_name and session.expires_at and (expiration_changed or not snapshot.field_hashes):
+            updates[self.ttl_attribute_name] = session.expires_at
+
+        if updates:
+            self.table.update_item(
+                Key={"pk": pk, "sk": FIELDS_SK},
+                UpdateExpression="SET " + ", ".join(f"#a{i} = :a{i}" for i in range(len(updates))),
+                ExpressionAttributeNames={f"#a{i}": attr for i, attr in enumerate(updates)},
+                ExpressionAttributeValues={f":a{i}": _to_dynamodb(value) for i, value in enumerate(updates.values())},
+            )
+        return self.snapshot(session)
+
+    def append_start(self, entries: list, persisted: Optional[AppendedField]) -> int:
+        """Index of the first entry a save would write: the persisted count, or 0 if the history was edited."""
+        persisted = persisted or AppendedField()
+        if len(entries) < persisted.count or (
+            persisted.count and _hash(entries[persisted.count - 1]) != persisted.last_hash
+        ):
+            return 0
+        return persisted.count
+
+    def _save_appended(self, pk: str, name: str, entries: list, persisted: Optional[AppendedField], expires_at):
+        persisted = persisted or AppendedField()
+        start = self.append_start(entries, persisted)
+        if persisted.count and not start:
+            # history was edited rather than appended to; rare, so just rewrite every chunk
+            self._delete_chunks(pk, name, persisted.count)
+        while start < len(entries):
+            chunk_index = start // self.chunk_size
+            chunk_end = min(len(entries), (chunk_index + 1) * self.chunk_size)
+            names = {"#entries": "entries"}
+            values = {":new": _to_dynamodb(entries[start:chunk_end]), ":empty": []}
+            expression = "SET #entries = list_append(if_not_exists(#entries, :empty), :new)"
+            if self.ttl_attribute_name and expires_at:
+                names["#ttl"] = self.ttl_attribute_name
+                values[":ttl"] = expires_at
+                expression += ", #ttl = :ttl"
+            self.table.update_item(
+                Key={"pk": pk, "sk": _chunk_sk(name, chunk_index)},
+                UpdateExpression=expression,
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+            )
+            start = chunk_end
+
+    def _delete_chunks(self, pk: str, name: str, count: int):
+        with self.table.batch_writer() as batch:
+            for chunk_index in range(_chunk_count(count, self.chunk_size)):
+                batch.delete_item(Key={"pk": pk, "sk": _chunk_sk(name, chunk_index)})
+
+    def _update_chunk_ttls(self, pk: str, name: str, count: int, expires_at):
+        if not (self.ttl_attribute_name and expires_at):
+            return
+        for chunk_index in range(_chunk_count(count, self.chunk_size)):
+            self.table.update_item(
+                Key={"pk": pk, "sk": _chunk_sk(name, chunk_index)},
+                UpdateExpression="SET #ttl = :ttl",
+                ExpressionAttributeNames={"#ttl": self.ttl_attribute_name},
+                ExpressionAttributeValues={":ttl": expires_at},
+            )
+
+
+class DeltaSessionManager(MemorySessionManager[SessionType]):
+    """``MemorySessionManager`` that saves through a ``DeltaSessionStore``.
+
+    The snapshot of what was last persisted lives in ``st.session_state`` next to the session data, so it survives
+    reruns the same way the session itself does.
+    """
+
+    def __init__(self, *args, append_only_fields: tuple[str, ...] = (), chunk_size: int = 50, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.store = DeltaSessionStore(
+            self._memory.dynamodb_table,
+            self.model_type,
+            append_only_fields=append_only_fields,
+            chunk_size=chunk_size,
+            ttl_attribute_name=self.ttl_attribute_name,
+        )
+
+    def persist_session(self, session: SessionType):
+        snapshot_key = self._snapshot_key(session.session_id)
+        snapshot = st.session_state.get(snapshot_key)
+        st.session_state[snapshot_key] = self.store.save(session, snapshot)
+        existing_params = st.experimental_get_query_params()
+        existing_params[self.get_query_param_name()] = session.session_id
+        st.experimental_set_query_params(**existing_params)
+
+    def get_session(self, session_id: str) -> Optional[SessionType]:
+        self.logger.info("Getting session from database")
+        if loaded := self.store.load(session_id):
+            session, snapshot = loaded
+            st.session_state[self._snapshot_key(session_id)] = snapshot
+            return session
+        if legacy := self.get_db_session(session_id):
+            # saved as one item before delta saves existed; with no snapshot the next save writes every field and
+            # message, and from then on the delta copy is the one that loads
+            self.logger.info("Loaded session saved in the single-item format")
+            st.session_state[self._snapshot_key(session_id)] = None
+            return legacy.session
+
+    def unsaved_from(self, session: SessionType, name: str) -> int:
+        """Index of the first entry of append-only field ``name`` that the next save will write."""
+        snapshot = st.session_state.get(self._snapshot_key(session.session_id))
+        persisted = snapshot.appended.get(name) if snapshot else None
+        return self.store.append_start(_dump_fields(session).get(name) or [], persisted)
+
+    def is_persisted(self, session: SessionType) -> bool:
+        # sessions loaded from the single-item format hold a None snapshot, and still count as saved
+        return self._snapshot_key(session.session_id) in st.session_state
+
+    def _snapshot_key(self, session_id: str) -> str:
+        return f"{self.model_type.__name__}-persisted-{session_id}"
+
+
+def _dump_fields(session: BaseModel) -> dict[str, Any]:
+    return json.loads(session.model_dump_json())
+
+
+def _hash(value: Any) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+def _to_dynamodb(value: Any) -> Any:
+    # DynamoDB rejects floats; round trip through json to turn them into Decimals
+    if isinstance(value, Decimal):
+        return value
+    return json.loads(json.dumps(value), parse_float=Decimal)
+
+
+def _from_dynamodb(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, list):
+        return [_from_dynamodb(x) for x in value]
+    if isinstance(value, dict):
+        return {k: _from_dynamodb(v) for k, v in value.items()}
+    return value
+
+
+def _chunk_sk(name: str, chunk_index: int) -> str:
+    return f"{name}#{chunk_index:06d}"
+
+
+def _chunk_count(count: int, chunk_size: int) -> int:
+    return (count + chunk_size - 1) // chunk_size
@@ -1,10 +1,17 @@
+import hashlib
 import random
 import string
+import threading
+import time
+from typing import Dict, Optional, Tuple
 from urllib.parse import urlencode
 
 import jwt
 import requests
 import streamlit as st
+from logzero import logger
+
+from misc_shared.metrics import metrics
 
 _STKEY = "ST_OAUTH"
 _DEFAULT_SECKEY = "oauth"
@@ -15,9 +22,138 @@ def qparms_cache(key):
     return {}
 
 
-@st.cache_resource(ttl=360000)
-def jwks_client(jwks_uri):
-    return jwt.PyJWKClient(jwks_uri)
+class UnknownSigningKey(jwt.exceptions.InvalidTokenError):
+    pass
+
+
+class JwksCache:
+    """Signing keys for one JWKS endpoint, kept current by a background thread.
+
+    The key set is fetched once when the cache is built; after that lookups are served from memory and never wait
+    on the network. An unknown ``kid`` may be a key published since the last refresh, so it wakes the refresh
+    thread (at most every ``min_refresh_seconds``) and the token is rejected for now. Keys that drop out of the set
+    during rotation stay usable for ``retired_grace_seconds``.
+    """
+
+    def __init__(
+        self,
+        jwks_uri: str,
+        refresh_seconds: float = 3600,
+        min_refresh_seconds: float = 30,
+        retired_grace_seconds: float = 3600,
+        start: bool = True,
+    ):
+        self.jwks_uri = jwks_uri
+        self.refresh_seconds = refresh_seconds
+        self.min_refresh_seconds = min_refresh_seconds
+        self.retired_grace_seconds = retired_grace_seconds
+        self._client = jwt.PyJWKClient(jwks_uri, cache_jwk_set=False, cache_keys=False)
+        self._keys: Dict[str, jwt.PyJWK] = {}
+        self._retired: Dict[str, Tuple[float, jwt.PyJWK]] = {}
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._last_attempt: Optional[float] = None
+        if start:
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception(f"Failed loading JWKS from {self.jwks_uri}; retrying in the background")
+            threading.Thread(target=self._run, name=f"jwks-refresh-{jwks_uri}", daemon=True).start()
+
+    def get_signing_key(self, kid: Optional[str]) -> jwt.PyJWK:
+        key = self._lookup(kid)
+        if key is None:
+            self.request_refresh()
+            raise UnknownSigningKey(f"Signing key {kid} not in current key set")
+        return key
+
+    def request_refresh(self):
+        # rate limited, so a stream of tokens with a bogus kid can't turn into a stream of fetches
+        last = self._last_attempt
+        if last is None or time.monotonic() - last >= self.min_refresh_seconds:
+            self._wake.set()
+
+    def refresh(self):
+        with self._lock:
+            self._last_attempt = time.monotonic()
+            with metrics.timer("oauth.jwks_refresh"):
+                fetched = {k.key_id: k for k in self._client.get_jwk_set(refresh=True).keys}
+            now = time.monotonic()
+            for kid, key in self._keys.items():
+                if kid not in fetched:
+                    self._retired[kid] = (now + self.retired_grace_seconds, key)
+            self._retired = {k: v for k, v in self._retired.items() if v[0] > now and k not in fetched}
+            self.set_keys(fetched)
+
+    def set_keys(self, keys: Dict[str, jwt.PyJWK]):
+        self._keys = keys
+        self._loaded.set()
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _lookup(self, kid: Optional[str]) -> Optional[jwt.PyJWK]:
+        key = self._keys.get(kid)
+        if key is None:
+            retired = self._retired.get(kid)
+            if retired and retired[0] > time.monotonic():
+                return retired[1]
+        return key
+
+    def _run(self):
+        while not self._stop.is_set():
+            # until the first load succeeds, retry on the short interval rather than the hourly one
+            self._wake.wait(self.refresh_seconds if self._loaded.is_set() else self.min_refresh_seconds)
+            if self._stop.is_set():
+                return
+            self._wake.clear()
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception(f"Failed refreshing JWKS from {self.jwks_uri}; keeping current keys")
+
+
+class VerifiedTokenCache:
+    # maps sha256(token + validation params) -> (exp, identity) for tokens whose signature already checked out
+    def __init__(self, max_entries: int = 10_000, leeway_seconds: float = 5):
+        self.max_entries = max_entries
+        self.leeway_seconds = leeway_seconds
+        self._entries: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, digest: str) -> Optional[str]:
+        entry = self._entries.get(digest)
+        if entry is None:
+            return None
+        if entry[0] - self.leeway_seconds <= time.time():
+            self._entries.pop(digest, None)
+            return None
+        return entry[1]
+
+    def put(self, digest: str, exp: Optional[float], identity: str):
+        if not exp:
+            return
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                now = time.time()
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+                while len(self._entries) >= self.max_entries:
+                    self._entries.pop(next(iter(self._entries)))
+            self._entries[digest] = (float(exp), identity)
+
+
+@st.cache_resource
+def jwks_client(jwks_uri) -> JwksCache:
+    # lives for the process: each instance owns a refresh thread
+    return JwksCache(jwks_uri)
+
+
+@st.cache_resource()
+def verified_tokens() -> VerifiedTokenCache:
+    return VerifiedTokenCache()
 
 
 def logout():
@@ -63,24 +199,42 @@ def show_auth_link(config, label):
 
 
 def validate_token(token, config):
-    signing_key = jwks_client(config["jwks_uri"]).get_signing_key_from_jwt(token["access_token"])
+    return validate_access_token(
+        token["access_token"],
+        jwks_client(config["jwks_uri"]),
+        verified_tokens(),
+        audience=config["audience"] if "audience" in config else None,
+        identity_field=config["identity_field_in_token"] if "identity_field_in_token" in config else None,
+    )
+
+
+@metrics.timed("oauth.validate_token")
+def validate_access_token(
+    access_token: str,
+    jwks: JwksCache,
+    verified: VerifiedTokenCache,
+    audience: Optional[str] = None,
+    identity_field: Optional[str] = None,
+):
+    digest = hashlib.sha256(f"{jwks.jwks_uri}|{audience}|{identity_field}|{access_token}".encode()).hexdigest()
+    identity = verified.get(digest)
+    if identity is not None:
+        return True, identity
     try:
+        signing_key = jwks.get_signing_key(jwt.get_unverified_header(access_token).get("kid"))
         data = jwt.decode(
-            token["access_token"],
+            access_token,
             signing_key.key,
             algorithms=["RS256"],
-            audience=config["audience"] if "audience" in config else None,
+            audience=audience,
         )
     except jwt.exceptions.ExpiredSignatureError:
         return False, "Expired"
     except:  # noqa: E722
         return False, "Invalid"
-    return (
-        True,
-        data[config["identity_field_in_token"]]
-        if "identity_field_in_token" in config and config["identity_field_in_token"] in data
-        else "OK",
-    )
+    identity = data[identity_field] if identity_field and identity_field in data else "OK"
+    verified.put(digest, data.get("exp"), identity)
+    return True, identity
 
 
 def st_oauth(config=None, label="Login via OAuth"):
@@ -117,7 +271,8 @@ def st_oauth(config=None, label="Login via OAuth"):
             "code": code,
         }
         try:
-            ret = requests.post(config["token_endpoint"], headers=theaders, data=urlencode(tdata).encode("utf-8"))
+            with metrics.timer("oauth.token_exchange"):
+                ret = requests.post(config["token_endpoint"], headers=theaders, data=urlencode(tdata).encode("utf-8"))
             ret.raise_for_status()
         except requests.exceptions.RequestException as e:
             st.error(e)
@@ -1,28 +1,375 @@
-from typing import TYPE_CHECKING
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional, Type, TypeVar
 
 import boto3
 import streamlit as st
+from botocore.config import Config
 from logzero import logger
-from simplesingletable import DynamoDBMemory
+from pydantic import BaseModel, Field
+from simplesingletable import DynamoDBMemory, DynamodbResource
+
+from misc_shared.memory_cache import CachedMemory, MemoryCacheSettings, TtlLruCache
+from misc_shared.metrics import instrument_boto_client
+from misc_shared.utils import backoff_sleep, chunked
 
 if TYPE_CHECKING:
+    from mypy_boto3_dynamodb import DynamoDBClient
     from mypy_boto3_s3 import S3Client, S3ServiceResource
 
+# boto3 sessions are not thread safe; every client / resource is built from the shared session under this lock
+_session_lock = threading.Lock()
+_thread_local = threading.local()
+_warm_up_started = threading.Event()
+
+BATCH_GET_LIMIT = 100
+BATCH_WRITE_LIMIT = 25
+
+ResourceType = TypeVar("ResourceType", bound=DynamodbResource)
+
+
+class UnprocessedItemsError(RuntimeError):
+    pass
+
+
+class AwsClientSettings(BaseModel):
+    # overridable from the [aws] section of secrets.toml
+    max_pool_connections: int = 50
+    tcp_keepalive: bool = True
+    retry_mode: str = "adaptive"
+    max_attempts: int = 5
+    connect_timeout: float = 2.0
+    read_timeout: float = 10.0
+    warm_connections: bool = True
+
+
+@st.cache_resource
+def get_client_settings() -> AwsClientSettings:
+    return AwsClientSettings.model_validate(dict(st.secrets.get("aws", {})))
+
+
+@st.cache_resource
+def get_client_config() -> Config:
+    settings = get_client_settings()
+    return Config(
+        max_pool_connections=settings.max_pool_connections,
+        tcp_keepalive=settings.tcp_keepalive,
+        retries={"mode": settings.retry_mode, "max_attempts": settings.max_attempts},
+        connect_timeout=settings.connect_timeout,
+        read_timeout=settings.read_timeout,
+    )
+
+
+@st.cache_resource
+def get_aws_session() -> boto3.Session:
+    return boto3.Session()
+
 
 @st.cache_resource()
-def get_memory() -> DynamoDBMemory:
-    return DynamoDBMemory(
+def get_memory() -> DynamoDBMemory | CachedMemory:
+    memory = DynamoDBMemory(
         logger=logger,
         table_name=st.secrets["app"]["dynamodb_table"],
         endpoint_url=st.secrets.get("DYNAMODB_ENDPOINT"),
+        connection_params={"config": get_client_config()},
     )
+    with _session_lock:
+        # every DynamoDB call, including those DynamoDBMemory makes itself, lands in the metrics registry
+        instrument_boto_client(memory.dynamodb_client)
+        instrument_boto_client(memory.dynamodb_table.meta.client)
+    settings = MemoryCacheSettings.model_validate(dict(st.secrets.get("memory_cache", {})))
+    if not settings.enabled:
+        return memory
+    return CachedMemory(memory, settings)
 
 
 @st.cache_resource
-def get_s3_client() -> "S3Client":
-    return boto3.client("s3", endpoint_url=st.secrets.get("S3_ENDPOINT"))
+def get_dynamodb_client() -> "DynamoDBClient":
+    # the memory object builds its own client lazily; resolve it here so it's built once with our config
+    memory = get_memory()
+    with _session_lock:
+        return memory.dynamodb_client
 
 
 @st.cache_resource
+def get_s3_client() -> "S3Client":
+    session, config = get_aws_session(), get_client_config()
+    with _session_lock:
+        client = session.client("s3", endpoint_url=st.secrets.get("S3_ENDPOINT"), config=config)
+    return instrument_boto_client(client)
+
+
 def get_s3_resource() -> "S3ServiceResource":
-    pass
+    # resources are not thread safe, so each script thread gets its own
+    resource = getattr(_thread_local, "s3_resource", None)
+    if resource is None:
+        session, config = get_aws_session(), get_client_config()
+        with _session_lock:
+            resource = session.resource("s3", endpoint_url=st.secrets.get("S3_ENDPOINT"), config=config)
+        instrument_boto_client(resource.meta.client)
+        _thread_local.s3_resource = resource
+    return resource
+
+
+def warm_up_clients():
+    """Build the shared clients and open a pooled connection to each service ahead of the first page."""
+    s3 = get_s3_client()
+    memory = get_memory()
+    get_dynamodb_client()
+    with _session_lock:
+        table = memory.dynamodb_table
+    if not get_client_settings().warm_connections:
+        return
+    try:
+        s3.head_bucket(Bucket=st.secrets.app.private_bucket)
+        table.meta.client.describe_table(TableName=memory.table_name)
+    except Exception:
+        logger.warning("Warm-up request failed; clients are built but connections will open on first use")
+    logger.info("AWS clients warmed up")
+
+
+def start_warm_up():
+    # once per process, off the script thread; later calls are no-ops
+    if _warm_up_started.is_set():
+        return
+    _warm_up_started.set()
+    threading.Thread(target=_warm_up_safely, name="aws-warm-up", daemon=True).start()
+
+
+def _warm_up_safely():
+    try:
+        warm_up_clients()
+    except Exception:
+        logger.exception("AWS client warm-up failed")
+
+
+def batch_get_resources(
+    memory: DynamoDBMemory | CachedMemory,
+    data_class: Type[ResourceType],
+    resource_ids: Iterable[str],
+    parallel: bool = False,
+    max_workers: int = 4,
+    max_attempts: int = 6,
+) -> dict[str, ResourceType]:
+    """Load many resources with BatchGetItem, 100 keys per request; missing ids are left out of the result."""
+    keys_by_id = {resource_id: data_class.dynamodb_lookup_keys_from_id(resource_id) for resource_id in resource_ids}
+    items = []
+    if isinstance(memory, CachedMemory):
+        uncached = {}
+        for resource_id, key in keys_by_id.items():
+            if (item := memory.get_cached_item(key)) is not None:
+                items.append(item)
+            else:
+                uncached[resource_id] = key
+    else:
+        uncached = keys_by_id
+
+    table = memory.dynamodb_table
+    chunks = chunked(list(uncached.values()), BATCH_GET_LIMIT)
+
+    def get_chunk(keys: list[dict]) -> list[dict]:
+        found = []
+        request = {table.name: {"Keys": keys}}
+        for attempt in range(max_attempts):
+            response = table.meta.client.batch_get_item(RequestItems=request)
+            found.extend(response["Responses"].get(table.name, []))
+            request = response.get("UnprocessedKeys")
+            if not request:
+                return found
+            backoff_sleep(attempt)
+        raise UnprocessedItemsError(f"{len(request[table.name]['Keys'])} key(s) still unprocessed")
+
+    for fetched in _map_chunks(get_chunk, chunks, parallel, max_workers):
+        items.extend(fetched)
+        if isinstance(memory, CachedMemory):
+            for item in fetched:
+                memory.cache_item(item)
+
+    resources = (data_class.from_dynamodb_item(item) for item in items)
+    return {resource.resource_id: resource for resource in resources}
+
+
+def batch_put_resources(
+    memory: DynamoDBMemory | CachedMemory,
+    resources: list[DynamodbResource],
+    parallel: bool = False,
+    max_workers: int = 4,
+    max_attempts: int = 6,
+) -> list[DynamodbResource]:
+    """Write many non-versioned resources with BatchWriteItem, 25 items per request."""
+    table = memory.dynamodb_table
+    items = [resource.to_dynamodb_item() for resource in resources]
+
+    def put_chunk(chunk: list[dict]) -> list[dict]:
+        request = {table.name: [{"PutRequest": {"Item": item}} for item in chunk]}
+        for attempt in range(max_attempts):
+            request = table.meta.client.batch_write_item(RequestItems=request).get("UnprocessedItems")
+            if not request:
+                return chunk
+            backoff_sleep(attempt)
+        raise UnprocessedItemsError(f"{len(request[table.name])} item(s) still unprocessed")
+
+    for written in _map_chunks(put_chunk, chunked(items, BATCH_WRITE_LIMIT), parallel, max_workers):
+        if isinstance(memory, CachedMemory):
+            for item in written:
+                memory.cache_item(item)
+    return resources
+
+
+def batch_create_resources(
+    memory: DynamoDBMemory | CachedMemory,
+    data_class: Type[ResourceType],
+    data: list[dict],
+    override_ids: Optional[list[str]] = None,
+    **kwargs,
+) -> list[ResourceType]:
+    override_ids = override_ids or [None] * len(data)
+    resources = [data_class.create_new(d, override_id=override_id) for d, override_id in zip(data, override_ids)]
+    batch_put_resources(memory, resources, **kwargs)
+    if resources and memory.track_stats:
+        memory.increment_counter(memory.get_stats(), "counts_by_type." + data_class.__name__, incr_by=len(resources))
+    return resources
+
+
+def _map_chunks(fn, chunks: list, parallel: bool, max_workers: int):
+    if parallel and len(chunks) > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            yield from executor.map(fn, chunks)
+    else:
+        yield from map(fn, chunks)
+
+
+class S3Object(BaseModel):
+    key: str
+    size: int
+    last_modified: datetime
+
+
+class ListingPage(BaseModel):
+    bucket: str
+    prefix: str = ""
+    delimiter: Optional[str] = None
+    page_number: int = 0
+    objects: list[S3Object] = Field(default_factory=list)
+    common_prefixes: list[str] = Field(default_factory=list)
+    next_token: Optional[str] = None
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_token is not None
+
+
+def iter_listing_pages(
+    client: "S3Client",
+    bucket: str,
+    prefix: str = "",
+    delimiter: Optional[str] = None,
+    page_size: int = 1000,
+) -> Iterator[ListingPage]:
+    params = {"Bucket": bucket, "Prefix": prefix, "PaginationConfig": {"PageSize": page_size}}
+    if delimiter:
+        params["Delimiter"] = delimiter
+    for page_number, response in enumerate(client.get_paginator("list_objects_v2").paginate(**params)):
+        yield _listing_page(response, bucket, prefix, delimiter, page_number)
+
+
+def _listing_page(response: dict, bucket: str, prefix: str, delimiter: Optional[str], page_number: int):
+    return ListingPage(
+        bucket=bucket,
+        prefix=prefix,
+        delimiter=delimiter,
+        page_number=page_number,
+        objects=[
+            S3Object(key=x["Key"], size=x["Size"], last_modified=x["LastModified"])
+            for x in response.get("Contents", [])
+        ],
+        common_prefixes=[x["Prefix"] for x in response.get("CommonPrefixes", [])],
+        next_token=response.get("NextContinuationToken"),
+    )
+
+
+def iter_objects(client: "S3Client", bucket: str, prefix: str = "", page_size: int = 1000) -> Iterator[S3Object]:
+    for page in iter_listing_pages(client, bucket, prefix, page_size=page_size):
+        yield from page.objects
+
+
+class PrefixIndex:
+    """Short-TTL cache of listing pages, fetched lazily one page at a time.
+
+    Page N is requested with the continuation token stored on page N-1, so browsing forward costs one
+    ListObjectsV2 call per new page and re-rendering a page already seen costs nothing until the TTL runs out.
+    """
+
+    def __init__(
+        self,
+        client: "S3Client",
+        ttl_seconds: float = 30.0,
+        page_size: int = 200,
+        max_workers: int = 4,
+        max_pages: int = 512,
+    ):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.page_size = page_size
+        self.max_workers = max_workers
+        self.max_pages = max_pages
+        # one bounded cache per bucket, so invalidating a bucket drops just its pages
+        self._pages: dict[str, TtlLruCache] = {}
+        self._lock = threading.Lock()
+
+    def get_page(
+        self,
+        bucket: str,
+        prefix: str = "",
+        page_number: int = 0,
+        delimiter: Optional[str] = "/",
+        clamp: bool = False,
+    ):
+        """Page ``page_number`` of the listing; past the end that's an IndexError, or the last page with ``clamp``."""
+        pages = self._bucket_pages(bucket)
+        # start from the nearest earlier page still cached and fetch forward, one request per missing page
+        start = page_number
+        while start >= 0 and (page := pages.get(_page_key(prefix, delimiter, start), None)) is None:
+            start -= 1
+        for number in range(start + 1, page_number + 1):
+            params = {"Bucket": bucket, "Prefix": prefix, "MaxKeys": self.page_size}
+            if delimiter:
+                params["Delimiter"] = delimiter
+            if page is not None:
+                if not page.has_next:
+                    if clamp:
+                        return page
+                    raise IndexError(f"s3://{bucket}/{prefix} has no page {page_number}")
+                params["ContinuationToken"] = page.next_token
+            page = _listing_page(self.client.list_objects_v2(**params), bucket, prefix, delimiter, number)
+            pages.set(_page_key(prefix, delimiter, number), page)
+        return page
+
+    def get_first_pages(self, buckets: list[str], prefix: str = "", delimiter: Optional[str] = "/"):
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(buckets) or 1)) as executor:
+            pages = executor.map(lambda bucket: self.get_page(bucket, prefix, 0, delimiter), buckets)
+            return dict(zip(buckets, pages))
+
+    def invalidate(self, bucket: Optional[str] = None):
+        with self._lock:
+            if bucket is None:
+                self._pages = {}
+            else:
+                self._pages.pop(bucket, None)
+
+    def _bucket_pages(self, bucket: str) -> TtlLruCache:
+        with self._lock:
+            if bucket not in self._pages:
+                self._pages[bucket] = TtlLruCache(self.max_pages, self.ttl_seconds)
+            return self._pages[bucket]
+
+
+def _page_key(prefix: str, delimiter: Optional[str], page_number: int) -> str:
+    return json.dumps([prefix, delimiter, page_number])
+
+
+@st.cache_resource
+def get_prefix_index() -> PrefixIndex:
+    return PrefixIndex(get_s3_client())
@@ -0,0 +1,148 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Iterator, Optional
+
+from boto3.dynamodb.conditions import ConditionBase, Key
+
+if TYPE_CHECKING:
+    from mypy_boto3_dynamodb.service_resource import Table
+
+# index name -> (partition key attribute, sort key attribute); mirrors infra/dynamodb_tables/create-table.yaml
+TABLE_INDEXES = {
+    "gsitype": ("gsitype", "gsitypesk"),
+    "gsi1": ("gsi1pk", "pk"),
+    "gsi2": ("gsi2pk", "pk"),
+    "gsi3": ("gsi3pk", "gsi3sk"),
+}
+
+DEFAULT_PROJECTION = ["pk", "sk", "gsitype", "updated_at"]
+
+_DONE = object()
+
+
+def projection_params(projection: Optional[list[str]]) -> dict:
+    # attribute names go through placeholders; plenty of ours ("name", "data", "ttl") are reserved words
+    if not projection:
+        return {}
+    names = {f"#p{i}": attr for i, attr in enumerate(projection)}
+    return {"ProjectionExpression": ", ".join(names), "ExpressionAttributeNames": names}
+
+
+def iter_query_pages(
+    table: "Table",
+    key_condition: ConditionBase,
+    index_name: Optional[str] = None,
+    projection: Optional[list[str]] = None,
+    filter_expression: Optional[ConditionBase] = None,
+    page_size: int = 500,
+    ascending: bool = False,
+) -> Iterator[list[dict]]:
+    params = {
+        "KeyConditionExpression": key_condition,
+        "Limit": page_size,
+        "ScanIndexForward": ascending,
+        **projection_params(projection),
+    }
+    if index_name:
+        params["IndexName"] = index_name
+    if filter_expression is not None:
+        params["FilterExpression"] = filter_expression
+    while True:
+        response = table.query(**params)
+        yield response["Items"]
+        if not (last_key := response.get("LastEvaluatedKey")):
+            return
+        params["ExclusiveStartKey"] = last_key
+
+
+def iter_index_pages(
+    table: "Table",
+    index_name: str,
+    partition_value: str,
+    sort_prefix: Optional[str] = None,
+    **kwargs,
+) -> Iterator[list[dict]]:
+    partition_attr, sort_attr = TABLE_INDEXES[index_name]
+    condition = Key(partition_attr).eq(partition_value)
+    if sort_prefix:
+        condition = condition & Key(sort_attr).begins_with(sort_prefix)
+    return iter_query_pages(table, condition, index_name=index_name, **kwargs)
+
+
+def iter_parallel_scan_pages(
+    table: "Table",
+    total_segments: int = 4,
+    projection: Optional[list[str]] = None,
+    filter_expression: Optional[ConditionBase] = None,
+    page_size: int = 500,
+    max_buffered_pages: int = 8,
+) -> Iterator[list[dict]]:
+    """Segmented scan across a thread pool, yielding pages in arrival order.
+
+    The page buffer is bounded so a slow consumer applies backpressure instead of the workers reading the whole
+    table into memory; closing the generator early stops the workers after their in-flight page.
+    """
+    pages: "queue.Queue" = queue.Queue(maxsize=max_buffered_pages)
+    stop = threading.Event()
+    base_params = {"TotalSegments": total_segments, "Limit": page_size, **projection_params(projection)}
+    if filter_expression is not None:
+        base_params["FilterExpression"] = filter_expression
+
+    def put(page) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(page, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def scan_segment(segment: int):
+        params = {**base_params, "Segment": segment}
+        try:
+            while not stop.is_set():
+                response = table.scan(**params)
+                if not put(response["Items"]):
+                    return
+                if not (last_key := response.get("LastEvaluatedKey")):
+                    return
+                params["ExclusiveStartKey"] = last_key
+        except Exception as e:
+            put(e)
+        finally:
+            put(_DONE)
+
+    executor = ThreadPoolExecutor(max_workers=total_segments, thread_name_prefix="table-scan")
+    try:
+        for segment in range(total_segments):
+            executor.submit(scan_segment, segment)
+        remaining = total_segments
+        while remaining:
+            page = pages.get()
+            if page is _DONE:
+                remaining -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield page
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_table_pages(
+    table: "Table",
+    type_name: Optional[str] = None,
+    index_name: Optional[str] = None,
+    key_value: Optional[str] = None,
+    projection: Optional[list[str]] = DEFAULT_PROJECTION,
+    total_segments: int = 4,
+    page_size: int = 500,
+) -> Iterator[list[dict]]:
+    # use an index whenever the request narrows things down; only an unfiltered request falls back to the scan
+    if index_name and key_value:
+        return iter_index_pages(table, index_name, key_value, projection=projection, page_size=page_size)
+    if type_name:
+        return iter_index_pages(table, "gsitype", type_name, projection=projection, page_size=page_size)
+    return iter_parallel_scan_pages(table, total_segments, projection=projection, page_size=page_size)
@@ -0,0 +1,11 @@
+import random
+import time
+
+
+def backoff_sleep(attempt: int, base_seconds: float = 0.05, cap_seconds: float = 2.0):
+    # full jitter, so callers that collided once don't retry in lockstep
+    time.sleep(random.uniform(0, min(cap_seconds, base_seconds * 2**attempt)))
+
+
+def chunked(items: list, size: int) -> list[list]:
+    return [items[i : i + size] for i in range(0, len(items), size)]
@@ -3,7 +3,7 @@ from streamlit_authenticator.exceptions import RegisterError
 from app_setup import get_current_user, set_page_config, st
 from misc_shared.auth_helpers import save_auth_db
 
-authenticator = set_page_config(initial_sidebar_state="expanded")
+authenticator = set_page_config(with_authenticator=True, initial_sidebar_state="expanded")
 st.write(f"Welcome {get_current_user()}")
 if not st.session_state.get("authentication_status"):
     data = authenticator.login("Login")
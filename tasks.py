@@ -58,6 +58,33 @@ def run_streamlit(c: Context):
         c.run(cmd, pty=True)
 
 
+@task
+def profile_startup(c: Context, pages="", top=12, output=""):
+    """Import-time and first-render report per page; pass --output to append the run to a JSONL history."""
+    cmd = "python benchmarks/startup_profile.py"
+    if pages:
+        cmd += " --pages " + " ".join(f'"{page.strip()}"' for page in pages.split(","))
+    cmd += f" --top {top}"
+    if output:
+        cmd += f' --output "{output}"'
+    with Paths.cd(c, Paths.repo_root):
+        c.run(cmd, pty=True)
+
+
+@task
+def benchmark(c: Context, only="", repeat=5, threshold=0.25, save=True, force_save=False):
+    """Run the in-process benchmark suite; exits non-zero when a case regresses against its recorded history."""
+    cmd = f"python benchmarks/suite.py --repeat {repeat} --threshold {threshold}"
+    if only:
+        cmd += f" --only {only}"
+    if not save:
+        cmd += " --no-save"
+    if force_save:
+        cmd += " --force-save"
+    with Paths.cd(c, Paths.repo_root):
+        c.run(cmd, pty=True)
+
+
 @task
 def lint(c: Context):
     with Paths.cd(c, Paths.repo_root):
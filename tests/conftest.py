@@ -0,0 +1,54 @@
+import os
+import sys
+from pathlib import Path
+
+import boto3
+import pytest
+import yaml
+from cryptography.fernet import Fernet
+from logzero import logger
+from moto import mock_aws
+from simplesingletable import DynamoDBMemory
+
+REPO_ROOT = Path(__file__).parents[1]
+sys.path.insert(0, str(REPO_ROOT / "src"))
+
+for name, value in {
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "AWS_DEFAULT_REGION": "us-west-2",
+}.items():
+    os.environ[name] = value
+
+TABLE_SPEC = REPO_ROOT / "infra" / "dynamodb_tables" / "create-table.yaml"
+BUCKET = "test-private"
+
+
+@pytest.fixture
+def aws():
+    with mock_aws():
+        yield
+
+
+@pytest.fixture
+def memory(aws) -> DynamoDBMemory:
+    spec = yaml.safe_load(TABLE_SPEC.read_text())
+    boto3.client("dynamodb").create_table(**spec)
+    return DynamoDBMemory(logger=logger, table_name=spec["TableName"])
+
+
+@pytest.fixture
+def bucket() -> str:
+    return BUCKET
+
+
+@pytest.fixture
+def s3_client(aws, bucket):
+    client = boto3.client("s3")
+    client.create_bucket(Bucket=bucket, CreateBucketConfiguration={"LocationConstraint": "us-west-2"})
+    return client
+
+
+@pytest.fixture
+def fernet() -> Fernet:
+    return Fernet(Fernet.generate_key())
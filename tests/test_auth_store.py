@@ -0,0 +1,139 @@
+import pytest
+
+from misc_shared.auth_store import BlobCredentialStore, ShardedCredentialStore, UserMap, WriteConflict
+from misc_shared.models import AuthUserRecord
+
+
+@pytest.fixture
+def store(memory, fernet) -> ShardedCredentialStore:
+    return ShardedCredentialStore(memory, fernet)
+
+
+def test_put_and_get_user(store):
+    store.put_user("Alice", {"name": "Alice", "password": "h1"})
+    assert store.get_user("alice") == {"name": "Alice", "password": "h1"}
+    assert store.get_user("bob") is None
+
+
+def test_registering_existing_user_conflicts(store):
+    store.put_user("alice", {"password": "h1"})
+    with pytest.raises(WriteConflict):
+        store.put_user("alice", {"password": "h2"})
+
+
+def test_update_bumps_revision_and_updated_at(store, memory):
+    store.put_user("alice", {"password": "h1"})
+    before = memory.get_existing("alice", AuthUserRecord, consistent_read=True)
+    store.put_user("alice", {"password": "h2"}, base={"password": "h1"})
+    after = memory.get_existing("alice", AuthUserRecord, consistent_read=True)
+    assert after.revision == before.revision + 1
+    assert after.updated_at > before.updated_at
+
+
+def test_apply_writes_only_changed_users(store):
+    store.put_user("alice", {"password": "h1"})
+    store.put_user("bob", {"password": "b1"})
+    users = UserMap(store.get_user)
+    users["alice"]["password"] = "h2"
+    del users["bob"]
+    store.apply(users)
+    assert users.changes() == ({}, set())
+    fresh = ShardedCredentialStore(store.memory, store.fernet)
+    assert fresh.get_user("alice") == {"password": "h2"}
+    assert fresh.get_user("bob") is None
+
+
+def test_settings_update_retries_on_concurrent_write(store):
+    store.save_settings({"cookie_name": "c", "preauthorized": {"emails": ["a@x.com", "b@x.com"]}})
+    other = ShardedCredentialStore(store.memory, store.fernet)
+    calls = []
+
+    def change(settings):
+        if not calls:
+            # another worker preauthorizes someone between our read and our write
+            other.update_settings(
+                lambda s: {**s, "preauthorized": {"emails": s["preauthorized"]["emails"] + ["c@x.com"]}}
+            )
+        calls.append(settings)
+        return {**settings, "cookie_name": "d"}
+
+    store.update_settings(change)
+    assert len(calls) == 2
+    fresh = ShardedCredentialStore(store.memory, store.fernet)
+    assert fresh.load_settings() == {"cookie_name": "d", "preauthorized": {"emails": ["a@x.com", "b@x.com", "c@x.com"]}}
+
+
+def test_remove_preauthorized_keeps_other_emails(store):
+    store.save_settings({"preauthorized": {"emails": ["a@x.com", "b@x.com"]}})
+    store.remove_preauthorized({"a@x.com"})
+    assert ShardedCredentialStore(store.memory, store.fernet).load_settings() == {
+        "preauthorized": {"emails": ["b@x.com"]}
+    }
+
+
+def test_user_map_iterates_every_stored_user(store):
+    store.put_user("alice", {"email": "alice@x.com"})
+    store.put_user("bob", {"email": "bob@x.com"})
+    users = UserMap(store.get_user, list_users=store.list_users)
+    assert sorted(users) == ["alice", "bob"]
+    # the lookup streamlit_authenticator does for "forgot username"
+    assert next(k for k, v in users.items() if v["email"] == "bob@x.com") == "bob"
+    assert users.changes() == ({}, set())
+
+
+def test_user_map_without_listing_only_knows_loaded_users(store):
+    store.put_user("alice", {"email": "alice@x.com"})
+    users = UserMap(store.get_user)
+    assert list(users) == []
+    assert users["alice"]["email"] == "alice@x.com"
+    assert list(users) == ["alice"]
+
+
+def users(*names: str) -> dict:
+    return {"credentials": {"usernames": {name: {"email": f"{name}@example.com"} for name in names}}}
+
+
+@pytest.fixture
+def blob(s3_client, bucket, fernet) -> BlobCredentialStore:
+    return BlobCredentialStore(s3_client, bucket, fernet, revalidate_seconds=60, jitter_seconds=0)
+
+
+def test_blob_load_of_missing_object_is_empty(blob):
+    snapshot = blob.load()
+    assert snapshot.version is None and snapshot.data == {}
+
+
+def test_blob_revalidates_with_conditional_get(s3_client, bucket, fernet, blob):
+    parsed = []
+    reader = BlobCredentialStore(s3_client, bucket, fernet, parse=parsed.append, revalidate_seconds=60)
+    blob.save(users("alice"), base=blob.load())
+
+    first = reader.load()
+    assert first.data == users("alice") and first.version == blob.version
+    # inside the revalidation window nothing is fetched; past it an unchanged object costs a 304 and no re-parse
+    assert reader.load() is first
+    assert reader.load(force=True) is first
+    assert len(parsed) == 1
+
+    blob.save(users("alice", "bob"), base=blob.load())
+    reader.invalidate()
+    assert reader.load().data == users("alice", "bob")
+    assert len(parsed) == 2
+
+
+def test_blob_save_merges_concurrent_changes(s3_client, bucket, fernet, blob):
+    base = blob.save(users("alice"), base=blob.load())
+    other = BlobCredentialStore(s3_client, bucket, fernet)
+    other.save(users("alice", "bob"), base=other.load())
+
+    # written against a base that is now stale: retried on top of the remote copy with only this side's changes
+    saved = blob.save(users("carol"), base=base)
+    assert set(saved.data["credentials"]["usernames"]) == {"bob", "carol"}
+    assert blob.load(force=True).data == saved.data
+
+
+def test_blob_first_save_does_not_overwrite_a_concurrent_create(s3_client, bucket, fernet, blob):
+    empty = blob.load()
+    BlobCredentialStore(s3_client, bucket, fernet).save(users("bob"), base=empty)
+    saved = blob.save(users("alice"), base=empty)
+    assert set(saved.data["credentials"]["usernames"]) == {"alice", "bob"}
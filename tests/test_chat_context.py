@@ -0,0 +1,80 @@
+from misc_shared.chat_context import REPLY_PRIMING_TOKENS, SUMMARY_PREFIX, ContextWindow
+
+
+class FlatCounter:
+    # every message, summaries included, costs the same
+    def __init__(self, per_message: int = 10):
+        self.per_message = per_message
+
+    def count_message(self, message: dict) -> int:
+        return self.per_message
+
+    def count_messages(self, messages: list[dict]) -> int:
+        return REPLY_PRIMING_TOKENS + self.per_message * len(messages)
+
+
+def make_turns(count: int) -> list[dict]:
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"m{i}"} for i in range(count)]
+
+
+class RecordingSummarizer:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, messages: list[dict]) -> str:
+        self.calls.append(messages)
+        return " ".join(m["content"].removeprefix(SUMMARY_PREFIX) for m in messages)
+
+
+def test_without_summarizer_keeps_newest_turns():
+    window = ContextWindow(FlatCounter(), budget_tokens=REPLY_PRIMING_TOKENS + 35)
+    turns = make_turns(10)
+    assert window.build(turns) == turns[-3:]
+    assert window.last_dropped == 7
+
+
+def test_rounding_the_cut_up_does_not_drop_unsummarized_turns():
+    # 7 turns fit, so the cut rounds up from 3 to 4; the summary plus the remaining 6 turns still fit
+    window = ContextWindow(
+        FlatCounter(), budget_tokens=REPLY_PRIMING_TOKENS + 78, summarizer=RecordingSummarizer(), summary_block=4
+    )
+    turns = make_turns(10)
+    messages = window.build(turns)
+    assert messages[1:] == turns[4:]
+    assert messages[0]["content"] == SUMMARY_PREFIX + "m0 m1 m2 m3"
+    assert window.last_dropped == 4
+
+
+def test_every_dropped_turn_is_summarized_when_the_summary_needs_room():
+    window = ContextWindow(
+        FlatCounter(), budget_tokens=REPLY_PRIMING_TOKENS + 60, summarizer=RecordingSummarizer(), summary_block=4
+    )
+    turns = make_turns(10)
+    messages = window.build(turns)
+    cut = window.last_dropped
+    assert messages[1:] == turns[cut:]
+    assert messages[0]["content"] == SUMMARY_PREFIX + " ".join(f"m{i}" for i in range(cut))
+    assert window.counter.count_messages(messages) <= window.budget_tokens
+
+
+def test_fewer_turns_than_a_block_are_still_summarized():
+    summarizer = RecordingSummarizer()
+    window = ContextWindow(
+        FlatCounter(), budget_tokens=REPLY_PRIMING_TOKENS + 25, summarizer=summarizer, summary_block=6
+    )
+    turns = make_turns(3)
+    messages = window.build(turns)
+    assert messages == [{"role": "system", "content": SUMMARY_PREFIX + "m0 m1"}, turns[2]]
+    assert summarizer.calls == [turns[:2]]
+
+
+def test_summaries_are_reused_across_builds():
+    summarizer = RecordingSummarizer()
+    window = ContextWindow(
+        FlatCounter(), budget_tokens=REPLY_PRIMING_TOKENS + 50, summarizer=summarizer, summary_block=2
+    )
+    turns = make_turns(8)
+    window.build(turns)
+    calls = len(summarizer.calls)
+    window.build(turns)
+    assert len(summarizer.calls) == calls
@@ -0,0 +1,77 @@
+import pytest
+
+from misc_shared.chat_search import ChatSearchIndex, ChatSearchSettings
+from misc_shared.encrypted_objects import EncryptedObjectStore
+
+
+def make_index(memory, s3_client, bucket, fernet, cache_dir, **settings) -> ChatSearchIndex:
+    objects = EncryptedObjectStore(s3_client, bucket, fernet)
+    return ChatSearchIndex(memory, objects, ChatSearchSettings(cache_dir=str(cache_dir), **settings))
+
+
+@pytest.fixture
+def index(memory, s3_client, bucket, fernet, tmp_path) -> ChatSearchIndex:
+    return make_index(memory, s3_client, bucket, fernet, tmp_path / "writer")
+
+
+def messages(*contents: str) -> list[dict]:
+    return [{"role": "user", "content": x} for x in contents]
+
+
+def test_search_ranks_matching_messages(index):
+    index.add_messages("alice", "s1", messages("the weather in paris", "train times to lyon"))
+    index.add_messages("alice", "s2", messages("paris paris museums"))
+
+    hits = index.search("Alice", "paris")
+    assert [(x.session_id, x.message_index) for x in hits] == [("s2", 0), ("s1", 0)]
+    assert index.search("bob", "paris") == []
+
+
+def test_compact_keeps_the_newest_copy_of_each_message(index):
+    index.add_messages("alice", "s1", messages("draft about tigers"))
+    index.add_messages("alice", "s1", messages("final about lions"))
+
+    assert index.compact("alice")
+    assert [x.preview for x in index.search("alice", "about")] == ["final about lions"]
+    assert index.search("alice", "tigers") == []
+
+
+def test_search_retries_when_compacted_while_opening(index, memory, s3_client, bucket, fernet, tmp_path):
+    index.add_messages("alice", "s1", messages("first note on kayaks"))
+    index.add_messages("alice", "s2", messages("second note on kayaks"))
+    # a reader on another host, with none of the segments cached locally
+    reader = make_index(memory, s3_client, bucket, fernet, tmp_path / "reader")
+    open_segment = reader._open_segment
+    compacted = []
+
+    def compact_first(username, segment_id):
+        if not compacted:
+            compacted.append(index.compact(username))
+        return open_segment(username, segment_id)
+
+    reader._open_segment = compact_first
+    hits = reader.search("alice", "kayaks")
+    assert compacted[0] and len(hits) == 2
+
+
+def test_evicted_segments_are_unmapped(memory, s3_client, bucket, fernet, tmp_path):
+    index = make_index(memory, s3_client, bucket, fernet, tmp_path, max_open_segments=1)
+    first = index.add_messages("alice", "s1", messages("alpha"))
+    index.add_messages("alice", "s2", messages("beta"))
+
+    segment = index._open_segment("alice", first)
+    segment.release()
+    index.search("alice", "beta")
+    assert segment.closed
+
+
+def test_eviction_waits_for_readers(memory, s3_client, bucket, fernet, tmp_path):
+    index = make_index(memory, s3_client, bucket, fernet, tmp_path, max_open_segments=1)
+    first = index.add_messages("alice", "s1", messages("alpha"))
+    second = index.add_messages("alice", "s2", messages("beta"))
+
+    segment = index._open_segment("alice", first)
+    index._open_segment("alice", second).release()
+    assert not segment.closed and segment.postings("alpha")[0].tolist() == [0]
+    segment.release()
+    assert segment.closed
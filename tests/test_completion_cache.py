@@ -0,0 +1,57 @@
+import pytest
+
+from misc_shared.completion_cache import (
+    CompletionCache,
+    CompletionCacheSettings,
+    completion_cache_key,
+    is_deterministic,
+    replay_chunks,
+)
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+@pytest.mark.parametrize(
+    "temperature,seed,expected",
+    [(0, None, True), (0.0, None, True), (0.7, None, False), (None, None, False), (0.7, 42, True), (None, 0, True)],
+)
+def test_only_deterministic_requests_are_cached(temperature, seed, expected):
+    assert is_deterministic(temperature, seed) is expected
+
+
+def test_key_ignores_extra_message_fields_and_slider_noise():
+    base = completion_cache_key("gpt-4", MESSAGES, 0.1, None)
+    noisy = [{"content": "hi", "role": "user", "name": "ignored"}]
+    assert completion_cache_key("gpt-4", noisy, 0.1 + 1e-9, None) == base
+    assert completion_cache_key("gpt-4", MESSAGES, 0.1, 1) != base
+    assert completion_cache_key("gpt-4o", MESSAGES, 0.1, None) != base
+
+
+def test_lru_evicts_the_least_recently_used():
+    cache = CompletionCache(CompletionCacheSettings(max_entries=2))
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"
+    cache.put("c", "C")
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ("A", "C")
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_disk_tier_outlives_the_process_cache(tmp_path):
+    settings = CompletionCacheSettings(tier="disk", disk_cache_dir=str(tmp_path), max_entries=1)
+    cache = CompletionCache(settings)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    # evicted from the LRU, still on disk, and promoted back on read
+    assert cache.get("a") == "A"
+    assert CompletionCache(settings).get("b") == "B"
+
+
+def test_dynamodb_tier(memory):
+    CompletionCache(CompletionCacheSettings(tier="dynamodb"), memory=memory).put("k", "stored", model="gpt-4")
+    assert CompletionCache(CompletionCacheSettings(tier="dynamodb"), memory=memory).get("k") == "stored"
+
+
+def test_replay_chunks():
+    assert list(replay_chunks("abcdefg", 3)) == ["abc", "def", "g"]
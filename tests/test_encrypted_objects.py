@@ -0,0 +1,62 @@
+import io
+import os
+
+import pytest
+
+from misc_shared.encrypted_objects import (
+    CHUNKED_FORMAT,
+    LEGACY_FORMAT,
+    EncryptedObjectStore,
+    token_length,
+)
+
+
+@pytest.fixture
+def objects(s3_client, bucket, fernet) -> EncryptedObjectStore:
+    return EncryptedObjectStore(s3_client, bucket, fernet, chunk_size=1000)
+
+
+@pytest.mark.parametrize("size", [0, 1, 15, 16, 999, 1000, 4096])
+def test_token_length_matches_fernet(fernet, size):
+    assert token_length(size) == len(fernet.encrypt(b"x" * size))
+
+
+def test_small_object_round_trips_in_one_put(objects, s3_client, bucket):
+    data = os.urandom(2500)
+    info = objects.put("small", data, content_type="application/octet-stream")
+    assert info.format == CHUNKED_FORMAT and info.chunk_count == 3
+    assert objects.get("small") == data
+    assert s3_client.head_object(Bucket=bucket, Key="small")["ContentType"] == "application/octet-stream"
+
+
+def test_large_object_uploads_in_parts(s3_client, bucket, fernet):
+    objects = EncryptedObjectStore(s3_client, bucket, fernet, chunk_size=1024 * 1024, max_workers=2)
+    data = os.urandom(12 * 1024 * 1024 + 123)
+    # a stream, fed through in chunk-sized reads
+    info = objects.put("large", io.BytesIO(data))
+    assert s3_client.head_object(Bucket=bucket, Key="large", PartNumber=1)["PartsCount"] > 1
+    assert info.encrypted_size == objects.head("large").encrypted_size
+    out = io.BytesIO()
+    assert objects.download("large", out) == len(data)
+    assert out.getvalue() == data
+
+
+def test_iterable_source_is_recut_into_chunks(objects):
+    pieces = [b"a" * 700, b"b" * 700, b"c" * 700]
+    objects.put("pieces", iter(pieces))
+    assert [len(x) for x in objects.iter_chunks("pieces")] == [1000, 1000, 100]
+
+
+@pytest.mark.parametrize("start,end", [(0, 10), (990, 1010), (1500, None), (2999, 3000), (2500, 9999), (3000, 3100)])
+def test_read_range_matches_slice(objects, start, end):
+    data = os.urandom(3000)
+    objects.put("ranged", data)
+    assert objects.read_range("ranged", start, end) == data[start:end]
+
+
+def test_legacy_single_token_blobs_are_readable(objects, s3_client, bucket, fernet):
+    data = b"legacy auth db"
+    s3_client.put_object(Bucket=bucket, Key="legacy", Body=fernet.encrypt(data))
+    assert objects.head("legacy").format == LEGACY_FORMAT
+    assert objects.get("legacy") == data
+    assert objects.read_range("legacy", 7, 11) == b"auth"
@@ -0,0 +1,124 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from misc_shared.fin_analytics import (
+    dcf_value,
+    drawdowns,
+    moving_averages,
+    price_chart,
+    read_price_file,
+    returns,
+    summarize,
+    valuation_table,
+)
+
+
+def make_prices(days: int = 300) -> pd.DataFrame:
+    index = pd.date_range("2024-01-01", periods=days, freq="B")
+    prices = pd.DataFrame({"AAA": np.arange(1.0, days + 1), "BBB": np.full(days, 50.0)}, index=index)
+    prices.columns.name = "symbol"
+    return prices
+
+
+def test_moving_averages_are_keyed_by_window_then_symbol():
+    averages = moving_averages(make_prices(), (50, 200))
+    assert averages[50]["AAA"].iloc[-1] == np.mean(np.arange(251.0, 301.0))
+    assert np.isnan(averages[200]["AAA"].iloc[198])
+
+
+def test_price_chart_selects_one_symbol():
+    prices = make_prices()
+    chart = price_chart(prices, "AAA", (50, 200))
+    assert list(chart.columns) == ["close", "sma_50", "sma_200"]
+    assert chart["close"].equals(prices["AAA"].rename("close"))
+    assert chart["sma_50"].iloc[-1] == np.mean(np.arange(251.0, 301.0))
+    assert chart["sma_200"].iloc[-1] == np.mean(np.arange(101.0, 301.0))
+
+
+def hand_prices() -> pd.DataFrame:
+    # AAA: +10%, -10%, +22.2...%; BBB starts a day late
+    index = pd.date_range("2024-01-01", periods=4, freq="B")
+    prices = pd.DataFrame({"AAA": [100.0, 110.0, 99.0, 121.0], "BBB": [np.nan, 50.0, 55.0, 50.0]}, index=index)
+    prices.columns.name = "symbol"
+    return prices
+
+
+def test_returns_and_drawdowns():
+    prices = hand_prices()
+    np.testing.assert_allclose(returns(prices)["AAA"].iloc[1:], [0.1, -0.1, 121 / 99 - 1])
+    np.testing.assert_allclose(returns(prices, log=True)["AAA"].iloc[1:], np.log([1.1, 0.9, 121 / 99]))
+    assert np.isnan(returns(prices)["BBB"].iloc[1])
+    assert drawdowns(prices)["AAA"].tolist() == [0.0, 0.0, pytest.approx(-0.1), 0.0]
+    assert drawdowns(prices)["BBB"].iloc[-1] == pytest.approx(50 / 55 - 1)
+
+
+def test_summarize_matches_hand_computed_metrics():
+    summary = summarize(hand_prices(), risk_free_rate=0.0252)
+    daily = np.array([0.1, -0.1, 121 / 99 - 1])
+    volatility = daily.std(ddof=1) * np.sqrt(252)
+    row = summary.loc["AAA"]
+    assert row["observations"] == 4 and row["last_close"] == 121.0
+    assert row["total_return"] == pytest.approx(0.21)
+    assert row["annual_return"] == pytest.approx(1.21 ** (252 / 3) - 1)
+    assert row["annual_volatility"] == pytest.approx(volatility)
+    assert row["sharpe"] == pytest.approx((daily.mean() - 0.0001) * 252 / volatility)
+    assert row["max_drawdown"] == pytest.approx(-0.1)
+    # BBB's first observation is its first valid price, not the leading NaN
+    assert summary.loc["BBB", "observations"] == 3
+    assert summary.loc["BBB", "total_return"] == pytest.approx(0.0)
+    assert not summary.loc["AAA", "above_sma_200"]
+
+
+def loop_dcf(fcf, r, g, tg, years):
+    value, cash_flow = 0.0, fcf
+    for year in range(1, years + 1):
+        cash_flow *= 1 + g
+        value += cash_flow / (1 + r) ** year
+    return value + cash_flow * (1 + tg) / (r - tg) / (1 + r) ** years
+
+
+def test_dcf_value_matches_a_loop():
+    rates, growths = np.array([0.06, 0.08, 0.12]), np.array([-0.02, 0.0, 0.08, 0.12])
+    values = dcf_value(250.0, rates[:, None], growths[None, :], 0.02, 7)
+    for i, r in enumerate(rates):
+        for j, g in enumerate(growths):
+            assert values[i, j] == pytest.approx(loop_dcf(250.0, r, g, 0.02, 7))
+    assert np.isnan(dcf_value(1.0, 0.03, 0.05, 0.03))
+
+
+def test_valuation_table():
+    fundamentals = pd.DataFrame(
+        {
+            "Symbol": ["aaa", "bbb"],
+            "Free Cash Flow": [100.0, 50.0],
+            "shares_outstanding": [10.0, 5.0],
+            "net_debt": [200.0, np.nan],
+        }
+    )
+    table = valuation_table(fundamentals, 0.09, 0.03, 0.02, 5, last_close=pd.Series({"AAA": 100.0}))
+    assert table.loc["AAA", "enterprise_value"] == pytest.approx(loop_dcf(100.0, 0.09, 0.03, 0.02, 5))
+    assert table.loc["AAA", "value_per_share"] == pytest.approx((loop_dcf(100.0, 0.09, 0.03, 0.02, 5) - 200) / 10)
+    assert table.loc["BBB", "equity_value"] == table.loc["BBB", "enterprise_value"]
+    assert table.loc["AAA", "upside"] == pytest.approx(table.loc["AAA", "value_per_share"] / 100 - 1)
+    assert np.isnan(table.loc["BBB", "upside"])
+
+
+def test_read_price_file_long_and_wide():
+    long_csv = io.StringIO(
+        "Date,Symbol,Close,Adj Close\n2024-01-02,aaa,10,9\n2024-01-02,bbb,20,20\n2024-01-03,aaa,11,10\n"
+    )
+    long = read_price_file(long_csv, "prices.csv")
+    assert list(long.columns) == ["AAA", "BBB"] and long.columns.name == "symbol"
+    assert long["AAA"].tolist() == [9.0, 10.0]
+    assert np.isnan(long.loc["2024-01-03", "BBB"])
+
+    wide_parquet = io.BytesIO()
+    pd.DataFrame({"date": ["2024-01-03", "2024-01-02"], "aaa": [11, 10], "ccc": ["5", "x"]}).to_parquet(wide_parquet)
+    wide_parquet.seek(0)
+    wide = read_price_file(wide_parquet, "prices.parquet")
+    assert isinstance(wide.index, pd.DatetimeIndex) and wide.index.is_monotonic_increasing
+    assert wide["AAA"].tolist() == [10.0, 11.0]
+    assert wide["CCC"].isna().tolist() == [True, False]
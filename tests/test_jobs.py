@@ -0,0 +1,170 @@
+import threading
+import time
+
+import pytest
+
+from misc_shared.jobs import MAX_RESULT_BYTES, JobRunner, JobSettings, JobSnapshot, fit_result, job_key
+from misc_shared.models import JobRecord
+
+
+@pytest.fixture
+def runner(memory) -> JobRunner:
+    return JobRunner(memory, JobSettings(flush_seconds=0.0))
+
+
+def wait_finished(runner: JobRunner, job_id: str, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        snapshot = runner.poll(job_id)
+        if snapshot is not None and snapshot.finished and job_id not in runner._running:
+            return snapshot
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def add(context, a: int, b: int) -> int:
+    context.report(1, 1, "adding")
+    return a + b
+
+
+def test_job_result_is_stored(runner, memory):
+    job_id = runner.submit("test.add", add, {"a": 1, "b": 2})
+    assert job_id == job_key("test.add", {"a": 1, "b": 2})
+    assert wait_finished(runner, job_id).result == 3
+    # another worker sees the stored record
+    assert JobRunner(memory).poll(job_id).result == 3
+
+
+def test_failed_job_can_be_resubmitted(runner):
+    attempts = []
+
+    def flaky(context):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("boom")
+        return "ok"
+
+    job_id = runner.submit("test.flaky", flaky)
+    snapshot = wait_finished(runner, job_id)
+    assert snapshot.status == "failed" and "boom" in snapshot.error
+    runner.submit("test.flaky", flaky)
+    assert wait_finished(runner, job_id).result == "ok"
+
+
+def test_active_job_is_claimed_by_one_worker(memory):
+    release = threading.Event()
+    started = []
+
+    def slow(context):
+        started.append(1)
+        release.wait(5)
+        return "done"
+
+    first, second = JobRunner(memory), JobRunner(memory)
+    job_id = first.submit("test.slow", slow)
+    assert second.submit("test.slow", slow) == job_id
+    release.set()
+    assert wait_finished(first, job_id).result == "done"
+    assert started == [1]
+
+
+def test_stale_job_is_taken_over(memory):
+    release = threading.Event()
+    gone = JobRunner(memory, JobSettings(flush_seconds=3600))
+    job_id = gone.submit("test.stuck", lambda context: release.wait(5))
+    taker = JobRunner(memory, JobSettings(stale_seconds=0.0))
+    time.sleep(0.01)
+    assert taker.submit("test.stuck", lambda context: "recovered") == job_id
+    assert job_id in taker._running
+    release.set()
+    assert wait_finished(taker, job_id).result == "recovered"
+
+
+def test_cancel(runner):
+    started = threading.Event()
+
+    def loop(context):
+        started.set()
+        while True:
+            context.report(0)
+            time.sleep(0.01)
+
+    job_id = runner.submit("test.loop", loop)
+    started.wait(5)
+    runner.cancel(job_id)
+    assert wait_finished(runner, job_id).status == "cancelled"
+
+
+def test_oversized_partial_is_not_stored_but_oversized_result_fails(runner, memory):
+    big = ["x" * 1000] * (MAX_RESULT_BYTES // 1000 + 1)
+
+    def partial_then_small(context):
+        context.report(1, 2, partial=big)
+        return "small"
+
+    job_id = runner.submit("test.partial", partial_then_small)
+    assert wait_finished(runner, job_id).result == "small"
+
+    job_id = runner.submit("test.huge", lambda context: big)
+    snapshot = wait_finished(runner, job_id)
+    assert snapshot.status == "failed"
+    assert JobRunner(memory).poll(job_id).result is None
+
+
+def test_fit_result():
+    rows = [{"value": "x" * 100}] * 50
+    fitted = fit_result(rows, 1000)
+    assert 0 < len(fitted) < len(rows)
+    assert fitted is not rows
+    assert fit_result(rows) == rows
+
+
+def test_progress_save_never_reverts_a_concurrent_cancel(runner, memory, monkeypatch):
+    snapshot = JobSnapshot(job_id="raced", kind="test.raced", status="running")
+    runner.save(snapshot)
+    update_item = memory.dynamodb_table.update_item
+    raced = []
+
+    def cancel_first(**kwargs):
+        # another process's cancel lands just before this save's write
+        if not raced:
+            raced.append(True)
+            JobRunner(memory).cancel("raced")
+        return update_item(**kwargs)
+
+    monkeypatch.setattr(memory.dynamodb_table, "update_item", cancel_first)
+    assert runner.save(snapshot.model_copy(update={"done": 1})).cancel_requested
+    assert memory.get_existing("raced", JobRecord, consistent_read=True).cancel_requested
+
+
+def test_cancel_from_another_process_stops_the_job(memory):
+    started, release = threading.Event(), threading.Event()
+
+    def watched(context):
+        started.set()
+        release.wait(5)
+        context.report(1, 2)
+        return "finished anyway"
+
+    worker = JobRunner(memory, JobSettings(flush_seconds=0.0))
+    job_id = worker.submit("test.watched", watched)
+    assert started.wait(5)
+    JobRunner(memory).cancel(job_id)
+    release.set()
+    assert wait_finished(worker, job_id).status == "cancelled"
+
+
+def test_save_recreates_a_missing_record(runner, memory):
+    snapshot = JobSnapshot(job_id="gone", kind="test.gone", status="running", done=3, total=None)
+    record = runner.save(snapshot)
+    assert (record.params, record.done, record.total, record.cancel_requested) == ("{}", 3, None, False)
+    assert memory.get_existing("gone", JobRecord).kind == "test.gone"
+    assert runner.save(snapshot.model_copy(update={"total": 10, "message": "x"})).total == 10
+    assert runner.save(snapshot).total is None
+
+
+def test_cancel_of_a_finished_job_is_ignored(runner, memory):
+    job_id = runner.submit("test.add", add, {"a": 1, "b": 1})
+    wait_finished(runner, job_id)
+    JobRunner(memory).cancel(job_id)
+    assert not memory.get_existing(job_id, JobRecord, consistent_read=True).cancel_requested
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+from misc_shared.llm_streaming import BufferedStreamRenderer
+
+
+class Placeholder:
+    def __init__(self):
+        self.rendered = []
+
+    def markdown(self, text: str):
+        self.rendered.append(text)
+
+
+def test_flushes_when_enough_characters_are_waiting():
+    placeholder = Placeholder()
+    renderer = BufferedStreamRenderer(placeholder, flush_interval=60, flush_chars=10, cursor="|")
+    assert renderer.render(iter(["abcd", "efgh", "ijkl", "mn"])) == "abcdefghijklmn"
+    # one flush once 12 chars were waiting, then the final render without the cursor
+    assert placeholder.rendered == ["abcdefghijkl|", "abcdefghijklmn"]
+    assert renderer.flushes == 2
+
+
+def test_flushes_on_the_interval():
+    def slow():
+        for text in ["a", "b", "c"]:
+            yield text
+            time.sleep(0.05)
+
+    placeholder = Placeholder()
+    renderer = BufferedStreamRenderer(placeholder, flush_interval=0.01, flush_chars=10_000, cursor="|")
+    assert renderer.render(slow()) == "abc"
+    assert placeholder.rendered[:3] == ["a|", "ab|", "abc|"]
+    assert placeholder.rendered[-1] == "abc"
+
+
+def test_worker_thread_is_joined():
+    renderer = BufferedStreamRenderer(Placeholder())
+    renderer.render(iter(["done"]))
+    assert not renderer._worker.is_alive()
+
+
+def test_stream_errors_reach_the_caller():
+    def broken():
+        yield "partial"
+        raise ConnectionError("dropped")
+
+    with pytest.raises(ConnectionError):
+        BufferedStreamRenderer(Placeholder()).render(broken())
+
+
+def test_stopping_the_render_closes_the_stream():
+    closed = threading.Event()
+
+    def endless():
+        try:
+            while True:
+                yield "x"
+                time.sleep(0.001)
+        finally:
+            closed.set()
+
+    class StopRender(Exception):
+        pass
+
+    class Stopping(Placeholder):
+        def markdown(self, text: str):
+            raise StopRender()
+
+    with pytest.raises(StopRender):
+        BufferedStreamRenderer(Stopping(), flush_interval=0.0).render(endless())
+    assert closed.wait(5)
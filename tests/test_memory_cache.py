@@ -0,0 +1,90 @@
+from typing import Optional
+
+import pytest
+from simplesingletable import DynamodbResource
+
+from misc_shared.auth_store import ShardedCredentialStore
+from misc_shared.memory_cache import CachedMemory, MemoryCacheSettings, TtlLruCache
+from misc_shared.models import Example
+
+
+@pytest.fixture
+def cached(memory) -> CachedMemory:
+    return CachedMemory(memory, MemoryCacheSettings(ttl_seconds=60))
+
+
+def test_reads_are_served_from_cache(cached):
+    created = cached.create_new(Example, {"name": "a"})
+    cached.get_existing(created.resource_id, Example)
+    stats = cached.get_cache_stats()
+    assert stats.hits == 1 and stats.misses == 0
+
+
+def test_consistent_read_does_not_refill_cache(cached, memory):
+    created = cached.create_new(Example, {"name": "a"})
+    cached.invalidate(Example, created.resource_id)
+    cached.get_existing(created.resource_id, Example, consistent_read=True)
+    memory.update_existing(memory.get_existing(created.resource_id, Example), {"name": "b"})
+    assert cached.get_existing(created.resource_id, Example).name == "b"
+
+
+def test_direct_auth_writes_invalidate_cached_records(cached, fernet):
+    # the store's own per-user cache is off, so every get_user goes through CachedMemory
+    store = ShardedCredentialStore(cached, fernet, cache_seconds=0)
+    store.put_user("alice", {"password": "old"})
+    assert store.get_user("alice") == {"password": "old"}
+
+    store.put_user("alice", {"password": "new"}, base={"password": "old"})
+    assert store.get_user("alice") == {"password": "new"}
+
+    store.delete_user("alice")
+    assert store.get_user("alice") is None
+
+
+def test_ttl_lru_cache_evicts_oldest():
+    cache = TtlLruCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    assert cache.set("c", 3) == 1
+    assert cache.get("b", None) is None
+    assert cache.get("a") == 1
+
+
+def test_lru_reports_every_dropped_value():
+    dropped = []
+    lru = TtlLruCache(max_entries=2, ttl_seconds=60, on_evict=dropped.append)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.set("c", 3) == 1
+    lru.set("b", 20)
+    lru.delete("c")
+    assert dropped == [1, 2, 3]
+    lru.clear()
+    assert dropped == [1, 2, 3, 20]
+
+
+class Counted(DynamodbResource):
+    count: int = 0
+    tags: Optional[set[str]] = None
+
+
+def test_in_place_updates_invalidate_the_cached_item(cached):
+    created = cached.create_new(Counted, {})
+    cached.get_existing(created.resource_id, Counted)
+
+    cached.increment_counter(created, "count", 2)
+    assert cached.get_existing(created.resource_id, Counted).count == 2
+    cached.add_to_set(created, "tags", "a")
+    assert cached.get_existing(created.resource_id, Counted).tags == {"a"}
+    cached.remove_from_set(created, "tags", "a")
+    assert not cached.get_existing(created.resource_id, Counted).tags
+
+
+def test_in_place_update_lands_a_deferred_put_first(memory):
+    cached = CachedMemory(memory, MemoryCacheSettings(ttl_seconds=60, write_behind=True, flush_interval_seconds=3600))
+    created = cached.create_new(Counted, {})
+    cached.put_deferred(created.model_copy(update={"count": 5}))
+    cached.increment_counter(created, "count")
+    cached.flush()
+    assert memory.get_existing(created.resource_id, Counted).count == 6
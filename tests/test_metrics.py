@@ -0,0 +1,74 @@
+import time
+
+import boto3
+import pytest
+
+from misc_shared.metrics import Histogram, MetricsRegistry, instrument_boto_client
+
+
+@pytest.fixture
+def registry() -> MetricsRegistry:
+    return MetricsRegistry()
+
+
+def test_histogram_quantiles_are_within_a_bucket():
+    histogram = Histogram("h")
+    for ms in range(1, 101):
+        histogram.record(ms / 1000, nbytes=10)
+    summary = histogram.summary()
+    assert summary.count == 100 and summary.bytes_total == 1000
+    assert summary.mean_ms == pytest.approx(50.5)
+    assert summary.p50_ms == pytest.approx(50, rel=0.1)
+    assert summary.p99_ms == pytest.approx(99, rel=0.1)
+    assert summary.max_ms == pytest.approx(100)
+    assert Histogram("empty").quantile(0.5) == 0.0
+
+
+def test_timer_records_duration_bytes_and_errors(registry):
+    with registry.timer("op") as extra:
+        time.sleep(0.01)
+        extra["bytes"] = 42
+    with pytest.raises(RuntimeError):
+        with registry.timer("op"):
+            raise RuntimeError()
+    summary = registry.histogram("op").summary()
+    assert (summary.count, summary.errors, summary.bytes_total) == (2, 1, 42)
+    assert summary.max_ms >= 10
+
+
+def test_timed_decorator_and_disabled_registry(registry):
+    @registry.timed("fn")
+    def fn(x):
+        return x * 2
+
+    assert fn(2) == 4 and registry.histogram("fn").count == 1
+    disabled = MetricsRegistry(enabled=False)
+    disabled.record("fn", 1.0)
+    assert disabled.summaries() == []
+
+
+def test_timed_stream_records_first_chunk_and_total(registry):
+    chunks = list(registry.timed_stream("llm", iter(["hé", "llo"])))
+    assert chunks == ["hé", "llo"]
+    assert registry.histogram("llm.first_chunk").count == 1
+    assert registry.histogram("llm").summary().bytes_total == len("héllo".encode())
+
+
+def test_instrumented_boto_client_records_calls(aws, registry):
+    client = instrument_boto_client(boto3.client("s3"), registry)
+    instrument_boto_client(client, registry)
+    client.create_bucket(Bucket="metrics", CreateBucketConfiguration={"LocationConstraint": "us-west-2"})
+    client.put_object(Bucket="metrics", Key="k", Body=b"x" * 100)
+    with pytest.raises(client.exceptions.NoSuchKey):
+        client.get_object(Bucket="metrics", Key="missing")
+
+    put = registry.histogram("s3.PutObject").summary()
+    assert put.count == 1 and put.errors == 0 and put.bytes_total >= 100
+    assert registry.histogram("s3.GetObject").summary().errors == 1
+
+
+def test_export_appends_a_json_line(registry, tmp_path):
+    registry.record("op", 0.001)
+    path = registry.export(tmp_path / "metrics.jsonl")
+    registry.export(path)
+    assert len(path.read_text().splitlines()) == 2
@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import pytest
+
+from misc_shared.model_catalog import FALLBACK_MODELS, ModelCatalog, context_window_for
+
+
+def listed(*ids: str):
+    return lambda: [SimpleNamespace(id=x, owned_by="openai", created=1_700_000_000) for x in ids]
+
+
+@pytest.mark.parametrize(
+    "model_id,expected",
+    [
+        ("gpt-3.5-turbo", 4096),
+        ("gpt-3.5-turbo-16k-0613", 16385),
+        ("gpt-4-0613", 8192),
+        ("gpt-4-1106-preview", 128000),
+        ("gpt-4o-mini", 128000),
+        ("davinci-002", None),
+    ],
+)
+def test_context_window_uses_the_longest_prefix(model_id, expected):
+    assert context_window_for(model_id) == expected
+
+
+def test_serves_the_fallback_until_a_refresh_lands():
+    catalog = ModelCatalog(listed("gpt-4o", "whisper-1"), start=False)
+    assert catalog.model_ids() == sorted(FALLBACK_MODELS) and catalog.status().using_fallback
+
+    catalog.refresh()
+    assert catalog.model_ids() == ["gpt-4o"]
+    assert catalog.get("gpt-4o").created.year == 2023
+    assert not catalog.status().using_fallback
+    # unknown ids still get a window by prefix
+    assert catalog.context_window("gpt-4-32k-0613") == 32768
+
+
+def test_failed_refresh_keeps_the_last_list():
+    def broken():
+        raise ConnectionError("down")
+
+    catalog = ModelCatalog(broken, start=False)
+    with pytest.raises(ConnectionError):
+        catalog.refresh()
+    assert catalog.model_ids() == sorted(FALLBACK_MODELS)
+
+    catalog.list_models = listed()
+    with pytest.raises(ValueError):
+        catalog.refresh()
+    assert catalog.model_ids() == sorted(FALLBACK_MODELS)
+
+
+def test_background_thread_refreshes():
+    catalog = ModelCatalog(listed("gpt-4-turbo"))
+    assert catalog.wait_until_refreshed(5)
+    assert catalog.model_ids() == ["gpt-4-turbo"]
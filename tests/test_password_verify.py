@@ -0,0 +1,101 @@
+import time
+
+import bcrypt
+import pytest
+
+from misc_shared.password_verify import (
+    FailureWindow,
+    LoginThrottled,
+    PasswordVerifier,
+    VerifierBusy,
+    VerifierSettings,
+)
+
+
+def hash_password(password: str) -> str:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=4)).decode()
+
+
+@pytest.fixture
+def verifier():
+    verifier = PasswordVerifier(VerifierSettings(workers=1, user_failures=3, ip_failures=5))
+    yield verifier
+    verifier.shutdown()
+
+
+def test_checks_the_password(verifier):
+    hashed = hash_password("hunter2")
+    assert verifier.verify("Alice", "hunter2", hashed)
+    assert not verifier.verify("alice", "wrong", hashed)
+    assert verifier.status().in_flight == 0
+
+
+def test_repeat_login_skips_bcrypt_until_the_hash_changes(verifier, monkeypatch):
+    hashed = hash_password("hunter2")
+    assert verifier.verify("alice", "hunter2", hashed)
+
+    def no_pool(password, hashed):
+        raise AssertionError("went to the pool")
+
+    monkeypatch.setattr(verifier, "_run_check", no_pool)
+    assert verifier.verify("ALICE", "hunter2", hashed)
+    with pytest.raises(AssertionError):
+        verifier.verify("alice", "hunter2", hash_password("hunter2"))
+
+
+def test_repeated_failures_throttle_the_user(verifier):
+    hashed = hash_password("hunter2")
+    for _ in range(3):
+        assert not verifier.verify("alice", "wrong", hashed)
+    with pytest.raises(LoginThrottled) as raised:
+        verifier.verify("alice", "hunter2", hashed)
+    assert raised.value.retry_after > 0
+    # other users are unaffected
+    assert verifier.verify("bob", "hunter2", hashed)
+
+
+def test_repeated_failures_throttle_the_client_ip(verifier):
+    hashed = hash_password("hunter2")
+    for i in range(5):
+        verifier.verify(f"user{i}", "wrong", hashed, ip="10.0.0.1")
+    with pytest.raises(LoginThrottled):
+        verifier.verify("someone", "hunter2", hashed, ip="10.0.0.1")
+    assert verifier.verify("someone", "hunter2", hashed, ip="10.0.0.2")
+
+
+def test_full_queue_is_refused(verifier):
+    verifier._in_flight = verifier.max_pending
+    with pytest.raises(VerifierBusy):
+        verifier.verify("alice", "hunter2", hash_password("hunter2"))
+
+
+def test_failure_window_slides():
+    window = FailureWindow(limit=2, window_seconds=0.2)
+    window.fail("a")
+    window.fail("a")
+    assert window.retry_after("a") > 0
+    time.sleep(0.25)
+    assert window.retry_after("a") == 0 and len(window) == 0
+
+
+def test_unknown_usernames_count_against_the_client_ip(verifier):
+    for i in range(5):
+        verifier.reject_unknown_user(f"nobody{i}", ip="10.0.0.1")
+    with pytest.raises(LoginThrottled):
+        verifier.reject_unknown_user("nobody", ip="10.0.0.1")
+    with pytest.raises(LoginThrottled):
+        verifier.verify("alice", "hunter2", hash_password("hunter2"), ip="10.0.0.1")
+
+
+def test_authenticator_records_unknown_usernames(verifier, monkeypatch):
+    import misc_shared.password_verify as password_verify
+    from misc_shared.auth_helpers import AppAuthenticate
+
+    monkeypatch.setattr(password_verify, "get_password_verifier", lambda: verifier)
+    monkeypatch.setattr(password_verify, "client_ip", lambda: "10.0.0.1")
+    authenticator = AppAuthenticate.__new__(AppAuthenticate)
+    authenticator.credentials = {"usernames": {"alice": {"password": hash_password("hunter2")}}}
+    authenticator.username, authenticator.password = "mallory", "guess"
+
+    assert authenticator._check_credentials(inplace=False) is False
+    assert verifier.ip_failures.retry_after("10.0.0.1") == 0 and len(verifier.ip_failures) == 1
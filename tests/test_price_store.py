@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+
+from misc_shared.price_store import INDEX_FILE, PriceStore
+
+
+def wide(dates, **columns) -> pd.DataFrame:
+    return pd.DataFrame(columns, index=pd.to_datetime(dates))
+
+
+@pytest.fixture
+def store(tmp_path) -> PriceStore:
+    return PriceStore(tmp_path)
+
+
+def test_append_wide_appends_and_replaces_within_a_partition(store):
+    assert store.append_wide(wide(["2023-03-01", "2023-03-02"], aaa=[1.0, 2.0], bbb=[10.0, 20.0])) == 2
+    # one new date and one restated date, both in AAA's 2023 file
+    assert store.append_wide(wide(["2023-03-02", "2023-03-03"], aaa=[2.5, 3.0])) == 1
+
+    stored = store.read("aaa")
+    assert stored["close"].tolist() == [1.0, 2.5, 3.0]
+    assert stored.index.is_monotonic_increasing
+    assert store.coverage("AAA").years == {2023: 3}
+    assert store.read("bbb")["close"].tolist() == [10.0, 20.0]
+
+
+def test_read_many_across_a_year_boundary(store):
+    dates = ["2022-12-29", "2022-12-30", "2023-01-03", "2023-01-04"]
+    store.append_wide(wide(dates, aaa=[1.0, 2.0, 3.0, 4.0], bbb=[5.0, 6.0, 7.0, 8.0]))
+    assert set(store.coverage("aaa").years) == {2022, 2023}
+
+    prices = store.read_many(["aaa", "bbb"], "2022-12-30", "2023-01-03")
+    assert list(prices.columns) == ["AAA", "BBB"]
+    assert prices.index.tolist() == list(pd.to_datetime(["2022-12-30", "2023-01-03"]))
+    assert prices["BBB"].tolist() == [6.0, 7.0]
+
+
+def test_index_survives_a_reload(store, tmp_path):
+    store.append_wide(wide(["2022-06-01", "2023-06-01"], zzz=[1.0, 2.0], aaa=[3.0, 4.0]))
+    store.append_wide(wide(["2024-01-02"], aaa=[5.0]))
+
+    reloaded = PriceStore(tmp_path)
+    assert reloaded.symbols() == ["AAA", "ZZZ"]
+    coverage = reloaded.coverage_frame()
+    assert coverage.loc["AAA"].tolist() == ["2022-06-01", "2024-01-02", 3]
+    assert coverage.loc["ZZZ", "rows"] == 2
+    assert reloaded.read("aaa", "2024-01-01")["close"].tolist() == [5.0]
+
+
+def test_writes_leave_no_temp_files(store, tmp_path):
+    store.append_wide(wide(["2023-01-03", "2024-01-02"], aaa=[1.0, 2.0]))
+    store.append_wide(wide(["2024-01-02"], aaa=[2.5]))
+    files = sorted(str(p.relative_to(tmp_path)) for p in tmp_path.rglob("*") if p.is_file())
+    assert files == sorted([INDEX_FILE, "AAA/2023.parquet", "AAA/2024.parquet"])
+
+
+def test_failed_write_keeps_the_old_file_and_no_temp_file(store, tmp_path, monkeypatch):
+    store.append_wide(wide(["2023-01-03"], aaa=[1.0]))
+
+    def broken(self, path, **kwargs):
+        open(path, "wb").write(b"partial")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(pd.DataFrame, "to_parquet", broken)
+    with pytest.raises(OSError):
+        store.append_wide(wide(["2023-01-04"], aaa=[2.0]))
+    monkeypatch.undo()
+    assert not list(tmp_path.rglob("*.tmp"))
+    assert PriceStore(tmp_path).read("aaa")["close"].tolist() == [1.0]
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from misc_shared.scenarios import (
+    ScenarioRanges,
+    clamped_range,
+    dcf_multipliers,
+    draw_scenarios,
+    multiplier_percentiles,
+    percentile_bands,
+)
+
+
+@pytest.fixture
+def draws():
+    return draw_scenarios(ScenarioRanges(), 20_000, seed=0)
+
+
+def test_draws_stay_inside_their_ranges(draws):
+    ranges = ScenarioRanges()
+    for name in ScenarioRanges.model_fields:
+        low, high = getattr(ranges, name)
+        values = getattr(draws, name)
+        assert values.min() >= low and values.max() <= high
+
+
+def test_bands_match_direct_percentiles_for_either_slope_sign(draws):
+    multipliers = dcf_multipliers(draws)
+    fundamentals = pd.DataFrame(
+        {
+            "symbol": ["UP", "DOWN"],
+            "free_cash_flow": [100.0, -100.0],
+            "shares_outstanding": [10.0, 10.0],
+            "net_debt": [50.0, 50.0],
+        }
+    )
+    # deliberately not symmetric around the median, so reversing columns would give the wrong answer
+    percentiles = (10, 50, 80)
+    bands = percentile_bands(fundamentals, multipliers, percentiles)
+    finite = multipliers[np.isfinite(multipliers)]
+    for symbol, fcf in [("UP", 100.0), ("DOWN", -100.0)]:
+        expected = np.percentile((fcf * finite - 50.0) / 10.0, percentiles)
+        np.testing.assert_allclose(bands.loc[symbol, ["p10", "p50", "p80"]].to_numpy(float), expected, rtol=1e-6)
+
+
+def test_multiplier_percentiles_include_mirrors():
+    quantiles, valid_share = multiplier_percentiles(np.array([1.0, 2.0, 3.0, np.inf]), (0, 100))
+    assert quantiles.tolist() == [1.0, 3.0, 3.0, 1.0]
+    assert valid_share == 0.75
+
+
+def test_process_pool_matches_serial(draws):
+    done = []
+    pooled = dcf_multipliers(draws, processes=2, chunk_size=5_000, progress=lambda d, t: done.append((d, t)))
+    np.testing.assert_array_equal(pooled, dcf_multipliers(draws))
+    assert done[-1] == (4, 4)
+
+
+def test_clamped_range():
+    assert clamped_range(0.10, 0.02, 0.0, 0.30) == pytest.approx((0.08, 0.12))
+    assert clamped_range(0.01, 0.02, 0.0, 0.30) == pytest.approx((0.0, 0.03))
+    assert clamped_range(0.50, 0.02, 0.0, 0.30) == pytest.approx((0.30, 0.30))
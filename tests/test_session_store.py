@@ -0,0 +1,127 @@
+from decimal import Decimal
+
+import pytest
+import streamlit as st
+from boto3.dynamodb.conditions import Key
+from logzero import logger
+from pydantic import Field
+from supersullytools.streamlit.sessions import MemorySessionManager, StreamlitSessionBase
+
+from misc_shared.session_store import AppendedField, DeltaSessionManager, DeltaSessionStore
+
+
+class ExampleSession(StreamlitSessionBase):
+    title: str = ""
+    messages: list = Field(default_factory=list)
+
+
+@pytest.fixture
+def store(memory) -> DeltaSessionStore:
+    return DeltaSessionStore(memory.dynamodb_table, ExampleSession, append_only_fields=("messages",), chunk_size=3)
+
+
+@pytest.fixture
+def writes(store, monkeypatch) -> list[dict]:
+    calls = []
+    update_item = store.table.update_item
+
+    def recording(**kwargs):
+        calls.append(kwargs)
+        return update_item(**kwargs)
+
+    monkeypatch.setattr(store.table, "update_item", recording)
+    return calls
+
+
+def messages(count: int, start: int = 0) -> list[dict]:
+    return [{"role": "user", "content": f"message {i}", "score": i / 2} for i in range(start, start + count)]
+
+
+def stored_items(store, session) -> list[dict]:
+    return store.table.query(KeyConditionExpression=Key("pk").eq(store.partition_key(session.session_id)))["Items"]
+
+
+def test_round_trips_across_chunks(store):
+    session = ExampleSession(title="trip", messages=messages(7), expires_at=Decimal(2_000_000_000))
+    store.save(session)
+
+    loaded, snapshot = store.load(session.session_id)
+    assert loaded == session
+    assert snapshot.appended["messages"].count == 7
+    assert sorted(x["sk"] for x in stored_items(store, session))[:3] == [
+        "fields",
+        "messages#000000",
+        "messages#000001",
+    ]
+    assert store.load("missing") is None
+
+
+def test_appending_writes_only_the_new_entries(store, writes):
+    session = ExampleSession(title="trip", messages=messages(4))
+    snapshot = store.save(session)
+    writes.clear()
+
+    session.messages.append(messages(1, start=4)[0])
+    snapshot = store.save(session, snapshot)
+    chunk_write, fields_write = writes
+    assert chunk_write["Key"]["sk"] == "messages#000001"
+    assert len(chunk_write["ExpressionAttributeValues"][":new"]) == 1
+    assert set(fields_write["ExpressionAttributeNames"].values()) == {"n_messages"}
+
+    writes.clear()
+    store.save(session, snapshot)
+    assert writes == []
+    assert store.load(session.session_id)[0].messages == messages(5)
+
+
+def test_edited_history_is_rewritten(store):
+    session = ExampleSession(messages=messages(5))
+    snapshot = store.save(session)
+
+    session.messages = messages(2, start=10)
+    store.save(session, snapshot)
+    assert store.load(session.session_id)[0].messages == messages(2, start=10)
+
+
+def test_append_start(store):
+    entries = messages(4)
+    persisted = store.snapshot(ExampleSession(messages=entries[:3])).appended["messages"]
+    assert store.append_start(entries, persisted) == 3
+    assert store.append_start(entries, None) == 0
+    assert store.append_start(entries[:2], persisted) == 0
+    assert store.append_start(messages(4, start=1), persisted) == 0
+    assert store.append_start(entries, AppendedField()) == 0
+
+
+def test_new_expiry_reaches_every_chunk(store):
+    session = ExampleSession(messages=messages(5), expires_at=Decimal(1_900_000_000))
+    snapshot = store.save(session)
+
+    session.expires_at = Decimal(2_000_000_000)
+    store.save(session, snapshot)
+    assert {x["ttl"] for x in stored_items(store, session)} == {Decimal(2_000_000_000)}
+
+
+def test_sessions_in_the_single_item_format_load_and_migrate(memory, monkeypatch):
+    # both managers put the session id in the URL; newer Streamlit releases dropped the experimental API for that
+    monkeypatch.setattr(st, "experimental_get_query_params", dict, raising=False)
+    monkeypatch.setattr(st, "experimental_set_query_params", lambda **params: None, raising=False)
+    legacy = MemorySessionManager(memory=memory, model_type=ExampleSession, logger=logger, ttl_attribute_name="ttl")
+    session = ExampleSession(title="old", messages=messages(4))
+    legacy.persist_session(session)
+
+    manager = DeltaSessionManager(
+        memory=memory,
+        model_type=ExampleSession,
+        logger=logger,
+        ttl_attribute_name="ttl",
+        append_only_fields=("messages",),
+    )
+    loaded = manager.get_session(session.session_id)
+    assert loaded == session
+    assert manager.is_persisted(loaded) and manager.unsaved_from(loaded, "messages") == 0
+
+    loaded.messages.append(messages(1, start=4)[0])
+    manager.persist_session(loaded)
+    assert manager.store.load(session.session_id)[0].messages == messages(5)
+    assert manager.unsaved_from(loaded, "messages") == 5
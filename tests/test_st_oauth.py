@@ -0,0 +1,93 @@
+import threading
+import time
+from unittest import mock
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from misc_shared.st_oauth import JwksCache, VerifiedTokenCache, validate_access_token
+
+
+def make_key(kid: str):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_jwk = jwt.PyJWK.from_json(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()), algorithm="RS256")
+    token = jwt.encode(
+        {"email": "user@example.com", "exp": int(time.time()) + 3600},
+        private_key,
+        algorithm="RS256",
+        headers={"kid": kid},
+    )
+    return token, public_jwk
+
+
+def jwks_serving(keys: dict) -> JwksCache:
+    jwks = JwksCache("https://test.invalid/jwks", start=False)
+    key_set = mock.Mock()
+    key_set.keys = [mock.Mock(key_id=kid, key=key.key) for kid, key in keys.items()]
+    jwks._client = mock.Mock()
+    jwks._client.get_jwk_set.return_value = key_set
+    # what building the cache with start=True does
+    jwks.refresh()
+    return jwks
+
+
+def publish(jwks: JwksCache, kid: str, public_jwk):
+    jwks._client.get_jwk_set.return_value.keys.append(mock.Mock(key_id=kid, key=public_jwk.key))
+
+
+def test_valid_token_is_memoized():
+    token, public_jwk = make_key("k1")
+    jwks = jwks_serving({"k1": public_jwk})
+    verified = VerifiedTokenCache()
+    assert validate_access_token(token, jwks, verified, identity_field="email") == (True, "user@example.com")
+    assert validate_access_token(token, jwks, verified, identity_field="email") == (True, "user@example.com")
+    assert jwks._client.get_jwk_set.call_count == 1
+
+
+def test_unknown_kid_is_rejected_without_fetching():
+    _, public_jwk = make_key("k1")
+    new_token, new_jwk = make_key("new")
+    jwks = jwks_serving({"k1": public_jwk})
+    jwks._last_attempt -= jwks.min_refresh_seconds
+    publish(jwks, "new", new_jwk)
+
+    assert validate_access_token(new_token, jwks, VerifiedTokenCache()) == (False, "Invalid")
+    assert jwks._client.get_jwk_set.call_count == 1 and jwks._wake.is_set()
+    # the refresh thread's next pass picks the key up
+    jwks.refresh()
+    assert validate_access_token(new_token, jwks, VerifiedTokenCache()) == (True, "OK")
+
+
+def test_refresh_requests_are_rate_limited():
+    _, public_jwk = make_key("k1")
+    stranger_token, _ = make_key("stranger")
+    jwks = jwks_serving({"k1": public_jwk})
+    assert validate_access_token(stranger_token, jwks, VerifiedTokenCache()) == (False, "Invalid")
+    assert not jwks._wake.is_set()
+
+
+def test_refresh_thread_fetches_new_keys_and_stops():
+    _, public_jwk = make_key("k1")
+    new_token, new_jwk = make_key("new")
+    jwks = jwks_serving({"k1": public_jwk})
+    jwks._last_attempt -= jwks.min_refresh_seconds
+    publish(jwks, "new", new_jwk)
+    thread = threading.Thread(target=jwks._run, daemon=True)
+    thread.start()
+
+    assert validate_access_token(new_token, jwks, VerifiedTokenCache())[0] is False
+    deadline = time.monotonic() + 5
+    while jwks._lookup("new") is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert validate_access_token(new_token, jwks, VerifiedTokenCache()) == (True, "OK")
+    jwks.close()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+
+
+def test_rotated_out_key_stays_valid_during_grace():
+    token, public_jwk = make_key("k1")
+    jwks = jwks_serving({"k1": public_jwk})
+    jwks._client.get_jwk_set.return_value.keys.clear()
+    jwks.refresh()
+    assert validate_access_token(token, jwks, VerifiedTokenCache())[0]
@@ -0,0 +1,74 @@
+import pytest
+
+from misc_shared.memory_cache import CachedMemory, MemoryCacheSettings
+from misc_shared.models import Example
+from misc_shared.storage import PrefixIndex, batch_create_resources, batch_get_resources
+
+
+@pytest.fixture
+def listed_bucket(s3_client, bucket):
+    for i in range(25):
+        s3_client.put_object(Bucket=bucket, Key=f"data/{i:03d}.txt", Body=b"x")
+    return s3_client
+
+
+def test_pages_follow_continuation_tokens(listed_bucket, bucket):
+    index = PrefixIndex(listed_bucket, page_size=10)
+    keys = [obj for n in range(3) for obj in index.get_page(bucket, "data/", n).objects]
+    assert len(keys) == 25
+    with pytest.raises(IndexError):
+        index.get_page(bucket, "data/", 3)
+
+
+def test_deep_page_is_built_iteratively_and_cached(listed_bucket, bucket, monkeypatch):
+    index = PrefixIndex(listed_bucket, page_size=1)
+    calls = []
+    list_objects = listed_bucket.list_objects_v2
+    monkeypatch.setattr(listed_bucket, "list_objects_v2", lambda **kw: calls.append(kw) or list_objects(**kw))
+
+    index.get_page(bucket, "data/", 20)
+    assert len(calls) == 21
+    index.get_page(bucket, "data/", 22)
+    assert len(calls) == 23
+
+    index.invalidate(bucket)
+    index.get_page(bucket, "data/", 0)
+    assert len(calls) == 24
+
+
+def test_cache_is_bounded(listed_bucket, bucket):
+    index = PrefixIndex(listed_bucket, page_size=1, max_pages=5)
+    index.get_page(bucket, "data/", 24)
+    assert len(index._pages[bucket]) == 5
+
+
+def test_batch_create_then_get_across_request_limits(memory):
+    created = batch_create_resources(memory, Example, [{"name": f"n{i}"} for i in range(130)], parallel=True)
+    ids = [x.resource_id for x in created] + ["missing"]
+
+    loaded = batch_get_resources(memory, Example, ids, parallel=True)
+    assert set(loaded) == set(ids[:-1])
+    assert loaded[created[7].resource_id].name == "n7"
+
+
+def test_batch_get_fills_and_uses_the_cache(memory):
+    cached = CachedMemory(memory, MemoryCacheSettings(ttl_seconds=60))
+    created = batch_create_resources(cached, Example, [{"name": "a"}, {"name": "b"}])
+    cached.invalidate(Example, created[0].resource_id)
+
+    batch_get_resources(cached, Example, [x.resource_id for x in created])
+    stats = cached.get_cache_stats()
+    assert cached.get_existing(created[0].resource_id, Example).name == "a"
+    assert cached.get_cache_stats().hits == stats.hits + 1
+
+
+def test_page_past_a_shrunk_listing_clamps_to_the_last_page(listed_bucket, bucket):
+    index = PrefixIndex(listed_bucket, page_size=10, ttl_seconds=0)
+    assert index.get_page(bucket, "data/", 2).page_number == 2
+    for i in range(10, 25):
+        listed_bucket.delete_object(Bucket=bucket, Key=f"data/{i:03d}.txt")
+
+    page = index.get_page(bucket, "data/", 2, clamp=True)
+    assert page.page_number == 0 and len(page.objects) == 10 and not page.has_next
+    with pytest.raises(IndexError):
+        index.get_page(bucket, "data/", 2)
@@ -0,0 +1,29 @@
+from misc_shared.models import Example
+from misc_shared.storage import batch_create_resources
+from misc_shared.table_query import iter_parallel_scan_pages, iter_table_pages
+
+
+def test_type_queries_use_the_index_and_page(memory):
+    batch_create_resources(memory, Example, [{"name": f"n{i}"} for i in range(12)])
+    pages = list(iter_table_pages(memory.dynamodb_table, type_name="Example", page_size=5))
+    assert [len(x) for x in pages] == [5, 5, 2]
+    assert {"pk", "sk", "gsitype", "updated_at"} >= set(pages[0][0])
+
+
+def test_parallel_scan_sees_every_item_once(memory):
+    created = batch_create_resources(memory, Example, [{"name": f"n{i}"} for i in range(40)])
+    scanned = [
+        item["pk"]
+        for page in iter_parallel_scan_pages(memory.dynamodb_table, total_segments=3, page_size=7, projection=["pk"])
+        for item in page
+    ]
+    # the table also holds simplesingletable's stats item
+    assert {x.to_dynamodb_item()["pk"] for x in created} <= set(scanned)
+    assert len(scanned) == len(set(scanned))
+
+
+def test_closing_a_scan_early_stops_it(memory):
+    batch_create_resources(memory, Example, [{"name": f"n{i}"} for i in range(40)])
+    pages = iter_parallel_scan_pages(memory.dynamodb_table, total_segments=2, page_size=5, max_buffered_pages=1)
+    assert next(pages)
+    pages.close()